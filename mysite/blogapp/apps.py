@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class BlogappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "blogapp"
+
+    def ready(self) -> None:
+        """Connect the signal receivers of the application."""
+        from . import signals  # noqa: F401
@@ -0,0 +1,18 @@
+"""
+Signal receivers of the application Blogapp.
+"""
+
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from mysite.cache import bump_model_version_on_commit
+
+from .models import Article
+
+
+@receiver(post_save, sender=Article)
+@receiver(post_delete, sender=Article)
+@receiver(m2m_changed, sender=Article.tags.through)
+def article_changed(sender, **kwargs) -> None:
+    """Invalidate the cached articles feed and sitemap."""
+    bump_model_version_on_commit(Article)
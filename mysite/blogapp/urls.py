@@ -1,5 +1,8 @@
 from django.urls import path
 
+from mysite.cache import cache_page_for, public_cache_control
+
+from .models import Article
 from .views import (
     ArticlesListView,
     ArticleDetailView,
@@ -14,7 +17,13 @@ from typing import List
 app_name: str = "blogapp"
 urlpatterns: List[path] = [
     path("articles/", ArticlesListView.as_view(), name="articles_list"),
-    path("articles/latest/feed", LatestArticlesFeed(), name="articles_feed"),
+    path(
+        "articles/latest/feed",
+        public_cache_control(60 * 5, stale_while_revalidate=60 * 10)(
+            cache_page_for(60 * 10, models=(Article,))(LatestArticlesFeed())
+        ),
+        name="articles_feed",
+    ),
     path(
         "article/<int:pk>/",
         ArticleDetailView.as_view(),
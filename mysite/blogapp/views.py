@@ -10,13 +10,16 @@ from django.views.generic import (
     DeleteView,
 )
 from django.urls import reverse_lazy, reverse
+from django.utils.decorators import method_decorator
 from django.contrib.syndication.views import Feed
+from mysite.cache import public_cache_control
 from .forms import ArticleForm
 from .models import Article, Tag
 
 from typing import Tuple
 
 
+@method_decorator(public_cache_control(60, stale_while_revalidate=60 * 5), name="get")
 class ArticlesListView(ListView):
     """View list all articles"""
 
@@ -1,3 +1,55 @@
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import translation
 
-# Create your tests here.
+from blogapp.models import Article, Author, Category, Tag
+from myauth.models import Profile
+from requestdataapp.query_budgets import QueryBudgetTestMixin
+
+
+class ListQueriesTestCase(QueryBudgetTestMixin, TestCase):
+    """
+    Test case checking that the API lists stay within their query budgets.
+    """
+
+    @classmethod
+    def setUpTestData(cls) -> None:
+        cls.user = User.objects.create_user(username="reader", password="secret")
+        category = Category.objects.create(
+            name_category="News", name_category_ru="Новости"
+        )
+        for number in range(6):
+            user = User.objects.create_user(
+                username="user{0}".format(number),
+                email="user{0}@example.com".format(number),
+            )
+            Profile.objects.create(user=user, sex="male")
+            author = Author.objects.create(
+                name_author="Author {0}".format(number),
+                name_author_ru="Автор {0}".format(number),
+            )
+            article = Article.objects.create(
+                title="Article {0}".format(number),
+                content="Content",
+                author=author,
+                category=category,
+            )
+            article.tags.add(
+                Tag.objects.create(
+                    name_tag="tag{0}".format(number),
+                    name_tag_ru="тег{0}".format(number),
+                )
+            )
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        self.client.force_login(self.user)
+
+    def test_profiles_list(self) -> None:
+        response = self.client.get(reverse("myapiapp:profiles"))
+        self.assertEqual(response.status_code, 200)
+
+    def test_articles_list(self) -> None:
+        response = self.client.get(reverse("myapiapp:article-list"))
+        self.assertEqual(response.status_code, 200)
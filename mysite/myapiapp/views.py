@@ -44,7 +44,7 @@ class GroupsListView(ListAPIView):
         BasicAuthentication,
         TokenAuthentication,
     ]
-    queryset = Group.objects.all()
+    queryset = Group.objects.prefetch_related("permissions")
     serializer_class = GroupSerializer
 
 
@@ -60,7 +60,9 @@ class UsersListView(ListAPIView):
 class ArticleListView(ListAPIView):
     """List of articles"""
 
-    queryset = Article.objects.all()
+    queryset = Article.objects.select_related("author", "category").prefetch_related(
+        "tags"
+    )
     serializer_class = ArticleSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
 
@@ -72,7 +74,6 @@ class ArticleCreateView(CreateAPIView):
     serializer_class = ArticleCreateSerializer
     permission_classes = [IsAuthenticated]
 
-
     def perform_create(self, serializer):
         author_name = self.request.user.username
         author = Author.objects.get_or_create(name_author=author_name)
@@ -82,6 +83,6 @@ class ArticleCreateView(CreateAPIView):
 class ProfilesListView(ListAPIView):
     """List of profiles"""
 
-    queryset = Profile.objects.all()
+    queryset = Profile.objects.select_related("user")
     serializer_class = ProfileSerializer
     permission_classes = [IsAuthenticated]
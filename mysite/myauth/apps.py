@@ -21,3 +21,7 @@ class MyauthConfig(AppConfig):
 
     default_auto_field: str = "django.db.models.BigAutoField"
     name: str = "myauth"
+
+    def ready(self) -> None:
+        """Connect the signal receivers of the application."""
+        from . import signals  # noqa: F401
@@ -0,0 +1,51 @@
+"""
+Authentication backend caching the permissions of the users.
+"""
+
+from typing import List, Optional, Set, Tuple
+
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from mysite.cache import get_tag_versions
+
+PERMISSIONS_KEY: str = "permissions:{pk}"
+PERMISSIONS_TIMEOUT: int = 60 * 60 * 24
+# Invalidates the permissions of every user, see ``myauth.signals``.
+ALL_PERMISSIONS_TAG: str = "permissions"
+USER_PERMISSIONS_TAG: str = "user:{pk}:permissions"
+
+
+def permission_tags(user_pk: int) -> List[str]:
+    """Return the cache tags of the permissions of a user."""
+    return [ALL_PERMISSIONS_TAG, USER_PERMISSIONS_TAG.format(pk=user_pk)]
+
+
+class CachedPermissionsBackend(ModelBackend):
+    """
+    ModelBackend keeping the resolved permissions of the users in the cache.
+
+    ``ModelBackend`` caches the permissions on the user object only, so
+    every request loads them again from the user and group permissions.
+    Here they are cached for a day with the versions of their tags, read
+    before the database: a set loaded while the permissions change carries
+    the old versions and is never served.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None) -> Set[str]:
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, "_perm_cache"):
+            key: str = PERMISSIONS_KEY.format(pk=user_obj.pk)
+            versions: List[int] = get_tag_versions(permission_tags(user_obj.pk))
+            entry: Optional[Tuple[List[int], List[str]]] = cache.get(key)
+            if entry is not None and entry[0] == versions:
+                user_obj._perm_cache = set(entry[1])
+            else:
+                user_obj._perm_cache = super().get_all_permissions(user_obj)
+                cache.set(
+                    key,
+                    (versions, sorted(user_obj._perm_cache)),
+                    PERMISSIONS_TIMEOUT,
+                )
+        return user_obj._perm_cache
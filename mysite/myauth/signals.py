@@ -0,0 +1,66 @@
+"""
+Signal receivers of the application Myauth.
+"""
+
+from typing import Iterable, Set
+
+from django.contrib.auth.models import Group, Permission, User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from mysite.cache import invalidate_tags_on_commit
+
+from .backends import ALL_PERMISSIONS_TAG, USER_PERMISSIONS_TAG
+
+
+def invalidate_user_permissions(user_pks: Iterable[int]) -> None:
+    """Invalidate the cached permissions of the users once the change commits."""
+    invalidate_tags_on_commit({USER_PERMISSIONS_TAG.format(pk=pk) for pk in user_pks})
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, **kwargs) -> None:
+    """Superusers and inactive users have other permissions."""
+    invalidate_user_permissions([instance.pk])
+
+
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+@receiver(post_delete, sender=Group)
+def permissions_changed(sender, **kwargs) -> None:
+    """Invalidate the cached permissions of all the users."""
+    invalidate_tags_on_commit([ALL_PERMISSIONS_TAG])
+
+
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=User.groups.through)
+def user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs) -> None:
+    """Invalidate the users whose permissions or groups have changed."""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        invalidate_user_permissions([instance.pk])
+    elif pk_set:
+        invalidate_user_permissions(pk_set)
+    else:
+        # The users of a cleared permission or group are unknown.
+        invalidate_tags_on_commit([ALL_PERMISSIONS_TAG])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def group_permissions_changed(
+    sender, instance, action, reverse, pk_set, **kwargs
+) -> None:
+    """Invalidate the users of the groups whose permissions have changed."""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        groups: Set[int] = {instance.pk}
+    elif pk_set:
+        groups = set(pk_set)
+    else:
+        invalidate_tags_on_commit([ALL_PERMISSIONS_TAG])
+        return
+    invalidate_user_permissions(
+        User.objects.filter(groups__in=groups).values_list("pk", flat=True)
+    )
@@ -2,9 +2,16 @@
 Module to test the module
 """
 
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
 from django.test import TestCase
 from django.urls import reverse
 from django.http import HttpResponse
+from typing import List
+
+from mysite.cache import get_tag_versions
+
+from .backends import PERMISSIONS_KEY, permission_tags
 
 
 class GetCookieTestCase(TestCase):
@@ -28,6 +35,22 @@ class GetCookieTestCase(TestCase):
         response: HttpResponse = self.client.get(reverse("myauth:cookie-get"))
         self.assertContains(response, "Cookie value")
 
+    def test_get_cookie_view_cached_per_cookie(self) -> None:
+        """
+        Test that the cached page varies on the cookie the view reads.
+
+        Asserts:
+            The same cookie gets the cached page, another one its own page.
+        """
+        cache.clear()
+        url: str = reverse("myauth:cookie-get")
+        self.client.cookies["fizz"] = "buzz"
+        first: bytes = self.client.get(url).content
+        self.assertIn(b'"buzz"', first)
+        self.assertEqual(self.client.get(url).content, first)
+        self.client.cookies["fizz"] = "other"
+        self.assertIn(b'"other"', self.client.get(url).content)
+
 
 class FooBarViewTest(TestCase):
     """
@@ -60,3 +83,67 @@ class FooBarViewTest(TestCase):
         expected_data: dict = {"foo": "bar", "spam": "eggs"}
 
         self.assertJSONEqual(response.content, expected_data)
+
+
+class CachedPermissionsBackendTestCase(TestCase):
+    """
+    Test case for the permissions cached by the authentication backend.
+
+    Each check uses a fresh user object, as every request does.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user: User = User.objects.create_user(username="buyer")
+        self.group: Group = Group.objects.create(name="managers")
+        self.add_product: Permission = Permission.objects.get(codename="add_product")
+        self.view_order: Permission = Permission.objects.get(codename="view_order")
+
+    def has_perm(self, perm: str) -> bool:
+        return User.objects.get(pk=self.user.pk).has_perm(perm)
+
+    def test_permissions_cached(self) -> None:
+        self.user.user_permissions.add(self.add_product)
+        self.assertTrue(self.has_perm("shopapp.add_product"))
+        user: User = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(user.has_perm("shopapp.add_product"))
+            self.assertFalse(user.has_perm("shopapp.view_order"))
+
+    def test_invalidated_by_changes(self) -> None:
+        self.assertFalse(self.has_perm("shopapp.add_product"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(self.add_product)
+        self.assertTrue(self.has_perm("shopapp.add_product"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.groups.add(self.group)
+        self.assertFalse(self.has_perm("shopapp.view_order"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.add(self.view_order)
+        self.assertTrue(self.has_perm("shopapp.view_order"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.user_set.remove(self.user)
+        self.assertFalse(self.has_perm("shopapp.view_order"))
+
+        self.user.is_superuser = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertTrue(self.has_perm("auth.delete_group"))
+
+    def test_invalidated_after_commit(self) -> None:
+        self.user.user_permissions.add(self.add_product)
+        self.assertTrue(self.has_perm("shopapp.add_product"))
+        versions: List[int] = get_tag_versions(permission_tags(self.user.pk))
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.user.user_permissions.remove(self.add_product)
+            self.assertEqual(get_tag_versions(permission_tags(self.user.pk)), versions)
+            # A concurrent request still reads the permissions before the commit.
+            cache.set(
+                PERMISSIONS_KEY.format(pk=self.user.pk),
+                (versions, ["shopapp.add_product"]),
+                None,
+            )
+        self.assertEqual(len(callbacks), 1)
+        self.assertFalse(self.has_perm("shopapp.add_product"))
@@ -22,7 +22,8 @@ from django.views import View
 from django.utils.translation import gettext_lazy as _, ngettext
 from django.db.models import Model
 from django.forms.models import ModelForm
-from django.views.decorators.cache import cache_page
+
+from mysite.cache import cache_page_for
 
 from typing import List, Any
 from random import random
@@ -94,7 +95,7 @@ class ProfileListView(ListView):
 
     template_name: str = "myauth/profile-list.html"
     context_object_name: str = "profiles"
-    queryset: List[Model] = Profile.objects.all()
+    queryset: List[Model] = Profile.objects.select_related("user")
 
 
 class ProfileDetailsView(DetailView):
@@ -286,7 +287,7 @@ def set_cookie_view(request: HttpRequest) -> HttpResponse:
     return response
 
 
-@cache_page(60 * 2)
+@cache_page_for(60 * 2, cookies=("fizz",))
 def get_cookie_view(request: HttpRequest) -> HttpResponse:
     value: request.COOKIES = request.COOKIES.get("fizz", "default value")
     return HttpResponse(
@@ -0,0 +1,452 @@
+"""
+Cache helpers shared by the applications of the project.
+"""
+
+import random
+from functools import wraps
+from hashlib import md5
+from math import log
+from time import monotonic, sleep, time, time_ns
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Model
+from django.http import HttpRequest, HttpResponse
+from django.utils.cache import cc_delim_re, patch_cache_control, patch_vary_headers
+from django.utils.translation import get_language
+from django.utils.module_loading import import_string
+from django_redis.cache import RedisCache
+from redis import Redis
+
+MODEL_VERSION_KEY: str = "model_version:{label}"
+COMPUTED_KEY: str = "computed:{key}"
+COMPUTE_LOCK_KEY: str = "compute_lock:{key}"
+CACHE_TAG_KEY: str = "cache_tag:{tag}"
+PAGE_KEY: str = "page:{digest}"
+# Time between two lookups while another worker computes a missing value.
+COMPUTE_POLL_INTERVAL: float = 0.05
+
+
+def get_model_version(model: Type[Model]) -> int:
+    """
+    Return the content version of a model.
+
+    The version changes every time an instance of the model is saved or
+    deleted (see ``bump_model_version``), so it can be part of cache keys
+    of payloads built from the whole table.
+
+    Args:
+        model (Type[Model]): The model class.
+
+    Returns:
+        int: An opaque, never reused version number.
+    """
+    return cache.get_or_set(
+        MODEL_VERSION_KEY.format(label=model._meta.label_lower), time_ns, None
+    )
+
+
+def bump_model_version(model: Type[Model]) -> None:
+    """
+    Invalidate every cache entry keyed by the content version of a model.
+
+    The version is a timestamp rather than a counter, so an evicted version
+    key never brings an old version back.
+    """
+    cache.set(MODEL_VERSION_KEY.format(label=model._meta.label_lower), time_ns(), None)
+
+
+def bump_model_version_on_commit(model: Type[Model]) -> None:
+    """
+    Bump the version of a model once the current transaction commits.
+
+    A request running between an earlier bump and the commit would cache
+    the old rows under the new version. Outside a transaction the version
+    is bumped at once.
+    """
+    transaction.on_commit(lambda: bump_model_version(model))
+
+
+def instance_tag(instance: Model) -> str:
+    """Return the cache tag of a model instance, e.g. ``product:12``."""
+    return "{model}:{pk}".format(model=instance._meta.model_name, pk=instance.pk)
+
+
+def get_tag_versions(tags: List[str]) -> List[int]:
+    """
+    Return the versions of cache tags, in the order of the tags.
+
+    Entries whose keys contain the versions of their tags are invalidated
+    all at once by ``invalidate_tags()``, whatever their number. Missing
+    versions are created with ``add()``, so concurrent workers agree on
+    them.
+
+    Args:
+        tags (List[str]): The tags, e.g. ``["order:3", "product:12"]``.
+
+    Returns:
+        List[int]: Opaque, never reused version numbers.
+    """
+    keys: List[str] = [CACHE_TAG_KEY.format(tag=tag) for tag in tags]
+    versions: Dict[str, int] = cache.get_many(keys)
+    missing: List[str] = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, time_ns(), None)
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, 0) for key in keys]
+
+
+def invalidate_tags(tags: Iterable[str]) -> None:
+    """Invalidate every cache entry keyed by the versions of the tags."""
+    version: int = time_ns()
+    cache.set_many({CACHE_TAG_KEY.format(tag=tag): version for tag in tags}, None)
+
+
+def invalidate_tags_on_commit(tags: Iterable[str]) -> None:
+    """
+    Invalidate the tags once the current transaction commits.
+
+    A request running between an earlier invalidation and the commit would
+    read the old rows and cache them under the new versions. Outside a
+    transaction the tags are invalidated at once.
+    """
+    tags = list(tags)
+    transaction.on_commit(lambda: invalidate_tags(tags))
+
+
+def uses_redis_cache() -> bool:
+    """Return True if the default cache is stored in Redis."""
+    return issubclass(import_string(settings.CACHES["default"]["BACKEND"]), RedisCache)
+
+
+def get_redis_client(timeout: float) -> Optional[Redis]:
+    """
+    Create a Redis client of the server of the default cache.
+
+    The client has its own short socket timeouts, so the features built on
+    it can give up quickly instead of waiting for the timeouts of the cache.
+
+    Args:
+        timeout (float): Connect and read timeout in seconds.
+
+    Returns:
+        Optional[Redis]: The client, None if the default cache is not Redis.
+    """
+    if not uses_redis_cache():
+        return None
+    location = settings.CACHES["default"]["LOCATION"]
+    if isinstance(location, (list, tuple)):
+        location = location[0]
+    return Redis.from_url(
+        location, socket_timeout=timeout, socket_connect_timeout=timeout
+    )
+
+
+def get_or_compute(
+    key: str,
+    compute: Callable[[], Any],
+    timeout: float,
+    stale_timeout: Optional[float] = None,
+    lock_timeout: float = 30,
+    wait: float = 5.0,
+    beta: float = 1.0,
+) -> Any:
+    """
+    Return a cached value, computing it in a single worker when it expires.
+
+    Protects expensive values from cache stampedes:
+
+    - probabilistic early expiration: a request may recompute the value
+      shortly before it expires, the closer to the expiry and the longer
+      the computation the more likely, so the value is usually renewed
+      before the other requests see it expire;
+    - single flight: only the request holding a short-lived lock computes,
+      the others get the stale value meanwhile, which is kept
+      ``stale_timeout`` seconds after its expiry;
+    - without any value to serve, the other requests wait up to ``wait``
+      seconds for the value, then compute it themselves.
+
+    Args:
+        key (str): Cache key of the value.
+        compute (Callable[[], Any]): Computes the value, must be picklable.
+        timeout (float): Seconds the value is fresh.
+        stale_timeout (Optional[float]): Seconds the value may be served
+            after its expiry while it is recomputed. Defaults to ``timeout``.
+        lock_timeout (float, optional): Expiry of the lock, in case the
+            computing worker dies. Defaults to 30.
+        wait (float, optional): Maximum wait for a missing value computed by
+            another request. Defaults to 5.0.
+        beta (float, optional): Eagerness of the early expiration, 0 to
+            disable it. Defaults to 1.0.
+
+    Returns:
+        Any: The cached or computed value.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    cache_key: str = COMPUTED_KEY.format(key=key)
+    lock_key: str = COMPUTE_LOCK_KEY.format(key=key)
+
+    def recompute() -> Any:
+        started_at: float = monotonic()
+        try:
+            value: Any = compute()
+            duration: float = monotonic() - started_at
+            entry: Tuple[Any, float, float] = (value, time() + timeout, duration)
+            cache.set(cache_key, entry, timeout + stale_timeout)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    entry: Optional[Tuple[Any, float, float]] = cache.get(cache_key)
+    if entry is not None:
+        value, expires_at, duration = entry
+        # XFetch: -log(u) follows an exponential distribution.
+        if time() - duration * beta * log(1.0 - random.random()) < expires_at:
+            return value
+        if not cache.add(lock_key, True, lock_timeout):
+            return value
+        return recompute()
+
+    if cache.add(lock_key, True, lock_timeout):
+        return recompute()
+    deadline: float = monotonic() + wait
+    while monotonic() < deadline:
+        sleep(COMPUTE_POLL_INTERVAL)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry[0]
+    return compute()
+
+
+def permissions_fingerprint(user) -> str:
+    """
+    Return the part of the page cache keys identifying what a user may see.
+
+    Users with the same permissions and staff status share their cached
+    pages, anonymous users share theirs.
+    """
+    if not user.is_authenticated:
+        return "anonymous"
+    return md5(
+        "{staff}|{permissions}".format(
+            staff=user.is_staff,
+            permissions=",".join(sorted(user.get_all_permissions())),
+        ).encode()
+    ).hexdigest()
+
+
+def page_cache_key(
+    request: HttpRequest,
+    models: Sequence[Type[Model]],
+    cookies: Sequence[str],
+    headers: Sequence[str],
+) -> str:
+    """Return the cache key of the page requested, see ``cache_page_for()``."""
+    parts: List[Any] = [
+        request.method,
+        request.build_absolute_uri(),
+        get_language(),
+        permissions_fingerprint(request.user),
+    ]
+    parts.extend(
+        "{name}={value}".format(name=name, value=request.COOKIES.get(name))
+        for name in cookies
+    )
+    parts.extend(
+        request.META.get("HTTP_" + header.upper().replace("-", "_"), "")
+        for header in headers
+    )
+    parts.extend(get_model_version(model) for model in models)
+    return PAGE_KEY.format(
+        digest=md5("|".join(str(part) for part in parts).encode()).hexdigest()
+    )
+
+
+def is_page_cacheable(
+    request: HttpRequest,
+    response: HttpResponse,
+    headers: Sequence[str],
+    media_types: Optional[Sequence[str]],
+) -> bool:
+    """
+    Return True if the response can be served to the requests of the same key.
+
+    Responses setting cookies, private ones, those embedding a CSRF token,
+    those varying on a header missing from the key and those of another
+    media type than the given ones are not.
+    """
+    if response.status_code != 200 or response.streaming or response.cookies:
+        return False
+    media_type: str = response.get("Content-Type", "").split(";")[0].strip()
+    if media_types is not None and media_type not in media_types:
+        return False
+    if request.META.get("CSRF_COOKIE_NEEDS_UPDATE"):
+        return False
+    cache_control: str = response.get("Cache-Control", "").lower()
+    if "private" in cache_control or "no-store" in cache_control:
+        return False
+    covered = {header.lower() for header in headers} | {"accept-language"}
+    return all(
+        header.lower() in covered
+        for header in cc_delim_re.split(response.get("Vary", ""))
+        if header
+    )
+
+
+def cache_page_for(
+    timeout: float,
+    models: Sequence[Type[Model]] = (),
+    cookies: Sequence[str] = (),
+    headers: Sequence[str] = ("Accept",),
+    media_types: Optional[Sequence[str]] = None,
+) -> Callable:
+    """
+    Cache the GET and HEAD responses of a view per audience.
+
+    Unlike ``cache_page``, the key varies on the language, on anonymous
+    versus authenticated users and then on their permissions (see
+    ``permissions_fingerprint()``), on the chosen cookies and headers, and
+    on the content versions of the models the page is built from, so saving
+    an instance invalidates the pages at once. Decorate the handler rather
+    than ``dispatch``, so the access checks still run on every request:
+
+        @method_decorator(cache_page_for(60 * 10, models=(Product,)), name="get")
+        class ProductsListView(PermissionRequiredMixin, ListView):
+
+    Args:
+        timeout (float): Time in seconds the pages are cached.
+        models (Sequence[Type[Model]]): Models whose changes invalidate the
+            pages.
+        cookies (Sequence[str]): Names of the cookies read by the view.
+        headers (Sequence[str]): Request headers the response varies on.
+            Defaults to Accept, negotiated by the API views.
+        media_types (Optional[Sequence[str]]): Media types of the cached
+            responses, all if None. Pages showing the user, such as the
+            browsable API, must be left out.
+
+    Returns:
+        Callable: The view decorator.
+    """
+
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            key: str = page_cache_key(request, models, cookies, headers)
+            page: Optional[Tuple[int, List[Tuple[str, str]], bytes]] = cache.get(key)
+            if page is not None:
+                status, page_headers, content = page
+                response = HttpResponse(content, status=status)
+                for header, value in page_headers:
+                    response[header] = value
+                return response
+
+            def store(response: HttpResponse) -> None:
+                if is_page_cacheable(request, response, headers, media_types):
+                    cache.set(
+                        key,
+                        (
+                            response.status_code,
+                            list(response.items()),
+                            response.content,
+                        ),
+                        timeout,
+                    )
+
+            response = view(request, *args, **kwargs)
+            # Template and API responses are only rendered after the view.
+            if callable(getattr(response, "render", None)) and not getattr(
+                response, "is_rendered", True
+            ):
+                response.add_post_render_callback(store)
+            else:
+                store(response)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def is_public_response(request: HttpRequest, response: HttpResponse) -> bool:
+    """Return True if the response to the request may be stored by shared caches."""
+    if request.method not in ("GET", "HEAD") or response.status_code != 200:
+        return False
+    if request.user.is_authenticated or response.cookies:
+        return False
+    if request.META.get("CSRF_COOKIE_NEEDS_UPDATE"):
+        return False
+    cache_control: str = response.get("Cache-Control", "").lower()
+    return not any(
+        directive in cache_control for directive in ("private", "no-store", "no-cache")
+    )
+
+
+def public_cache_control(
+    max_age: int,
+    stale_while_revalidate: int = 0,
+    vary: Sequence[str] = ("Accept-Language", "Cookie"),
+) -> Callable:
+    """
+    Let shared caches and browsers store the anonymous responses of a view.
+
+    Anonymous responses get ``Cache-Control: public`` with the max-age and
+    stale-while-revalidate, the others ``private``; all of them vary on the
+    given headers, so an edge cache keeps the responses to requests with a
+    session cookie apart. Put it outside ``cache_page_for()``, whose stored
+    pages are then served with the headers of each request.
+
+    Args:
+        max_age (int): Time in seconds the responses are fresh.
+        stale_while_revalidate (int): Time in seconds a stale response may
+            be served while it is fetched again in the background.
+        vary (Sequence[str]): Request headers the responses vary on. Add
+            Authorization for the API views.
+
+    Returns:
+        Callable: The view decorator.
+    """
+
+    def decorator(view: Callable) -> Callable:
+        @wraps(view)
+        def wrapper(request: HttpRequest, *args, **kwargs) -> HttpResponse:
+            response = view(request, *args, **kwargs)
+
+            def patch(response: HttpResponse) -> None:
+                if is_public_response(request, response):
+                    patch_cache_control(
+                        response,
+                        public=True,
+                        max_age=max_age,
+                        stale_while_revalidate=stale_while_revalidate,
+                    )
+                else:
+                    patch_cache_control(response, private=True)
+                patch_vary_headers(response, vary)
+
+            if callable(getattr(response, "render", None)) and not getattr(
+                response, "is_rendered", True
+            ):
+                response.add_post_render_callback(patch)
+            else:
+                patch(response)
+            return response
+
+        return wrapper
+
+    return decorator
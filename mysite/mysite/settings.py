@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/5.0/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
+
 import os
 from os import getenv
 import logging.config
@@ -85,6 +86,10 @@ INSTALLED_APPS = [
 ]
 
 
+# The permissions of the users are cached, see myauth.signals for their
+# invalidation.
+AUTHENTICATION_BACKENDS = ["myauth.backends.CachedPermissionsBackend"]
+
 MIDDLEWARE = [
     # "django.middleware.cache.UpdateCacheMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -97,9 +102,11 @@ MIDDLEWARE = [
     "django.contrib.admindocs.middleware.XViewMiddleware",
     "requestdataapp.middlewares.set_useragent_on_request_middleware",
     "requestdataapp.middlewares.CountRequestsMiddleware",
+    "requestdataapp.middlewares.QueryBudgetMiddleware",
+    "requestdataapp.middlewares.ServerTimingMiddleware",
     "requestdataapp.middlewares.ThrottlingMiddleware",
+    "requestdataapp.middlewares.ProfilingMiddleware",
     "django.middleware.locale.LocaleMiddleware",
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
     # "django.middleware.cache.FetchFromCacheMiddleware",
 ]
 if DEBUG:
@@ -110,7 +117,7 @@ ROOT_URLCONF = "mysite.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        "BACKEND": "requestdataapp.instrumentation.InstrumentedDjangoTemplates",
         "DIRS": [],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -138,13 +145,13 @@ WSGI_APPLICATION = "mysite.wsgi.application"
 # }
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': os.environ.get('DB_NAME'),
-        'USER': os.environ.get('DB_USER'),
-        'PASSWORD': os.environ.get('DB_PASS'),
-        'HOST': os.environ.get('DB_HOST'),
-        'PORT': os.environ.get('DB_PORT'),
+    "default": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("DB_NAME"),
+        "USER": os.environ.get("DB_USER"),
+        "PASSWORD": os.environ.get("DB_PASS"),
+        "HOST": os.environ.get("DB_HOST"),
+        "PORT": os.environ.get("DB_PORT"),
     }
 }
 
@@ -156,10 +163,51 @@ DATABASES = {
 # }
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        # RedisCache with a small in-process tier in front of it, recording
+        # its hits and misses in the request metrics. The values read are
+        # kept decoded in every worker for LOCAL_CACHE["TIMEOUT"] seconds at
+        # most, writes and deletes evict them from all the workers.
+        # ENCODINGS sets the serializer and the compression threshold by key
+        # prefix; the exports only feed JsonResponse, so they are stored as
+        # JSON, and the export artifacts are already gzipped.
+        # A stalled Redis times out quickly, and after FAILURE_THRESHOLD
+        # consecutive failures the worker uses a local in-memory cache for
+        # RESET_TIMEOUT seconds before probing Redis again, see
+        # requestdataapp.circuit_breaker.
+        "BACKEND": "requestdataapp.instrumentation.InstrumentedCircuitBreakerRedisCache",
         "LOCATION": "redis://redis:6379/1",
         "OPTIONS": {
-            "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            "SOCKET_CONNECT_TIMEOUT": 0.1,
+            "SOCKET_TIMEOUT": 0.25,
+            "CIRCUIT_BREAKER": {
+                "FAILURE_THRESHOLD": 3,
+                "RESET_TIMEOUT": 5,
+                "FALLBACK_TIMEOUT": 30,
+                "FALLBACK_MAX_ENTRIES": 1000,
+            },
+            "CLIENT_CLASS": "requestdataapp.cache_encoding.EncodingClient",
+            "ENCODINGS": {
+                "default": {"SERIALIZER": "pickle", "COMPRESS_MIN_BYTES": 64 * 1024},
+                "computed:products_data_export": {
+                    "SERIALIZER": "json",
+                    "COMPRESS_MIN_BYTES": 1024,
+                },
+                "computed:user_": {"SERIALIZER": "json", "COMPRESS_MIN_BYTES": 1024},
+                "computed:products_list:": {
+                    "SERIALIZER": "pickle",
+                    "COMPRESS_MIN_BYTES": 1024,
+                },
+                "export_artifact:": {
+                    "SERIALIZER": "pickle",
+                    "COMPRESS_MIN_BYTES": None,
+                },
+            },
+            "LOCAL_CACHE": {
+                "TIMEOUT": 5,
+                "MAX_ENTRIES": 1000,
+                "MAX_BYTES": 32 * 1024 * 1024,
+                "MAX_ENTRY_BYTES": 1024 * 1024,
+            },
         },
     }
 }
@@ -167,6 +215,76 @@ CACHES = {
 
 CACHE_MIDDLEWARE_SECONDS = 30  # так данные сохраняются в кэш на 30 секунд
 
+# Request logs of CountRequestsMiddleware, written as JSON lines by a
+# background thread when ENQUEUE is set. SAMPLE_RATES is the share of the
+# requests logged by URL name, URL namespace ("<namespace>:*") or "default";
+# failed requests are always logged. Requests taking SLOW_REQUEST_SECONDS or
+# more are logged as "slow_request" events with their database and cache usage.
+REQUEST_LOGGING = {
+    "ENQUEUE": True,
+    "SLOW_REQUEST_SECONDS": float(getenv("DJANGO_SLOW_REQUEST_SECONDS", "1.0")),
+    "SAMPLE_RATES": {
+        "default": 0.1,
+        "admin:*": 1.0,
+        "requestdataapp:*": 1.0,
+        "metrics": 0.0,
+    },
+}
+
+# Addresses allowed to read the Prometheus metrics at /metrics, besides staff.
+# DJANGO_METRICS_ALLOWED_IPS is a comma-separated list, docker-compose sets it
+# to the fixed address of the prometheus service on the metrics network.
+METRICS_ALLOWED_IPS = ["127.0.0.1"] + getenv("DJANGO_METRICS_ALLOWED_IPS", "").split(
+    ","
+)
+
+# Checks of QueryBudgetMiddleware: FILE maps URL names to their maximum number
+# of queries per request, a query shape executed REPEATED_QUERIES times in a
+# request is an N+1 query. The violations are logged, or raised if RAISE is set.
+QUERY_BUDGETS = {
+    "FILE": BASE_DIR / "query_budgets.json",
+    "REPEATED_QUERIES": 5,
+    "RAISE": False,
+}
+
+# Add the Server-Timing header (database, cache, view, template and DRF
+# render times) to the responses, see ServerTimingMiddleware.
+SERVER_TIMING = DEBUG or getenv("DJANGO_SERVER_TIMING", "0") == "1"
+
+# Rate limits of ThrottlingMiddleware: "<requests>/<period>", the period being
+# s, m, h or d with an optional count ("30/40s"), None for no limit. The first
+# policy matching the URL name or the path (without the language prefix)
+# applies, the tiers missing from a policy take the default rates.
+THROTTLING = {
+    "DEFAULT_RATES": {
+        "anonymous": "30/40s",
+        "authenticated": "120/m",
+        "token": "300/m",
+        "staff": None,
+    },
+    "POLICIES": [
+        {
+            "name": "auth",
+            "path_prefixes": ["/accounts/login/", "/api/token/", "/api/auth/"],
+            "rates": {"anonymous": "10/m", "token": "10/m"},
+        },
+        {
+            "name": "exports",
+            "url_names": [
+                "shopapp:products-export",
+                "shopapp:orders-export",
+                "shopapp:user_orders_list_export",
+            ],
+            "rates": {"anonymous": "5/m", "authenticated": "20/m", "token": "20/m"},
+        },
+        {
+            "name": "api",
+            "path_prefixes": ["/api/", "/shop/api/"],
+            "rates": {"anonymous": "60/m", "token": "600/m"},
+        },
+    ],
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -226,6 +344,10 @@ LOGIN_REDIRECT_URL = reverse_lazy("myauth:about-me")
 LOGIN_URL = reverse_lazy("myauth:login")
 
 REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "requestdataapp.instrumentation.InstrumentedJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.PageNumberPagination",
     "PAGE_SIZE": 5,
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend"],
@@ -22,7 +22,10 @@ from django.contrib import admin
 from django.urls import path, include
 from django.contrib.sitemaps.views import sitemap
 
+from blogapp.models import Article
+from .cache import cache_page_for, public_cache_control
 from .sitemaps import sitemaps
+from requestdataapp.views import metrics_view
 
 from drf_spectacular.views import (
     SpectacularAPIView,
@@ -62,12 +65,17 @@ urlpatterns = i18n_patterns(
     path("api/token/verify/", TokenVerifyView.as_view(), name="token_verify"),
     path(
         "sitemap.xml",
-        sitemap,
+        public_cache_control(60 * 60, stale_while_revalidate=60 * 60 * 24)(
+            cache_page_for(60 * 60, models=(Article,))(sitemap)
+        ),
         {"sitemaps": sitemaps},
         name="django.contrib.sitemaps.views.sitemap",
     ),
 )
 
+# Scraped by Prometheus, outside of the language prefixes.
+urlpatterns.append(path("metrics", metrics_view, name="metrics"))
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
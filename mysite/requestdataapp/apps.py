@@ -15,3 +15,9 @@ class RequestdataappConfig(AppConfig):
 
     default_auto_field = "django.db.models.BigAutoField"
     name = "requestdataapp"
+
+    def ready(self) -> None:
+        """Send the loguru records to the queued JSON sink."""
+        from .request_logging import configure_logging
+
+        configure_logging()
@@ -0,0 +1,99 @@
+"""
+Circuit breaker of the features depending on Redis.
+
+It has no dependency on the rest of the application, so both the cache
+backends of ``requestdataapp.circuit_breaker`` and the metrics registry can
+use it.
+"""
+
+from threading import Lock
+from time import monotonic
+from typing import Callable, Optional
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker counting consecutive failures.
+
+    The circuit is "closed" while the operations succeed, "open" for
+    ``reset_timeout`` seconds after ``failure_threshold`` consecutive
+    failures, then "half-open": a single operation is allowed to probe the
+    service, the others are refused until it succeeds or fails.
+    """
+
+    CLOSED: str = "closed"
+    OPEN: str = "open"
+    HALF_OPEN: str = "half-open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        reset_timeout: float = 5.0,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        """
+        Initialize the circuit breaker, closed.
+
+        Args:
+            failure_threshold (int, optional): Consecutive failures opening
+                the circuit. Defaults to 3.
+            reset_timeout (float, optional): Seconds the circuit stays open
+                before a probe. Defaults to 5.0.
+            clock (Callable[[], float], optional): Source of the time.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures: int = 0
+        self.opened_at: Optional[float] = None
+        self.probing: bool = False
+        self.lock = Lock()
+
+    @property
+    def state(self) -> str:
+        """Return "closed", "open" or "half-open"."""
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() < self.opened_at + self.reset_timeout:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def allow(self) -> bool:
+        """Return True if an operation may use the service (the probe if half-open)."""
+        with self.lock:
+            state: str = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.OPEN or self.probing:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self) -> bool:
+        """
+        Record a successful operation.
+
+        Returns:
+            bool: True if it closed the circuit.
+        """
+        with self.lock:
+            closed: bool = self.opened_at is not None
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+            return closed
+
+    def record_failure(self) -> bool:
+        """
+        Record a failed operation.
+
+        Returns:
+            bool: True if it opened the circuit, or kept it open after a probe.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+                self.probing = False
+                return True
+            return False
@@ -0,0 +1,189 @@
+"""
+Per-prefix serialization and compression of the Redis cache entries.
+
+The ``ENCODINGS`` cache option maps key prefixes to their serializer
+(``"pickle"``, protocol 5, or ``"json"``) and to the size from which their
+entries are compressed with zlib, ``None`` to never compress them. The
+longest matching prefix applies, ``"default"`` to the other keys:
+
+    "ENCODINGS": {
+        "default": {"SERIALIZER": "pickle", "COMPRESS_MIN_BYTES": 64 * 1024},
+        "computed:products_data_export": {
+            "SERIALIZER": "json",
+            "COMPRESS_MIN_BYTES": 1024,
+        },
+    }
+
+Every entry starts with a byte telling how it was encoded, so the settings
+can change while entries are cached; entries without it are plain pickles
+written by the default django_redis client. The serialized and stored
+sizes of the entries are recorded in the metrics by prefix.
+"""
+
+import json
+import pickle
+import zlib
+from contextvars import ContextVar
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django_redis.client import DefaultClient
+from loguru import logger as log
+
+from .cache_stats import key_namespace
+from .metrics import registry
+
+PICKLE_PROTOCOL: int = 5
+COMPRESS_LEVEL: int = 1
+# First byte of the entries: the serializer, ORed with COMPRESSED.
+SERIALIZER_IDS: Dict[str, int] = {"pickle": 0x01, "json": 0x02}
+COMPRESSED: int = 0x10
+SIZE_BUCKETS: Tuple[float, ...] = (
+    1024.0,
+    16 * 1024.0,
+    128 * 1024.0,
+    1024 * 1024.0,
+    8 * 1024 * 1024.0,
+)
+
+# Key of the entry being encoded, the encoding depends on it.
+_encoded_key: ContextVar[Optional[str]] = ContextVar("encoded_key", default=None)
+
+
+def serialize(value: Any, serializer: str) -> bytes:
+    """Serialize a value with "pickle" or "json"."""
+    if serializer == "json":
+        return json.dumps(value, cls=DjangoJSONEncoder, separators=(",", ":")).encode()
+    return pickle.dumps(value, protocol=PICKLE_PROTOCOL)
+
+
+def encode_entry(
+    value: Any, serializer: str, compress_min_bytes: Optional[int]
+) -> Tuple[bytes, int]:
+    """
+    Encode a cache entry.
+
+    Args:
+        value (Any): The cached value.
+        serializer (str): "pickle" or "json", values that cannot be
+            serialized to JSON are pickled.
+        compress_min_bytes (Optional[int]): Serialized size from which the
+            entry is compressed, None to never compress it.
+
+    Returns:
+        Tuple[bytes, int]: The entry and the size of the serialized value.
+    """
+    try:
+        data: bytes = serialize(value, serializer)
+    except TypeError as error:
+        log.warning("Cache entry pickled, not JSON: {error}", error=error)
+        serializer = "pickle"
+        data = serialize(value, serializer)
+    header: int = SERIALIZER_IDS[serializer]
+    serialized_size: int = len(data)
+    if compress_min_bytes is not None and serialized_size >= compress_min_bytes:
+        data = zlib.compress(data, COMPRESS_LEVEL)
+        header |= COMPRESSED
+    return bytes((header,)) + data, serialized_size
+
+
+def decode_entry(entry: bytes) -> Any:
+    """
+    Decode an entry of ``encode_entry()``.
+
+    Raises:
+        ValueError: If the entry has no known header.
+    """
+    header: int = entry[0]
+    serializer: int = header & ~COMPRESSED
+    if serializer not in SERIALIZER_IDS.values():
+        raise ValueError("Unknown cache entry header {0:#x}".format(header))
+    data: bytes = entry[1:]
+    if header & COMPRESSED:
+        data = zlib.decompress(data)
+    if serializer == SERIALIZER_IDS["json"]:
+        return json.loads(data)
+    return pickle.loads(data)
+
+
+class EncodingClient(DefaultClient):
+    """
+    django_redis client choosing the encoding of the entries by key prefix.
+
+    Integers are still stored as such, so ``incr()`` keeps working.
+    """
+
+    def __init__(self, server, params: Dict[str, Any], backend) -> None:
+        super().__init__(server, params, backend)
+        encodings: Dict[str, Dict[str, Any]] = dict(self._options.get("ENCODINGS", {}))
+        default: Dict[str, Any] = encodings.pop("default", {})
+        # Longest prefixes first, the first match is the most specific.
+        self.encodings: List[Tuple[str, str, Optional[int]]] = []
+        for prefix, encoding in sorted(
+            encodings.items(), key=lambda item: len(item[0]), reverse=True
+        ):
+            self.encodings.append((prefix, *self.parse_encoding(prefix, encoding)))
+        self.default_encoding: Tuple[str, Optional[int]] = self.parse_encoding(
+            "default", default
+        )
+
+    @staticmethod
+    def parse_encoding(
+        prefix: str, encoding: Dict[str, Any]
+    ) -> Tuple[str, Optional[int]]:
+        """Return the serializer and the compression threshold of a prefix."""
+        serializer: str = encoding.get("SERIALIZER", "pickle")
+        if serializer not in SERIALIZER_IDS:
+            raise ImproperlyConfigured(
+                "Unknown cache serializer {serializer!r} for {prefix!r}".format(
+                    serializer=serializer, prefix=prefix
+                )
+            )
+        return serializer, encoding.get("COMPRESS_MIN_BYTES")
+
+    def get_encoding(self, key: Optional[str]) -> Tuple[str, str, Optional[int]]:
+        """Return the prefix, the serializer and the compression threshold of a key."""
+        if key is not None:
+            for prefix, serializer, compress_min_bytes in self.encodings:
+                if key.startswith(prefix):
+                    return prefix, serializer, compress_min_bytes
+        return ("default", *self.default_encoding)
+
+    def set(self, key: Any, value: Any, *args, **kwargs) -> bool:
+        token = _encoded_key.set(str(key))
+        try:
+            return super().set(key, value, *args, **kwargs)
+        finally:
+            _encoded_key.reset(token)
+
+    def encode(self, value: Any, *args, allow_int: bool = True, **kwargs) -> Any:
+        if allow_int and isinstance(value, int) and not isinstance(value, (bool, Enum)):
+            return value
+        key: Optional[str] = _encoded_key.get()
+        prefix, serializer, compress_min_bytes = self.get_encoding(key)
+        entry, serialized_size = encode_entry(value, serializer, compress_min_bytes)
+        labels: Dict[str, str] = {"prefix": prefix}
+        registry.inc("django_cache_serialized_bytes_total", serialized_size, labels)
+        registry.observe(
+            "django_cache_entry_size_bytes", len(entry), labels, buckets=SIZE_BUCKETS
+        )
+        if key is not None:
+            registry.inc(
+                "django_cache_namespace_bytes_total",
+                len(entry),
+                {"namespace": key_namespace(key)},
+            )
+        return entry
+
+    def decode(self, value: Any) -> Any:
+        try:
+            return int(value)
+        except (ValueError, TypeError):
+            pass
+        try:
+            return decode_entry(value)
+        except ValueError:
+            # Written by the default client, before the encodings were set up.
+            return super().decode(value)
@@ -0,0 +1,133 @@
+"""
+Cache usage by key namespace.
+
+The instrumented cache backends record their lookups, writes, deletions and
+time by namespace in the metrics, and ``EncodingClient`` the size of the
+entries written. The namespace of a key is its first segment, with the
+numbers replaced by ``*``:
+
+- ``computed:<name>`` for the values of ``get_or_compute()``, e.g.
+  ``computed:user_*_orders_data_export``;
+- ``fragment:<name>`` for the template fragments, e.g. ``fragment:order_info``;
+- ``page``, ``cache_tag``, ``permissions``, ``model_version``... otherwise.
+"""
+
+import re
+from typing import Any, Collection, Dict, List, Optional, Pattern
+
+from .metrics import parse_series, registry
+
+NUMBER: Pattern = re.compile(r"\d+")
+FRAGMENT_PREFIX: str = "template.cache."
+SERIES_PREFIX: str = "django_cache_namespace_"
+
+
+def key_namespace(key: Any) -> str:
+    """Return the namespace of a cache key."""
+    key = str(key)
+    if key.startswith(FRAGMENT_PREFIX):
+        return "fragment:" + key[len(FRAGMENT_PREFIX) :].partition(".")[0]
+    head, _, rest = key.partition(":")
+    if head == "computed":
+        head += ":" + rest.partition(":")[0]
+    return NUMBER.sub("*", head)
+
+
+def record_lookups(keys: List[Any], found: Collection[Any], elapsed: float) -> None:
+    """
+    Record cache lookups by namespace.
+
+    Args:
+        keys (List[Any]): The keys looked up.
+        found (Collection[Any]): The keys found.
+        elapsed (float): Time spent on the lookups in seconds, shared
+            evenly among the keys.
+    """
+    for key in keys:
+        labels: Dict[str, str] = {"namespace": key_namespace(key)}
+        registry.inc(
+            (
+                "django_cache_namespace_hits_total"
+                if key in found
+                else "django_cache_namespace_misses_total"
+            ),
+            labels=labels,
+        )
+        registry.inc(
+            "django_cache_namespace_seconds_total",
+            elapsed / len(keys),
+            {**labels, "operation": "get"},
+        )
+
+
+def record_writes(operation: str, keys: List[Any], elapsed: float) -> None:
+    """
+    Record cache writes or deletions by namespace.
+
+    Args:
+        operation (str): "set" or "delete".
+        keys (List[Any]): The keys written or deleted.
+        elapsed (float): Time spent on the operation in seconds, shared
+            evenly among the keys.
+    """
+    for key in keys:
+        labels: Dict[str, str] = {"namespace": key_namespace(key)}
+        registry.inc(
+            "django_cache_namespace_{operation}s_total".format(operation=operation),
+            labels=labels,
+        )
+        registry.inc(
+            "django_cache_namespace_seconds_total",
+            elapsed / len(keys),
+            {**labels, "operation": operation},
+        )
+
+
+def namespace_stats(
+    totals: Optional[Dict[str, float]] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Return the cache usage of every namespace, summed over all the workers.
+
+    Args:
+        totals (Optional[Dict[str, float]]): Totals of the metrics, collected
+            from the registry if not given.
+
+    Returns:
+        Dict[str, Dict[str, float]]: By namespace, the hits, misses, hit
+            ratio, sets, deletes, mean time of a lookup and of a write in
+            milliseconds, bytes written and mean size of an entry.
+    """
+    if totals is None:
+        totals = registry.collect()
+    counts: Dict[str, Dict[str, float]] = {}
+    for series, value in totals.items():
+        if not series.startswith(SERIES_PREFIX):
+            continue
+        name, labels = parse_series(series)
+        field: str = name[len(SERIES_PREFIX) :].replace("_total", "")
+        if field == "seconds":
+            field = labels.get("operation", "") + "_seconds"
+        namespace: Dict[str, float] = counts.setdefault(labels.get("namespace"), {})
+        namespace[field] = namespace.get(field, 0.0) + value
+
+    stats: Dict[str, Dict[str, float]] = {}
+    for namespace, values in sorted(counts.items()):
+        hits, misses = values.get("hits", 0.0), values.get("misses", 0.0)
+        sets, written = values.get("sets", 0.0), values.get("bytes", 0.0)
+        stats[namespace] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "sets": sets,
+            "deletes": values.get("deletes", 0.0),
+            "get_ms": (
+                values.get("get_seconds", 0.0) / (hits + misses) * 1000
+                if hits + misses
+                else 0.0
+            ),
+            "set_ms": values.get("set_seconds", 0.0) / sets * 1000 if sets else 0.0,
+            "bytes_written": written,
+            "entry_bytes": written / sets if sets else 0.0,
+        }
+    return stats
@@ -0,0 +1,388 @@
+"""
+Redis cache backend failing over to a local in-memory cache.
+
+The cache operations are protected by a circuit breaker shared by the
+threads of the worker: after ``FAILURE_THRESHOLD`` consecutive Redis errors
+or timeouts the circuit opens and the operations go straight to a
+``LocMemCache`` of the worker, without touching Redis. After
+``RESET_TIMEOUT`` seconds a single operation probes Redis again: the
+circuit closes if it succeeds and stays open for another ``RESET_TIMEOUT``
+otherwise. With short ``SOCKET_CONNECT_TIMEOUT`` and ``SOCKET_TIMEOUT``
+options, a stalled Redis costs a few requests a fraction of a second each
+instead of hanging every request.
+
+The keys written or deleted while Redis is unavailable are deleted from
+Redis when the circuit closes, so the values written before the outage are
+not served after it (the model versions and cache tags are timestamps,
+recreated on the next lookup). The values of the fallback are only seen by
+their worker and are kept ``FALLBACK_TIMEOUT`` seconds at most.
+
+Only the operations of Django's cache API are protected, not the django_redis
+extensions (``ttl()``, ``lock()``, ``delete_pattern()``...), and
+``DJANGO_REDIS_IGNORE_EXCEPTIONS`` must stay off for the errors to reach the
+circuit breaker.
+"""
+
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django_redis.exceptions import ConnectionInterrupted
+from loguru import logger as log
+from redis.exceptions import RedisError
+
+from .breakers import CircuitBreaker
+from .metrics import registry
+from .two_tier_cache import TwoTierRedisCache
+
+REDIS_ERRORS: Tuple[type, ...] = (ConnectionInterrupted, RedisError)
+# Keys written while the circuit is open, deleted from Redis when it closes.
+MAX_PENDING_KEYS: int = 10000
+
+
+class FallbackState:
+    """
+    Circuit breaker, fallback cache and pending invalidations of a cache.
+
+    Django creates an instance of the cache backend per thread, the state is
+    shared by the instances of the same server.
+    """
+
+    def __init__(self, breaker: CircuitBreaker, fallback: LocMemCache) -> None:
+        self.breaker = breaker
+        self.fallback = fallback
+        self.pending: Set[Tuple[Any, Optional[int]]] = set()
+        self.pending_clear: bool = False
+        self.overflowed: bool = False
+        self.lock = Lock()
+
+
+_states: Dict[str, FallbackState] = {}
+_states_lock = Lock()
+
+
+class CircuitBreakerCacheMixin:
+    """
+    Cache backend mixin failing over to a ``LocMemCache`` when Redis fails.
+
+    Configured by the ``CIRCUIT_BREAKER`` dictionary of the cache
+    ``OPTIONS``, with the ``FAILURE_THRESHOLD`` and ``RESET_TIMEOUT`` of the
+    ``CircuitBreaker``, and the ``FALLBACK_TIMEOUT`` and
+    ``FALLBACK_MAX_ENTRIES`` of the fallback cache.
+    """
+
+    def __init__(self, server: str, params: Dict[str, Any]) -> None:
+        super().__init__(server, params)
+        options: Dict[str, Any] = params.get("OPTIONS", {}).get("CIRCUIT_BREAKER", {})
+        self.fallback_timeout: float = options.get("FALLBACK_TIMEOUT", 30)
+        with _states_lock:
+            state: Optional[FallbackState] = _states.get(str(server))
+            if state is None:
+                state = _states[str(server)] = FallbackState(
+                    CircuitBreaker(
+                        failure_threshold=options.get("FAILURE_THRESHOLD", 3),
+                        reset_timeout=options.get("RESET_TIMEOUT", 5.0),
+                    ),
+                    LocMemCache(
+                        "circuit-breaker:{server}".format(server=server),
+                        {
+                            "TIMEOUT": self.fallback_timeout,
+                            "OPTIONS": {
+                                "MAX_ENTRIES": options.get("FALLBACK_MAX_ENTRIES", 1000)
+                            },
+                        },
+                    ),
+                )
+        self.fallback_state: FallbackState = state
+        self.breaker: CircuitBreaker = state.breaker
+        self.fallback: LocMemCache = state.fallback
+
+    def _fallback_timeout(self, timeout: Any) -> Any:
+        """Return the timeout of a value in the fallback, FALLBACK_TIMEOUT at most."""
+        if timeout is DEFAULT_TIMEOUT:
+            return timeout
+        if timeout is None:
+            return self.fallback_timeout
+        return min(timeout, self.fallback_timeout)
+
+    def _call(
+        self,
+        operation: str,
+        redis_call: Callable[[], Any],
+        fallback_call: Callable[[], Any],
+        written: Iterable[Any] = (),
+        version: Optional[int] = None,
+    ) -> Any:
+        """
+        Run an operation in Redis, or in the fallback if Redis is unavailable.
+
+        Args:
+            operation (str): Name of the operation, for the metrics.
+            redis_call (Callable[[], Any]): Runs the operation in Redis.
+            fallback_call (Callable[[], Any]): Runs the operation in the fallback.
+            written (Iterable[Any], optional): The keys written or deleted by
+                the operation, deleted from Redis when the circuit closes if
+                the fallback is used.
+            version (Optional[int], optional): Version of the keys.
+
+        Returns:
+            Any: The result of the operation.
+        """
+        if self.breaker.allow():
+            try:
+                if self.breaker.probing:
+                    # The values written meanwhile must not be read back stale.
+                    self._invalidate_pending()
+                result: Any = redis_call()
+            except REDIS_ERRORS as error:
+                self._record_failure(error)
+            except Exception:
+                # Redis answered, e.g. incr() of a missing key.
+                self._record_success()
+                raise
+            else:
+                self._record_success()
+                return result
+
+        registry.inc(
+            "django_cache_fallback_operations_total", labels={"operation": operation}
+        )
+        state: FallbackState = self.fallback_state
+        with state.lock:
+            for key in written:
+                if len(state.pending) < MAX_PENDING_KEYS:
+                    state.pending.add((key, version))
+                elif not state.overflowed:
+                    state.overflowed = True
+                    log.warning(
+                        "Too many keys written without Redis, some may be stale "
+                        "in Redis until they expire"
+                    )
+        return fallback_call()
+
+    def _invalidate_pending(self) -> None:
+        """
+        Delete from Redis the keys written or deleted in the fallback.
+
+        Raises:
+            ConnectionInterrupted, RedisError: If Redis fails, the keys stay
+                pending.
+        """
+        state: FallbackState = self.fallback_state
+        with state.lock:
+            pending: Set[Tuple[Any, Optional[int]]] = state.pending
+            pending_clear: bool = state.pending_clear
+            state.pending, state.pending_clear = set(), False
+            state.overflowed = False
+        try:
+            if pending_clear:
+                super().clear()
+                return
+            by_version: Dict[Optional[int], List[Any]] = {}
+            for key, version in pending:
+                by_version.setdefault(version, []).append(key)
+            for version, keys in by_version.items():
+                super().delete_many(keys, version=version)
+        except REDIS_ERRORS:
+            with state.lock:
+                state.pending |= pending
+                state.pending_clear |= pending_clear
+            raise
+
+    def _record_failure(self, error: Exception) -> None:
+        """Record a Redis failure."""
+        if self.breaker.record_failure():
+            registry.inc("django_cache_circuit_opened_total")
+            log.warning(
+                "Cache circuit open, using the local cache for {timeout}s: {error}",
+                timeout=self.breaker.reset_timeout,
+                error=error,
+            )
+
+    def _record_success(self) -> None:
+        """Record a Redis success, forgetting the fallback if the circuit closes."""
+        if not self.breaker.record_success():
+            return
+        self.fallback.clear()
+        log.info("Cache circuit closed, using Redis again")
+        try:
+            # Written by the other threads while the probe ran.
+            self._invalidate_pending()
+        except REDIS_ERRORS as error:
+            self._record_failure(error)
+
+    def get(
+        self, key: Any, default: Any = None, version: Optional[int] = None, **kwargs
+    ) -> Any:
+        return self._call(
+            "get",
+            lambda: super(CircuitBreakerCacheMixin, self).get(
+                key, default, version=version, **kwargs
+            ),
+            lambda: self.fallback.get(key, default, version=version),
+        )
+
+    def get_many(
+        self, keys: Iterable[Any], version: Optional[int] = None, **kwargs
+    ) -> Dict[Any, Any]:
+        keys = list(keys)
+        return self._call(
+            "get_many",
+            lambda: super(CircuitBreakerCacheMixin, self).get_many(
+                keys, version=version, **kwargs
+            ),
+            lambda: self.fallback.get_many(keys, version=version),
+        )
+
+    def has_key(self, key: Any, version: Optional[int] = None, **kwargs) -> bool:
+        return self._call(
+            "has_key",
+            lambda: super(CircuitBreakerCacheMixin, self).has_key(
+                key, version=version, **kwargs
+            ),
+            lambda: self.fallback.has_key(key, version=version),
+        )
+
+    def set(
+        self,
+        key: Any,
+        value: Any,
+        timeout: Any = DEFAULT_TIMEOUT,
+        version: Optional[int] = None,
+        **kwargs
+    ) -> Any:
+        return self._call(
+            "set",
+            lambda: super(CircuitBreakerCacheMixin, self).set(
+                key, value, timeout, version=version, **kwargs
+            ),
+            lambda: self.fallback.set(
+                key, value, self._fallback_timeout(timeout), version=version
+            ),
+            [key],
+            version,
+        )
+
+    def add(
+        self,
+        key: Any,
+        value: Any,
+        timeout: Any = DEFAULT_TIMEOUT,
+        version: Optional[int] = None,
+        **kwargs
+    ) -> bool:
+        return self._call(
+            "add",
+            lambda: super(CircuitBreakerCacheMixin, self).add(
+                key, value, timeout, version=version, **kwargs
+            ),
+            lambda: self.fallback.add(
+                key, value, self._fallback_timeout(timeout), version=version
+            ),
+            [key],
+            version,
+        )
+
+    def set_many(
+        self,
+        data: Dict[Any, Any],
+        timeout: Any = DEFAULT_TIMEOUT,
+        version: Optional[int] = None,
+        **kwargs
+    ) -> List[Any]:
+        return self._call(
+            "set_many",
+            lambda: super(CircuitBreakerCacheMixin, self).set_many(
+                data, timeout, version=version, **kwargs
+            ),
+            lambda: self.fallback.set_many(
+                data, self._fallback_timeout(timeout), version=version
+            ),
+            list(data),
+            version,
+        )
+
+    def touch(
+        self,
+        key: Any,
+        timeout: Any = DEFAULT_TIMEOUT,
+        version: Optional[int] = None,
+        **kwargs
+    ) -> bool:
+        return self._call(
+            "touch",
+            lambda: super(CircuitBreakerCacheMixin, self).touch(
+                key, timeout, version=version, **kwargs
+            ),
+            lambda: self.fallback.touch(
+                key, self._fallback_timeout(timeout), version=version
+            ),
+        )
+
+    def delete(self, key: Any, version: Optional[int] = None, **kwargs) -> bool:
+        return self._call(
+            "delete",
+            lambda: super(CircuitBreakerCacheMixin, self).delete(
+                key, version=version, **kwargs
+            ),
+            lambda: self.fallback.delete(key, version=version),
+            [key],
+            version,
+        )
+
+    def delete_many(
+        self, keys: Iterable[Any], version: Optional[int] = None, **kwargs
+    ) -> Any:
+        keys = list(keys)
+        return self._call(
+            "delete_many",
+            lambda: super(CircuitBreakerCacheMixin, self).delete_many(
+                keys, version=version, **kwargs
+            ),
+            lambda: self.fallback.delete_many(keys, version=version),
+            keys,
+            version,
+        )
+
+    def incr(
+        self, key: Any, delta: int = 1, version: Optional[int] = None, **kwargs
+    ) -> int:
+        return self._call(
+            "incr",
+            lambda: super(CircuitBreakerCacheMixin, self).incr(
+                key, delta, version=version, **kwargs
+            ),
+            lambda: self.fallback.incr(key, delta, version=version),
+            [key],
+            version,
+        )
+
+    def decr(
+        self, key: Any, delta: int = 1, version: Optional[int] = None, **kwargs
+    ) -> int:
+        return self._call(
+            "decr",
+            lambda: super(CircuitBreakerCacheMixin, self).decr(
+                key, delta, version=version, **kwargs
+            ),
+            lambda: self.fallback.decr(key, delta, version=version),
+            [key],
+            version,
+        )
+
+    def clear(self) -> Any:
+        def clear_fallback() -> None:
+            with self.fallback_state.lock:
+                self.fallback_state.pending_clear = True
+            self.fallback.clear()
+
+        return self._call(
+            "clear",
+            lambda: super(CircuitBreakerCacheMixin, self).clear(),
+            clear_fallback,
+        )
+
+
+class CircuitBreakerRedisCache(CircuitBreakerCacheMixin, TwoTierRedisCache):
+    """Two-tier Redis cache failing over to a local in-memory cache."""
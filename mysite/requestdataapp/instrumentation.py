@@ -0,0 +1,321 @@
+"""
+Per-request statistics of the database, cache, template and DRF renderer usage.
+"""
+
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from time import perf_counter
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+)
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django_redis.cache import RedisCache
+from rest_framework.renderers import JSONRenderer
+
+from .cache_stats import record_lookups, record_writes
+from .circuit_breaker import CircuitBreakerRedisCache
+from .two_tier_cache import TwoTierRedisCache
+
+STRING_LITERAL: Pattern = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL: Pattern = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDER: Pattern = re.compile(r"%s|\?")
+VALUE_LIST: Pattern = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+WHITESPACE: Pattern = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1024)
+def fingerprint_sql(sql: str) -> str:
+    """
+    Return the shape of a query: the SQL without its values.
+
+    Literals and placeholders become ``?`` and value lists ``(...)``, so
+    ``WHERE id = 1`` and ``WHERE id = 2`` or ``IN (1, 2)`` and ``IN (1, 2, 3)``
+    have the same shape. Django sends the same few SQL strings with
+    placeholders over and over, the shapes are memoized.
+
+    Args:
+        sql (str): The executed SQL.
+
+    Returns:
+        str: The normalized SQL.
+    """
+    shape: str = STRING_LITERAL.sub("?", sql)
+    shape = NUMBER_LITERAL.sub("?", shape)
+    shape = PLACEHOLDER.sub("?", shape)
+    shape = VALUE_LIST.sub("(...)", shape)
+    return WHITESPACE.sub(" ", shape).strip()
+
+
+class RequestStats:
+    """Database, cache and rendering usage collected while a request is processed."""
+
+    def __init__(self) -> None:
+        self.db_queries: int = 0
+        self.query_shapes: Counter = Counter()
+        self.query_times: Counter = Counter()
+        self.db_time: float = 0.0
+        self.cache_hits: int = 0
+        self.cache_misses: int = 0
+        self.cache_time: float = 0.0
+        self.template_time: float = 0.0
+        self.render_time: float = 0.0
+
+    def record_query(
+        self,
+        execute: Callable,
+        sql: str,
+        params: Any,
+        many: bool,
+        context: Dict[str, Any],
+    ) -> Any:
+        """Execute a query and record its duration and shape, see ``execute_wrapper``."""
+        started_at: float = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed: float = perf_counter() - started_at
+            shape: str = fingerprint_sql(sql)
+            self.db_queries += 1
+            self.db_time += elapsed
+            self.query_shapes[shape] += 1
+            self.query_times[shape] += elapsed
+
+    def repeated_queries(self, threshold: int) -> Dict[str, int]:
+        """Return the query shapes executed at least ``threshold`` times."""
+        return {
+            shape: count
+            for shape, count in self.query_shapes.items()
+            if count >= threshold
+        }
+
+    def slowest_queries(self, count: int) -> List[Tuple[str, float, int]]:
+        """Return the query shapes taking the most time, with their time and count."""
+        return [
+            (shape, elapsed, self.query_shapes[shape])
+            for shape, elapsed in self.query_times.most_common(count)
+        ]
+
+    def record_cache(self, hits: int, misses: int, elapsed: float) -> None:
+        """Record the result of a cache lookup."""
+        self.cache_hits += hits
+        self.cache_misses += misses
+        self.cache_time += elapsed
+
+
+current_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "request_stats", default=None
+)
+
+
+@contextmanager
+def collect_stats() -> Iterator[RequestStats]:
+    """
+    Collect the statistics of the queries and cache lookups of the block.
+
+    Yields:
+        RequestStats: The statistics, filled while the block runs.
+    """
+    stats = RequestStats()
+    token = current_stats.set(stats)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(stats.record_query))
+            yield stats
+    finally:
+        current_stats.reset(token)
+
+
+_MISSING = object()
+
+
+# Set while an instrumented cache operation runs, so the operations it is
+# made of, e.g. the get() calls of get_many() in some backends, are not
+# recorded twice.
+_cache_operation: ContextVar[bool] = ContextVar("cache_operation", default=False)
+
+
+class InstrumentedCacheMixin:
+    """
+    Cache backend mixin recording the hits and misses in the request stats,
+    and every operation by key namespace in the metrics (see ``cache_stats``).
+    """
+
+    def _run(self, operation: Callable[[], Any]) -> Tuple[Any, float, bool]:
+        """Run an operation, return its result, its duration and if it is nested."""
+        nested: bool = _cache_operation.get()
+        token = _cache_operation.set(True)
+        started_at: float = perf_counter()
+        try:
+            return operation(), perf_counter() - started_at, nested
+        finally:
+            _cache_operation.reset(token)
+
+    def get(
+        self, key: str, default: Any = None, version: Optional[int] = None, **kwargs
+    ) -> Any:
+        value, elapsed, nested = self._run(
+            lambda: super(InstrumentedCacheMixin, self).get(
+                key, _MISSING, version=version, **kwargs
+            )
+        )
+        hit: bool = value is not _MISSING
+        stats: Optional[RequestStats] = current_stats.get()
+        if stats is not None:
+            stats.record_cache(int(hit), int(not hit), elapsed)
+        if not nested:
+            record_lookups([key], [key] if hit else [], elapsed)
+        return default if value is _MISSING else value
+
+    def get_many(
+        self, keys: Iterable[str], version: Optional[int] = None, **kwargs
+    ) -> Dict[str, Any]:
+        keys = list(keys)
+        # Some backends implement get_many() with get(), count the keys once.
+        token = current_stats.set(None)
+        try:
+            values, elapsed, nested = self._run(
+                lambda: super(InstrumentedCacheMixin, self).get_many(
+                    keys, version=version, **kwargs
+                )
+            )
+        finally:
+            current_stats.reset(token)
+        stats: Optional[RequestStats] = current_stats.get()
+        if stats is not None:
+            stats.record_cache(len(values), len(keys) - len(values), elapsed)
+        if keys and not nested:
+            record_lookups(keys, values, elapsed)
+        return values
+
+    def _write(self, operation: str, keys: List[str], call: Callable[[], Any]) -> Any:
+        result, elapsed, nested = self._run(call)
+        if keys and not nested:
+            record_writes(operation, keys, elapsed)
+        return result
+
+    def set(self, key: str, value: Any, *args, **kwargs) -> Any:
+        return self._write(
+            "set",
+            [key],
+            lambda: super(InstrumentedCacheMixin, self).set(
+                key, value, *args, **kwargs
+            ),
+        )
+
+    def add(self, key: str, value: Any, *args, **kwargs) -> Any:
+        return self._write(
+            "set",
+            [key],
+            lambda: super(InstrumentedCacheMixin, self).add(
+                key, value, *args, **kwargs
+            ),
+        )
+
+    def set_many(self, data: Dict[str, Any], *args, **kwargs) -> Any:
+        return self._write(
+            "set",
+            list(data),
+            lambda: super(InstrumentedCacheMixin, self).set_many(data, *args, **kwargs),
+        )
+
+    def delete(self, key: str, *args, **kwargs) -> Any:
+        return self._write(
+            "delete",
+            [key],
+            lambda: super(InstrumentedCacheMixin, self).delete(key, *args, **kwargs),
+        )
+
+    def delete_many(self, keys: Iterable[str], *args, **kwargs) -> Any:
+        keys = list(keys)
+        return self._write(
+            "delete",
+            keys,
+            lambda: super(InstrumentedCacheMixin, self).delete_many(
+                keys, *args, **kwargs
+            ),
+        )
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    """Redis cache recording its hits and misses."""
+
+
+class InstrumentedTwoTierRedisCache(InstrumentedCacheMixin, TwoTierRedisCache):
+    """Redis cache with an in-process tier recording its hits and misses."""
+
+
+class InstrumentedCircuitBreakerRedisCache(
+    InstrumentedCacheMixin, CircuitBreakerRedisCache
+):
+    """Two-tier Redis cache with a local fallback recording its hits and misses."""
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    """Local memory cache recording its hits and misses."""
+
+
+# Set while a template renders, so templates rendered by another are not counted twice.
+_rendering: ContextVar[bool] = ContextVar("rendering_template", default=False)
+
+
+class InstrumentedTemplate(Template):
+    """Template recording its render time in the request stats."""
+
+    def render(self, context=None, request=None) -> str:
+        stats: Optional[RequestStats] = current_stats.get()
+        if stats is None or _rendering.get():
+            return super().render(context, request)
+        token = _rendering.set(True)
+        started_at: float = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += perf_counter() - started_at
+            _rendering.reset(token)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """Django template backend recording the render time of its templates."""
+
+    def from_string(self, template_code: str) -> InstrumentedTemplate:
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name: str) -> InstrumentedTemplate:
+        try:
+            return InstrumentedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+class InstrumentedJSONRenderer(JSONRenderer):
+    """
+    DRF JSON renderer recording the render time of the responses.
+
+    Only the encoding of the data is timed, building ``serializer.data``
+    happens in the view and counts as view time.
+    """
+
+    def render(self, data: Any, accepted_media_type=None, renderer_context=None):
+        started_at: float = perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            stats: Optional[RequestStats] = current_stats.get()
+            if stats is not None:
+                stats.render_time += perf_counter() - started_at
@@ -0,0 +1,137 @@
+import tracemalloc
+from decimal import Decimal
+from timeit import default_timer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.core.management import BaseCommand
+from django.db.models import Count
+
+from mysite.cache import get_redis_client
+from requestdataapp.cache_encoding import decode_entry, encode_entry
+from shopapp.models import Order
+from shopapp.views import ProductDataExportView, UserOrderDataExportView
+
+BENCHMARK_KEY: str = "benchmark_cache_encoding"
+# Serializer and compression threshold of the compared encodings.
+ENCODINGS: Tuple[Tuple[str, str, Optional[int]], ...] = (
+    ("pickle", "pickle", None),
+    ("pickle+zlib", "pickle", 0),
+    ("json", "json", None),
+    ("json+zlib", "json", 0),
+)
+
+
+class Command(BaseCommand):
+    """
+    Compare the cache encodings on the export payloads.
+
+    The payloads are the products export and the orders export of the user
+    with the most orders, built from the database like the cached views do;
+    synthetic products are used when the database has none. For every
+    encoding the size of the entry, the encoding and decoding times and the
+    memory allocated by decoding are reported, and with ``--redis`` the
+    round trip to the Redis server of the default cache and the memory used
+    there by the key.
+
+    Example:
+        python manage.py benchmark_cache_encoding --repeat 50 --redis
+    """
+
+    help = "Benchmark the serializers and the compression of the cache entries"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--rows", type=int, default=5000)
+        parser.add_argument("--redis", action="store_true")
+
+    def payloads(self, rows: int) -> Dict[str, Any]:
+        """Return the payloads by name, built from the database when possible."""
+        payloads: Dict[str, Any] = {}
+        products: List[Dict[str, Any]] = ProductDataExportView.products_data()
+        if not products:
+            products = [
+                {
+                    "pk": pk,
+                    "name": "Product {pk}".format(pk=pk),
+                    "price": Decimal("{pk}.99".format(pk=pk % 1000)),
+                    "archived": pk % 10 == 0,
+                }
+                for pk in range(rows)
+            ]
+            self.stdout.write(
+                "No products, using {rows} synthetic ones".format(rows=rows)
+            )
+        payloads["products export"] = products
+
+        busiest: Optional[Dict[str, Any]] = (
+            Order.objects.values("user")
+            .annotate(orders=Count("pk"))
+            .order_by("-orders")
+            .first()
+        )
+        if busiest is not None:
+            payloads["user orders export"] = UserOrderDataExportView.orders_data(
+                busiest["user"]
+            )
+        return payloads
+
+    @staticmethod
+    def time_per_call(repeat: int, action: Callable[[], Any]) -> float:
+        """Return the mean time of the action in microseconds."""
+        started_at: float = default_timer()
+        for _ in range(repeat):
+            action()
+        return (default_timer() - started_at) / repeat * 1000000
+
+    @staticmethod
+    def decoded_memory(entry: bytes) -> int:
+        """Return the peak memory allocated while decoding the entry."""
+        tracemalloc.start()
+        try:
+            decode_entry(entry)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def handle(self, *args, **options) -> None:
+        repeat: int = options["repeat"]
+        client = get_redis_client(timeout=1.0) if options["redis"] else None
+        if options["redis"] and client is None:
+            self.stderr.write("The default cache is not Redis, skipping --redis")
+
+        header: str = "{:<12} {:>10} {:>11} {:>11} {:>11}".format(
+            "encoding", "bytes", "encode us", "decode us", "decode mem"
+        )
+        if client is not None:
+            header += " {:>11} {:>11}".format("redis us", "redis bytes")
+
+        for name, payload in self.payloads(options["rows"]).items():
+            self.stdout.write("\n{name}".format(name=name))
+            self.stdout.write(header)
+            for label, serializer, compress_min_bytes in ENCODINGS:
+                entry, _ = encode_entry(payload, serializer, compress_min_bytes)
+                line: str = "{:<12} {:>10} {:>11.1f} {:>11.1f} {:>11}".format(
+                    label,
+                    len(entry),
+                    self.time_per_call(
+                        repeat,
+                        lambda: encode_entry(payload, serializer, compress_min_bytes),
+                    ),
+                    self.time_per_call(repeat, lambda: decode_entry(entry)),
+                    self.decoded_memory(entry),
+                )
+                if client is not None:
+
+                    def round_trip() -> None:
+                        client.set(
+                            BENCHMARK_KEY,
+                            encode_entry(payload, serializer, compress_min_bytes)[0],
+                        )
+                        decode_entry(client.get(BENCHMARK_KEY))
+
+                    line += " {:>11.1f} {:>11}".format(
+                        self.time_per_call(repeat, round_trip),
+                        client.memory_usage(BENCHMARK_KEY),
+                    )
+                    client.delete(BENCHMARK_KEY)
+                self.stdout.write(line)
@@ -0,0 +1,110 @@
+import os
+from timeit import default_timer
+from typing import Callable, Optional
+
+from django.core.management import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory
+from loguru import logger as log
+
+from requestdataapp.request_logging import (
+    JsonSink,
+    QueueSink,
+    RequestSampler,
+    configure_logging,
+    log_request,
+)
+
+
+class Command(BaseCommand):
+    """
+    Measure the logging overhead of a request with the previous and the
+    current middleware logging.
+
+    The logs are written to /dev/null, so only the time spent by the request
+    thread is measured. With a queued sink, the time needed by the background
+    thread to write the queued records is reported separately.
+
+    Example:
+        python manage.py benchmark_request_logging --requests 20000
+    """
+
+    help = "Benchmark the per-request cost of the middleware logging"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--requests", type=int, default=10000)
+        parser.add_argument("--sample-rate", type=float, default=0.1)
+
+    def measure(
+        self,
+        label: str,
+        count: int,
+        action: Callable[[], None],
+        sink: Optional[QueueSink] = None,
+    ) -> None:
+        """Run the action for every request and print the time per request."""
+        started_at: float = default_timer()
+        for _ in range(count):
+            action()
+        elapsed: float = default_timer() - started_at
+        if sink is not None:
+            sink.complete()
+        drained: float = default_timer() - started_at
+        self.stdout.write(
+            "{label:<28} {per_request:8.2f} us/request "
+            "({drained:.2f}s until written)".format(
+                label=label,
+                per_request=elapsed / count * 1000000,
+                drained=drained,
+            )
+        )
+
+    def handle(self, *args, **options) -> None:
+        count: int = options["requests"]
+        request = RequestFactory().get("/en/shop/products/", HTTP_USER_AGENT="bench")
+        response = HttpResponse()
+        sampler = RequestSampler({"default": options["sample_rate"]})
+
+        def colorized_lines() -> None:
+            # The four lines previously logged by the middleware chain.
+            log.info("\x1b[34m ------  Before get response middleware")
+            log.info("\x1b[32mrequests count: (1)")
+            log.info("\x1b[33mresponses count: (1)")
+            log.info("\x1b[36m ------  After get response middleware")
+
+        def structured_line() -> None:
+            log_request(request, response, "shopapp:products_list", 0.01)
+
+        def sampled_line() -> None:
+            if sampler.is_sampled("shopapp:products_list"):
+                structured_line()
+
+        with open(os.devnull, "w") as devnull:
+            try:
+                log.remove()
+                log.add(devnull, colorize=True, enqueue=False)
+                self.measure("colorized, synchronous", count, colorized_lines)
+
+                log.remove()
+                log.add(JsonSink(devnull), format="{message}", enqueue=False)
+                self.measure("json, synchronous", count, structured_line)
+
+                log.remove()
+                log.add(JsonSink(devnull), format="{message}", enqueue=True)
+                self.measure("json, loguru enqueue", count, structured_line)
+
+                queue_sink = QueueSink(JsonSink(devnull), maxsize=count)
+                log.remove()
+                log.add(queue_sink, format="{message}")
+                self.measure("json, queued", count, structured_line, queue_sink)
+                self.measure(
+                    "json, queued, {rate:.0%} sampled".format(
+                        rate=options["sample_rate"]
+                    ),
+                    count,
+                    sampled_line,
+                    queue_sink,
+                )
+            finally:
+                log.remove()
+                configure_logging()
@@ -0,0 +1,60 @@
+import json
+from typing import Dict
+
+from django.core.management import BaseCommand, CommandError
+from redis.exceptions import RedisError
+
+from requestdataapp.cache_stats import namespace_stats
+
+
+class Command(BaseCommand):
+    """
+    Print the cache usage by key namespace, summed over all the workers.
+
+    The namespaces most looked up come first. Those written but never
+    found are flagged: their entries cost memory and writes for nothing,
+    their keys or timeouts need a look.
+
+    Example:
+        python manage.py cache_stats
+        python manage.py cache_stats --json
+    """
+
+    help = "Print the cache hits, misses, writes, latency and size by key namespace"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--json", action="store_true")
+
+    def handle(self, *args, **options) -> None:
+        try:
+            stats: Dict[str, Dict[str, float]] = namespace_stats()
+        except RedisError as error:
+            raise CommandError("Metrics unavailable: {error}".format(error=error))
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+
+        self.stdout.write(
+            "{:<40} {:>9} {:>9} {:>6} {:>8} {:>8} {:>7} {:>7} {:>11}".format(
+                "namespace",
+                "hits",
+                "misses",
+                "ratio",
+                "sets",
+                "deletes",
+                "get ms",
+                "set ms",
+                "entry bytes",
+            )
+        )
+        for namespace, values in sorted(
+            stats.items(), key=lambda item: -(item[1]["hits"] + item[1]["misses"])
+        ):
+            line: str = (
+                "{namespace:<40} {hits:>9.0f} {misses:>9.0f} {hit_ratio:>6.1%} "
+                "{sets:>8.0f} {deletes:>8.0f} {get_ms:>7.2f} {set_ms:>7.2f} "
+                "{entry_bytes:>11.0f}".format(namespace=namespace, **values)
+            )
+            if values["sets"] and not values["hits"]:
+                line = self.style.WARNING(line + "  never hit")
+            self.stdout.write(line)
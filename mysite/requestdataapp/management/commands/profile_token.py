@@ -0,0 +1,43 @@
+from django.contrib.auth.models import User
+from django.core.management import BaseCommand, CommandError
+
+from requestdataapp.profiling import (
+    PROFILE_PARAMETER,
+    TOKEN_MAX_AGE,
+    make_profile_token,
+)
+
+
+class Command(BaseCommand):
+    """
+    Print a token allowing a staff user to profile requests.
+
+    Example:
+        python manage.py profile_token admin
+        curl -H "X-Profile: <token>" --cookie "sessionid=..." https://.../shop/
+    """
+
+    help = "Print a request profiling token for a staff user"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("username", type=str)
+
+    def handle(self, *args, **options) -> None:
+        try:
+            user: User = User.objects.get(username=options["username"], is_staff=True)
+        except User.DoesNotExist:
+            raise CommandError(
+                "Staff user {username} does not exist".format(
+                    username=options["username"]
+                )
+            )
+        token: str = make_profile_token(user.pk)
+        self.stdout.write(token)
+        self.stderr.write(
+            "Valid for {minutes} minutes, send it in the X-Profile header or "
+            "the {parameter} query parameter while logged in as {username}.".format(
+                minutes=TOKEN_MAX_AGE // 60,
+                parameter=PROFILE_PARAMETER,
+                username=user.username,
+            )
+        )
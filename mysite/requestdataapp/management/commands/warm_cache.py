@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from timeit import default_timer
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import translation
+
+# Hot cached resources: name, URL name and request headers.
+RESOURCES: Tuple[Tuple[str, str, Dict[str, str]], ...] = (
+    ("products api", "shopapp:product-list", {"HTTP_ACCEPT": "application/json"}),
+    ("products export", "shopapp:products-export", {}),
+    (
+        "products export gzip",
+        "shopapp:products-export",
+        {"HTTP_ACCEPT_ENCODING": "gzip"},
+    ),
+    ("products feed", "shopapp:latest_products_feed", {}),
+    ("articles feed", "blogapp:articles_feed", {}),
+    ("sitemap", "django.contrib.sitemaps.views.sitemap", {}),
+)
+LOCAL_HOSTS: Tuple[str, ...] = ("0.0.0.0", "127.0.0.1", "localhost")
+
+
+class Command(BaseCommand):
+    """
+    Fill the cache with the hot resources after a deploy or a Redis flush.
+
+    The resources are requested through the whole middleware and view stack
+    as anonymous users, for every language, so they are cached under the
+    same keys as the live requests. The keys contain the absolute URL, hence
+    the public host and scheme of the site, by default the first host of
+    ``DJANGO_ALLOWED_HOSTS``.
+
+    Example:
+        python manage.py warm_cache --host shop.example.com --secure --concurrency 4
+    """
+
+    help = "Compute the hot cached resources for every language"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--host", default=None)
+        parser.add_argument("--secure", action="store_true")
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument(
+            "--languages",
+            nargs="+",
+            default=[code for code, _ in settings.LANGUAGES],
+        )
+
+    @staticmethod
+    def default_host() -> str:
+        """Return the first public host of ALLOWED_HOSTS."""
+        for host in settings.ALLOWED_HOSTS:
+            if host and host not in LOCAL_HOSTS and "*" not in host:
+                return host.lstrip(".")
+        return "127.0.0.1"
+
+    @staticmethod
+    def warm(
+        host: str, secure: bool, language: str, url_name: str, headers: Dict[str, str]
+    ) -> Tuple[int, int, float]:
+        """
+        Request a resource, in a worker thread.
+
+        Returns:
+            Tuple[int, int, float]: The status, the size of the response and
+                the time spent in seconds.
+        """
+        started_at: float = default_timer()
+        try:
+            with translation.override(language):
+                path: str = reverse(url_name)
+            response = Client(HTTP_HOST=host).get(path, secure=secure, **headers)
+            content: bytes = (
+                b"".join(response.streaming_content)
+                if response.streaming
+                else response.content
+            )
+            return response.status_code, len(content), default_timer() - started_at
+        finally:
+            connections.close_all()
+
+    def handle(self, *args, **options) -> None:
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1")
+        host: str = options["host"] or self.default_host()
+        started_at: float = default_timer()
+        failed: int = 0
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            futures: Dict[Any, Tuple[str, str]] = {
+                executor.submit(
+                    self.warm, host, options["secure"], language, url_name, headers
+                ): (language, name)
+                for language in options["languages"]
+                for name, url_name, headers in RESOURCES
+            }
+            for future in as_completed(futures):
+                language, name = futures[future]
+                error: Optional[BaseException] = future.exception()
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(
+                        "{language} {name:<22} failed: {error!r}".format(
+                            language=language, name=name, error=error
+                        )
+                    )
+                    continue
+                status, size, elapsed = future.result()
+                failed += status != 200
+                self.stdout.write(
+                    "{language} {name:<22} {status} {size:>10} bytes "
+                    "{elapsed:8.1f} ms".format(
+                        language=language,
+                        name=name,
+                        status=status,
+                        size=size,
+                        elapsed=elapsed * 1000,
+                    )
+                )
+
+        summary: str = "{count} resources on {host} in {elapsed:.2f}s".format(
+            count=len(futures), host=host, elapsed=default_timer() - started_at
+        )
+        if failed:
+            raise CommandError(
+                "{summary}, {failed} failed".format(summary=summary, failed=failed)
+            )
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,309 @@
+"""
+Request metrics aggregated across the workers and exposed to Prometheus.
+
+Each worker accumulates its increments in memory and adds them to a Redis
+hash at most once per ``FLUSH_INTERVAL``, so the metrics endpoint served by
+any worker reports the totals of all of them. Without a Redis cache the
+totals are kept in the worker. While Redis fails, a circuit breaker skips
+the flushes, so the requests do not wait for its timeouts.
+"""
+
+import re
+from threading import Lock
+from time import monotonic
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from loguru import logger as log
+from redis.exceptions import RedisError
+
+from mysite.cache import get_redis_client
+
+from .breakers import CircuitBreaker
+
+METRICS_KEY: str = "metrics"
+FLUSH_INTERVAL: float = 1.0
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# Metric families: name, Prometheus type and help text.
+METRICS: Dict[str, Tuple[str, str]] = {
+    "django_requests_total": ("counter", "Requests received."),
+    "django_responses_total": ("counter", "Responses sent, by status class."),
+    "django_exceptions_total": ("counter", "Exceptions raised by views, by type."),
+    "django_request_duration_seconds": (
+        "histogram",
+        "Time spent processing the requests, by view.",
+    ),
+    "django_db_queries_total": ("counter", "Database queries, by view."),
+    "django_db_query_duration_seconds_total": (
+        "counter",
+        "Time spent in database queries, by view.",
+    ),
+    "django_cache_hits_total": ("counter", "Cache lookups that found the key."),
+    "django_cache_misses_total": ("counter", "Cache lookups that missed the key."),
+    "django_cache_tier_hits_total": (
+        "counter",
+        "Lookups found in a tier of the two-tier cache, by tier.",
+    ),
+    "django_cache_tier_misses_total": (
+        "counter",
+        "Lookups missed by a tier of the two-tier cache, by tier.",
+    ),
+    "django_cache_circuit_opened_total": (
+        "counter",
+        "Times the cache circuit breaker opened after Redis failures.",
+    ),
+    "django_cache_fallback_operations_total": (
+        "counter",
+        "Cache operations served by the local fallback cache, by operation.",
+    ),
+    "django_cache_namespace_hits_total": (
+        "counter",
+        "Cache lookups that found the key, by key namespace.",
+    ),
+    "django_cache_namespace_misses_total": (
+        "counter",
+        "Cache lookups that missed the key, by key namespace.",
+    ),
+    "django_cache_namespace_sets_total": ("counter", "Cache writes, by key namespace."),
+    "django_cache_namespace_deletes_total": (
+        "counter",
+        "Cache deletions, by key namespace.",
+    ),
+    "django_cache_namespace_seconds_total": (
+        "counter",
+        "Time spent in cache operations, by key namespace and operation.",
+    ),
+    "django_cache_namespace_bytes_total": (
+        "counter",
+        "Size of the cache entries written, by key namespace.",
+    ),
+    "django_cache_entry_size_bytes": (
+        "histogram",
+        "Size of the cache entries as stored, by key prefix.",
+    ),
+    "django_cache_serialized_bytes_total": (
+        "counter",
+        "Size of the cache entries before compression, by key prefix.",
+    ),
+}
+
+
+LE_LABEL = re.compile(r',?le="([^"]*)"')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+ESCAPED = re.compile(r"\\(.)")
+
+
+def series_sort_key(series: str) -> Tuple[str, float]:
+    """Sort the series by name and labels, and the buckets by their bound."""
+    match = LE_LABEL.search(series)
+    if match is None:
+        return series, 0.0
+    return LE_LABEL.sub("", series), float(match.group(1).replace("+Inf", "inf"))
+
+
+def escape_label(value: str) -> str:
+    """Escape a label value for the Prometheus text format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def series_name(name: str, labels: Optional[Dict[str, str]] = None) -> str:
+    """
+    Build the name of a series, e.g. ``django_responses_total{status="2xx"}``.
+
+    Args:
+        name (str): Name of the metric.
+        labels (Optional[Dict[str, str]]): Labels of the series.
+
+    Returns:
+        str: The series as written in the Prometheus text format.
+    """
+    if not labels:
+        return name
+    return "{name}{{{labels}}}".format(
+        name=name,
+        labels=",".join(
+            '{key}="{value}"'.format(key=key, value=escape_label(value))
+            for key, value in labels.items()
+        ),
+    )
+
+
+def parse_series(series: str) -> Tuple[str, Dict[str, str]]:
+    """Return the name and the labels of a series built by ``series_name()``."""
+    name, _, labels = series.partition("{")
+    return name, {
+        key: ESCAPED.sub(
+            lambda match: "\n" if match.group(1) == "n" else match.group(1), value
+        )
+        for key, value in LABEL.findall(labels)
+    }
+
+
+class MetricsRegistry:
+    """Thread-safe accumulator of the metrics of a worker."""
+
+    def __init__(
+        self,
+        client=None,
+        flush_interval: float = FLUSH_INTERVAL,
+        breaker: Optional[CircuitBreaker] = None,
+    ) -> None:
+        """
+        Initialize the registry.
+
+        Args:
+            client (Optional[Redis]): Redis client, a client of the server of the
+                default cache is created if not given.
+            flush_interval (float, optional): Minimum time in seconds between
+                two flushes to Redis. Defaults to FLUSH_INTERVAL.
+            breaker (Optional[CircuitBreaker]): Circuit breaker of the flushes,
+                a default one is created if not given.
+        """
+        self.flush_interval = flush_interval
+        self.breaker: CircuitBreaker = breaker or CircuitBreaker()
+        self.pending: Dict[str, float] = {}
+        self.totals: Dict[str, float] = {}
+        self.lock = Lock()
+        self._client = client
+        self._client_loaded: bool = client is not None
+        self._flushed_at: float = monotonic()
+
+    @property
+    def client(self):
+        """Return the Redis client, None if the default cache is not Redis."""
+        if not self._client_loaded:
+            self._client = get_redis_client(timeout=0.1)
+            self._client_loaded = True
+        return self._client
+
+    def inc(
+        self, name: str, value: float = 1, labels: Optional[Dict[str, str]] = None
+    ) -> None:
+        """Add the value to a counter."""
+        series: str = series_name(name, labels)
+        with self.lock:
+            self.pending[series] = self.pending.get(series, 0) + value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: Optional[Dict[str, str]] = None,
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        """Record a value in a histogram with cumulative buckets."""
+        labels = labels or {}
+        updates: List[Tuple[str, float]] = [
+            (
+                series_name(name + "_bucket", {**labels, "le": str(bound)}),
+                int(value <= bound),
+            )
+            for bound in buckets
+        ]
+        updates.append((series_name(name + "_bucket", {**labels, "le": "+Inf"}), 1))
+        updates.append((series_name(name + "_count", labels), 1))
+        updates.append((series_name(name + "_sum", labels), value))
+        with self.lock:
+            for series, increment in updates:
+                self.pending[series] = self.pending.get(series, 0) + increment
+
+    def flush(self, force: bool = False) -> None:
+        """
+        Add the pending increments to the shared totals.
+
+        Args:
+            force (bool, optional): Flush even if the flush interval has not
+                passed. Defaults to False.
+        """
+        if not force and monotonic() - self._flushed_at < self.flush_interval:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self._flushed_at = monotonic()
+        if not pending:
+            return
+
+        client = self.client
+        if client is None:
+            with self.lock:
+                for series, value in pending.items():
+                    self.totals[series] = self.totals.get(series, 0) + value
+            return
+
+        if not self.breaker.allow():
+            self._keep_pending(pending)
+            return
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for series, value in pending.items():
+                pipeline.hincrbyfloat(METRICS_KEY, series, value)
+            pipeline.execute()
+        except RedisError as error:
+            if self.breaker.record_failure():
+                log.warning("Metrics not flushed: {error}", error=error)
+            self._keep_pending(pending)
+        else:
+            self.breaker.record_success()
+
+    def _keep_pending(self, pending: Dict[str, float]) -> None:
+        """Keep unflushed increments for the next flush, the series are few."""
+        with self.lock:
+            for series, value in pending.items():
+                self.pending[series] = self.pending.get(series, 0) + value
+
+    def collect(self) -> Dict[str, float]:
+        """Return the totals of all the workers, by series."""
+        self.flush(force=True)
+        client = self.client
+        if client is None:
+            with self.lock:
+                return dict(self.totals)
+        return {
+            series.decode(): float(value)
+            for series, value in client.hgetall(METRICS_KEY).items()
+        }
+
+    def render(self) -> str:
+        """
+        Render the totals in the Prometheus text exposition format.
+
+        Returns:
+            str: One ``# HELP`` and ``# TYPE`` header per metric family,
+                followed by its series.
+
+        Raises:
+            RedisError: If Redis cannot be reached.
+        """
+        totals: Dict[str, float] = self.collect()
+        lines: List[str] = []
+        for name, (kind, help_text) in METRICS.items():
+            names: Tuple[str, ...] = (name,)
+            if kind == "histogram":
+                names = (name + "_bucket", name + "_sum", name + "_count")
+            series: List[str] = sorted(
+                (key for key in totals if key.partition("{")[0] in names),
+                key=series_sort_key,
+            )
+            if not series:
+                continue
+            lines.append("# HELP {name} {help}".format(name=name, help=help_text))
+            lines.append("# TYPE {name} {kind}".format(name=name, kind=kind))
+            lines.extend(
+                "{series} {value}".format(series=key, value=repr(totals[key]))
+                for key in series
+            )
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
@@ -2,30 +2,61 @@ from http import HTTPStatus
 
 from django.http import HttpRequest, HttpResponse
 
-from time import time
-from colorama import Fore, Back
 from django.shortcuts import render
 from loguru import logger as log
-from typing import Callable
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from threading import get_ident
+from math import ceil
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.template.loader import render_to_string
+from django.utils.functional import SimpleLazyObject
+from django.utils.translation import get_language_from_path
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import APIException
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .instrumentation import RequestStats, collect_stats, current_stats
+from .metrics import registry
+from .query_budgets import QueryBudgetExceeded, find_violations
+from .profiling import (
+    StackSampler,
+    get_profile_token,
+    is_profiling_allowed,
+    save_profile,
+)
+from .request_logging import RequestSampler, log_request, log_slow_request
+from .throttling import ThrottlePolicy, load_policies
+from .user_agents import parse_user_agent
+
+# Authentication of the API tokens, "Token <key>" and "Bearer <JWT>".
+TOKEN_AUTHENTICATION_CLASSES: Tuple[type, ...] = (
+    TokenAuthentication,
+    JWTAuthentication,
+)
 
 
 def set_useragent_on_request_middleware(get_response):
     """
     Middleware to set the user agent on the request object.
 
+    ``request.user_agent`` is a ``UserAgent`` parsed on first access, so the
+    requests that never look at it do not pay for the parsing. Its string is
+    the raw header, "unknown" if the header is missing.
+
     Args:
         get_response (Callable): The next middleware or view in the chain.
 
     Returns:
         Callable: The middleware function.
     """
-    log.info(Fore.RED + "\n\n --------------- Initial call middleware\n")
 
     def middleware(request: HttpRequest):
-        log.info(Fore.BLUE + " ------  Before get response middleware")
-        request.user_agent = request.META.get("HTTP_USER_AGENT", "unknown")
+        header = request.META.get("HTTP_USER_AGENT")
+        request.user_agent = SimpleLazyObject(lambda: parse_user_agent(header))
         response = get_response(request)
-        log.info(Fore.CYAN + " ------  After get response middleware")
 
         return response
 
@@ -33,7 +64,18 @@ def set_useragent_on_request_middleware(get_response):
 
 
 class CountRequestsMiddleware:
-    """Middleware to count the number of requests, responses, and exceptions."""
+    """
+    Middleware to record the request metrics exposed to Prometheus.
+
+    Counts the requests, responses and exceptions, and records the latency,
+    the database queries and the cache lookups of every view. The metrics
+    are aggregated across the workers, see ``requestdataapp.metrics``.
+
+    A sample of the requests, set per route by ``REQUEST_LOGGING``, and
+    every failed request are also logged, and the requests slower than its
+    ``SLOW_REQUEST_SECONDS`` with the breakdown of their time, see
+    ``requestdataapp.request_logging``.
+    """
 
     def __init__(self, get_response: Callable) -> None:
         """
@@ -43,13 +85,19 @@ class CountRequestsMiddleware:
             get_response (Callable): The next middleware or view in the chain.
         """
         self.get_response = get_response
-        self.requests_count = 0
-        self.response_count = 0
-        self.exceptions_count = 0
+        self.sampler = RequestSampler(settings.REQUEST_LOGGING["SAMPLE_RATES"])
+        self.slow_threshold: float = settings.REQUEST_LOGGING["SLOW_REQUEST_SECONDS"]
+
+    def get_view_name(self, request: HttpRequest) -> str:
+        """Return the URL name of the view, a bounded label value."""
+        resolver_match = getattr(request, "resolver_match", None)
+        if resolver_match is None:
+            return "<unresolved>"
+        return resolver_match.view_name or "<unnamed>"
 
     def __call__(self, request: HttpRequest) -> HttpResponse:
         """
-        Process the request and count the number of requests.
+        Process the request and record its metrics.
 
         Args:
             request (HttpRequest): The incoming request.
@@ -57,58 +105,277 @@ class CountRequestsMiddleware:
         Returns:
             HttpResponse: The response from the next middleware or view.
         """
-        self.requests_count += 1
-        log.info(
-            Fore.GREEN
-            + "requests count: ({current_request_count})".format(
-                current_request_count=self.requests_count
-            )
+        registry.inc("django_requests_total")
+        started_at: float = perf_counter()
+        with collect_stats() as stats:
+            response = self.get_response(request)
+        elapsed: float = perf_counter() - started_at
+
+        view_name: str = self.get_view_name(request)
+        view: Dict[str, str] = {"view": view_name}
+        registry.inc(
+            "django_responses_total",
+            labels={"status": "{0}xx".format(response.status_code // 100)},
         )
-        response = self.get_response(request)
-
-        self.response_count += 1
-        log.info(
-            Fore.YELLOW
-            + "responses count: ({current_response_count})".format(
-                current_response_count=self.response_count
-            )
+        registry.observe("django_request_duration_seconds", elapsed, labels=view)
+        registry.inc("django_db_queries_total", stats.db_queries, labels=view)
+        registry.inc(
+            "django_db_query_duration_seconds_total", stats.db_time, labels=view
         )
+        registry.inc("django_cache_hits_total", stats.cache_hits)
+        registry.inc("django_cache_misses_total", stats.cache_misses)
+        registry.flush()
+        if elapsed >= self.slow_threshold:
+            log_slow_request(request, response, view_name, elapsed, stats)
+        elif response.status_code >= 500 or self.sampler.is_sampled(view_name):
+            log_request(
+                request,
+                response,
+                view_name=view_name,
+                elapsed=elapsed,
+                db_queries=stats.db_queries,
+                db_time_ms=round(stats.db_time * 1000, 3),
+            )
 
         return response
 
     def process_exception(self, request: HttpRequest, exception: Exception) -> None:
         """
-        Process an exception and count the number of exceptions.
+        Process an exception and count it by type.
 
         Args:
             request (HttpRequest): The incoming request.
             exception (Exception): The exception that occurred.
         """
-        self.exceptions_count += 1
-        log.info(
-            Fore.RED
-            + Back.LIGHTWHITE_EX
-            + "\n\n\tgot ({current_exception_count}) exceptions so far".format(
-                current_exception_count=self.exceptions_count
-            ).upper()
+        registry.inc(
+            "django_exceptions_total", labels={"type": type(exception).__name__}
         )
+        log.bind(path=request.path).opt(exception=exception).error(
+            "Unhandled {exception_type}", exception_type=type(exception).__name__
+        )
+
+
+class QueryBudgetMiddleware:
+    """
+    Middleware to catch N+1 queries and views exceeding their query budget.
+
+    The queries of every request are compared to the budget of its URL name
+    and checked for repeated shapes, see ``requestdataapp.query_budgets``.
+    The violations are logged as warnings, or raised as
+    ``QueryBudgetExceeded`` if the ``RAISE`` option of ``QUERY_BUDGETS`` is
+    set, as it is in the tests using ``QueryBudgetTestMixin``.
+
+    The statistics collected by ``CountRequestsMiddleware`` are reused when
+    it comes first, so the queries are only wrapped once.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            get_response (Callable): The next middleware or view in the chain.
+        """
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Process the request and check its queries.
+
+        Args:
+            request (HttpRequest): The incoming request.
+
+        Returns:
+            HttpResponse: The response from the next middleware or view.
+
+        Raises:
+            QueryBudgetExceeded: If the request has violations and ``RAISE``
+                is set.
+        """
+        stats: Optional[RequestStats] = current_stats.get()
+        if stats is None:
+            with collect_stats() as stats:
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+
+        resolver_match = getattr(request, "resolver_match", None)
+        if resolver_match is None or not resolver_match.view_name:
+            return response
+        violations: List[str] = find_violations(stats, resolver_match.view_name)
+        if violations and settings.QUERY_BUDGETS["RAISE"]:
+            raise QueryBudgetExceeded("\n".join(violations))
+        for violation in violations:
+            log.bind(path=request.path, view=resolver_match.view_name).warning(
+                violation
+            )
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware to add a ``Server-Timing`` header to the responses.
+
+    The header splits the processing time between the database (with the
+    number of queries), the cache, the view, the templates and the DRF
+    JSON rendering, so the browser devtools and the load tests show where the
+    time went. The view time excludes the rendering, which often happens
+    after the view returns a template response. Only installed if the
+    ``SERVER_TIMING`` setting is set, the header discloses the queries count.
+
+    The statistics collected by ``CountRequestsMiddleware`` are reused when
+    it comes first.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            get_response (Callable): The next middleware or view in the chain.
+
+        Raises:
+            MiddlewareNotUsed: If the ``SERVER_TIMING`` setting is not set.
+        """
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Process the request and add the timings to its response.
+
+        Args:
+            request (HttpRequest): The incoming request.
+
+        Returns:
+            HttpResponse: The response from the next middleware or view.
+        """
+        started_at: float = perf_counter()
+        stats: Optional[RequestStats] = current_stats.get()
+        if stats is None:
+            with collect_stats() as stats:
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        finished_at: float = perf_counter()
+
+        metrics: List[Tuple[str, float, str]] = [
+            ("db", stats.db_time, "{0} queries".format(stats.db_queries)),
+            (
+                "cache",
+                stats.cache_time,
+                "{0} hits {1} misses".format(stats.cache_hits, stats.cache_misses),
+            ),
+        ]
+        view_started_at: Optional[float] = getattr(request, "view_started_at", None)
+        if view_started_at is not None:
+            view_time: float = (
+                finished_at
+                - view_started_at
+                - stats.template_time
+                - stats.render_time
+            )
+            metrics.append(("view", view_time, ""))
+        if stats.template_time:
+            metrics.append(("template", stats.template_time, ""))
+        if stats.render_time:
+            metrics.append(("render", stats.render_time, ""))
+        metrics.append(("total", finished_at - started_at, ""))
+        response["Server-Timing"] = ", ".join(
+            self.format_metric(*metric) for metric in metrics
+        )
+        return response
+
+    def process_view(
+        self, request: HttpRequest, view_func: Callable, view_args, view_kwargs
+    ) -> None:
+        """Record when the view starts."""
+        request.view_started_at = perf_counter()
+
+    @staticmethod
+    def format_metric(name: str, duration: float, description: str) -> str:
+        """Format a metric of the header, e.g. ``db;dur=1.5;desc="3 queries"``."""
+        metric: str = "{name};dur={duration:.1f}".format(
+            name=name, duration=duration * 1000
+        )
+        if description:
+            metric += ';desc="{0}"'.format(description)
+        return metric
+
+
+class ProfilingMiddleware:
+    """
+    Middleware to profile single requests of staff users on demand.
+
+    A request carrying a token made by ``manage.py profile_token`` in the
+    ``X-Profile`` header or the ``_profile`` query parameter is sampled,
+    and its profile is stored under ``MEDIA_ROOT/profiles/``, see
+    ``requestdataapp.profiling``. The other requests are only checked for
+    the header and the parameter.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
+        """
+        Initialize the middleware.
+
+        Args:
+            get_response (Callable): The next middleware or view in the chain.
+        """
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Process the request, profiling it if requested by a staff user.
+
+        Args:
+            request (HttpRequest): The incoming request.
+
+        Returns:
+            HttpResponse: The response from the next middleware or view, with
+            the storage name of the profile in the ``X-Profile-Path`` header.
+        """
+        token: Optional[str] = get_profile_token(request)
+        if token is None or not is_profiling_allowed(request, token):
+            return self.get_response(request)
+
+        started_at: float = perf_counter()
+        with StackSampler(get_ident()) as sampler:
+            response = self.get_response(request)
+        elapsed: float = perf_counter() - started_at
+        response["X-Profile-Path"] = save_profile(request, sampler, elapsed)
+        log.bind(path=request.path, profile=response["X-Profile-Path"]).info(
+            "Request profiled"
+        )
+        return response
 
 
 class ThrottlingMiddleware:
-    """Middleware to throttle requests from a single IP address."""
+    """
+    Middleware to throttle requests by route and user tier.
 
-    def __init__(self, get_response: Callable, reset_time: int = 40) -> None:
+    The policies come from the ``THROTTLING`` setting: the first policy
+    matching the URL name or the path applies, with the rate of the tier of
+    the user (anonymous, authenticated, staff or API token). The request
+    counts are kept in Redis, so the limit is shared by all the workers,
+    and in a bounded in-process store when Redis is not used or unavailable.
+
+    Over-limit requests get a 429 response with a ``Retry-After`` header,
+    whose body is rendered once, before any view runs.
+    """
+
+    def __init__(self, get_response: Callable) -> None:
         """
         Initialize the middleware.
 
         Args:
             get_response (Callable): The next middleware or view in the chain.
-            reset_time (int, optional): The time in seconds to reset the request count. Defaults to 40.
         """
         self.get_response = get_response
-        self.limit_requests = 30
-        self.reset_time = reset_time
-        self.ip_requests = dict()
+        self.policies: List[ThrottlePolicy] = load_policies(settings.THROTTLING)
+        self.too_many_requests_content: bytes = render_to_string(
+            "requestdataapp/too-many-requests.html"
+        ).encode()
 
     def get_ip_client(self, request: HttpRequest) -> str:
         """
@@ -123,33 +390,101 @@ class ThrottlingMiddleware:
         ip = request.META.get("REMOTE_ADDR")
         return ip
 
-    def __call__(self, request: HttpRequest) -> HttpResponse:
+    def authenticate_token(self, request: HttpRequest) -> Optional[Any]:
+        """
+        Return the user of the API token of the request, None if it has none
+        or if the token is invalid.
         """
-        Process the request and check if the request limit has been exceeded.
+        for authentication_class in TOKEN_AUTHENTICATION_CLASSES:
+            try:
+                user_and_token = authentication_class().authenticate(request)
+            except APIException:
+                return None
+            if user_and_token is not None:
+                return user_and_token[0]
+        return None
+
+    def get_tier(self, request: HttpRequest) -> Tuple[str, str]:
+        """
+        Get the user tier of the request and the identifier of its client.
+
+        API tokens are verified first: a request with an invalid token is
+        counted as anonymous, by IP address, so made up tokens cannot get
+        a fresh bucket each.
 
         Args:
             request (HttpRequest): The incoming request.
 
         Returns:
-            HttpResponse: The response from the next middleware
-            or view, or a 429 response if the limit has been exceeded.
+            Tuple[str, str]: The tier and the identifier of the client.
         """
-        user_ip = self.get_ip_client(request)
-        current_time = time()
+        authorization: str = request.headers.get("Authorization", "")
+        if authorization.startswith(("Token ", "Bearer ")):
+            token_user = self.authenticate_token(request)
+            if token_user is None:
+                return "anonymous", self.get_ip_client(request)
+            return "token", str(token_user.pk)
+        user = getattr(request, "user", None)
+        if user is None or not user.is_authenticated:
+            return "anonymous", self.get_ip_client(request)
+        if user.is_staff:
+            return "staff", str(user.pk)
+        return "authenticated", str(user.pk)
+
+    def get_path(self, request: HttpRequest) -> str:
+        """Return the path of the request without its language prefix."""
+        path: str = request.path_info
+        language: Optional[str] = get_language_from_path(path)
+        if language and path.startswith("/{language}/".format(language=language)):
+            return path[len(language) + 1 :]
+        return path
 
-        info_requests = self.ip_requests.get(
-            user_ip, {"count": 0, "timestamp": current_time}
-        )
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        """
+        Process the request.
 
-        if current_time - info_requests["timestamp"] > self.reset_time:
-            info_requests = {"count": 0, "timestamp": current_time}
+        Args:
+            request (HttpRequest): The incoming request.
 
-        info_requests["count"] += 1
-        self.ip_requests[user_ip] = info_requests
+        Returns:
+            HttpResponse: The response from the next middleware or view.
+        """
+        return self.get_response(request)
 
-        if info_requests["count"] > self.limit_requests:
-            request.is_rate_limited = True
+    def process_view(
+        self, request: HttpRequest, view_func: Callable, view_args, view_kwargs
+    ) -> Optional[HttpResponse]:
+        """
+        Check the request limit right before the view is called.
 
-        response = self.get_response(request)
+        Args:
+            request (HttpRequest): The incoming request.
+            view_func (Callable): The view about to be called.
+            view_args: Positional arguments of the view.
+            view_kwargs: Keyword arguments of the view.
 
+        Returns:
+            Optional[HttpResponse]: A 429 response if the limit has been
+            exceeded, None to call the view.
+        """
+        url_name: Optional[str] = request.resolver_match.view_name
+        path: str = self.get_path(request)
+        policy: ThrottlePolicy = next(
+            policy for policy in self.policies if policy.matches(url_name, path)
+        )
+        tier, identifier = self.get_tier(request)
+        request.user_tier = tier
+        limiter = policy.limiters.get(tier)
+        if limiter is None:
+            return None
+
+        allowed, retry_after = limiter.hit(identifier)
+        if allowed:
+            return None
+
+        request.is_rate_limited = True
+        response = HttpResponse(
+            self.too_many_requests_content, status=HTTPStatus.TOO_MANY_REQUESTS
+        )
+        response["Retry-After"] = str(max(1, ceil(retry_after)))
         return response
@@ -0,0 +1,215 @@
+"""
+On-demand sampling profiler of single requests.
+
+A staff user sends a signed token in the ``X-Profile`` header or the
+``_profile`` query parameter, the request is then sampled by a background
+thread and two files are stored under ``MEDIA_ROOT/profiles/``:
+
+- ``<name>.collapsed``: the sampled stacks in the collapsed format read by
+  flamegraph.pl, speedscope or inferno;
+- ``<name>.txt``: the functions with the most samples.
+"""
+
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional, Tuple
+from uuid import uuid4
+
+from django.core import signing
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import HttpRequest
+
+PROFILE_SALT: str = "requestdataapp.profiling"
+PROFILE_HEADER: str = "HTTP_X_PROFILE"
+PROFILE_PARAMETER: str = "_profile"
+PROFILE_DIRECTORY: str = "profiles"
+TOKEN_MAX_AGE: int = 60 * 60
+SAMPLE_INTERVAL: float = 0.001
+TOP_FUNCTIONS: int = 30
+
+# The switch interval is global to the process: the first sampler saves it
+# and the last one to exit restores it.
+_switch_lock = threading.Lock()
+_active_samplers: int = 0
+_switch_interval: float = sys.getswitchinterval()
+
+
+def make_profile_token(user_pk: int) -> str:
+    """Return the token allowing the staff user to profile requests for an hour."""
+    return signing.dumps(user_pk, salt=PROFILE_SALT)
+
+
+def get_profile_token(request: HttpRequest) -> Optional[str]:
+    """
+    Return the profiling token of the request, if any.
+
+    The query string is only parsed if it contains the parameter, so the
+    check costs nothing to the other requests.
+    """
+    token: Optional[str] = request.META.get(PROFILE_HEADER)
+    if token is None and PROFILE_PARAMETER + "=" in request.META.get(
+        "QUERY_STRING", ""
+    ):
+        token = request.GET.get(PROFILE_PARAMETER)
+    return token
+
+
+def is_profiling_allowed(request: HttpRequest, token: str) -> bool:
+    """Return True if the token is valid and was made for the staff user."""
+    try:
+        user_pk = signing.loads(token, salt=PROFILE_SALT, max_age=TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    user = getattr(request, "user", None)
+    return (
+        user is not None
+        and user.is_authenticated
+        and user.is_staff
+        and user.pk == user_pk
+    )
+
+
+def frame_name(code) -> str:
+    """Name of a frame in the collapsed stacks, e.g. ``get (views.py:12)``."""
+    return "{function} ({path}:{line})".format(
+        function=code.co_name,
+        path="/".join(code.co_filename.rsplit("/", 2)[-2:]),
+        line=code.co_firstlineno,
+    )
+
+
+class StackSampler:
+    """
+    Sample the stack of a thread at a fixed interval from another thread.
+
+    Only the profiled thread is slowed down, and only by the sampling
+    itself, unlike a deterministic profiler tracing every call. The thread
+    switch interval of the interpreter is lowered to the sampling interval
+    while sampling, otherwise the sampler would only get the GIL every 5 ms.
+    Overlapping samplers share the lowered interval, it is restored when the
+    last one exits.
+    """
+
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL) -> None:
+        """
+        Initialize the sampler.
+
+        Args:
+            thread_id (int): Identifier of the sampled thread.
+            interval (float, optional): Time between samples in seconds.
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+
+    def __enter__(self) -> "StackSampler":
+        global _active_samplers, _switch_interval
+        with _switch_lock:
+            if not _active_samplers:
+                _switch_interval = sys.getswitchinterval()
+            _active_samplers += 1
+            sys.setswitchinterval(min(sys.getswitchinterval(), self.interval))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        global _active_samplers
+        self._stop.set()
+        self._thread.join()
+        with _switch_lock:
+            _active_samplers -= 1
+            if not _active_samplers:
+                sys.setswitchinterval(_switch_interval)
+
+    def run(self) -> None:
+        """Take the samples until stopped, in the sampler thread."""
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names: List[str] = []
+            while frame is not None:
+                names.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                self.stacks[tuple(reversed(names))] += 1
+
+    def collapsed(self) -> str:
+        """Return the stacks in the collapsed format, one ``a;b;c count`` per line."""
+        return "".join(
+            "{stack} {count}\n".format(stack=";".join(stack), count=count)
+            for stack, count in self.stacks.most_common()
+        )
+
+    def summary(self, title: str, top: int = TOP_FUNCTIONS) -> str:
+        """
+        Return the functions with the most samples.
+
+        Args:
+            title (str): First line of the summary.
+            top (int, optional): Number of functions listed. Defaults to TOP_FUNCTIONS.
+
+        Returns:
+            str: A table of the self and total samples of the functions.
+        """
+        total: int = sum(self.stacks.values())
+        own: Counter = Counter()
+        inclusive: Counter = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack):
+                inclusive[name] += count
+
+        lines: List[str] = [
+            title,
+            "{total} samples every {interval:g}s".format(
+                total=total, interval=self.interval
+            ),
+            "",
+            "{:>8} {:>7} {:>8} {:>7}  function".format(
+                "self", "self%", "total", "total%"
+            ),
+        ]
+        rows: List[Tuple[str, int]] = sorted(
+            inclusive.items(), key=lambda row: (-own[row[0]], -row[1])
+        )
+        for name, count in rows[:top]:
+            lines.append(
+                "{own:>8} {own_share:>6.1%} {count:>8} {share:>6.1%}  {name}".format(
+                    own=own[name],
+                    own_share=own[name] / total if total else 0,
+                    count=count,
+                    share=count / total if total else 0,
+                    name=name,
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+
+def save_profile(request: HttpRequest, sampler: StackSampler, elapsed: float) -> str:
+    """
+    Store the profile of a request under ``MEDIA_ROOT``.
+
+    Args:
+        request (HttpRequest): The profiled request.
+        sampler (StackSampler): The sampler of the request.
+        elapsed (float): Processing time of the request in seconds.
+
+    Returns:
+        str: Storage name of the collapsed stacks, the summary has the same
+            name with a ``.txt`` extension.
+    """
+    name: str = "{directory}/{time:%Y%m%d-%H%M%S}-{uid}".format(
+        directory=PROFILE_DIRECTORY, time=datetime.now(), uid=uuid4().hex[:8]
+    )
+    title: str = "{method} {path} in {elapsed:.3f}s".format(
+        method=request.method, path=request.path, elapsed=elapsed
+    )
+    stacks_name: str = default_storage.save(
+        name + ".collapsed", ContentFile(sampler.collapsed().encode())
+    )
+    default_storage.save(name + ".txt", ContentFile(sampler.summary(title).encode()))
+    return stacks_name
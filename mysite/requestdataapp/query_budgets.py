@@ -0,0 +1,141 @@
+"""
+Per-view query budgets and N+1 query detection.
+
+The budgets are the maximum number of queries of a request by URL name,
+checked in next to the code in the file of the ``QUERY_BUDGETS`` setting.
+Independently of the budgets, a query shape repeated within one request
+(the same SQL with other values, typically a related object fetched for
+every row of a list) is reported as an N+1 query.
+"""
+
+import json
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .instrumentation import RequestStats, collect_stats
+
+# Shown for the repeated shapes, the SQL of a list can be long.
+SHAPE_LENGTH: int = 300
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised instead of logging the violations when ``RAISE`` is set."""
+
+
+@lru_cache(maxsize=None)
+def load_budgets(path: str) -> Dict[str, int]:
+    """
+    Load a budget file, once per process.
+
+    Args:
+        path (str): Path of a JSON object mapping URL names to their maximum
+            number of queries.
+
+    Returns:
+        Dict[str, int]: The budgets, empty if the file does not exist.
+
+    Raises:
+        ImproperlyConfigured: If the file is not such a JSON object.
+    """
+    try:
+        budgets = json.loads(Path(path).read_text())
+    except FileNotFoundError:
+        return {}
+    except ValueError as error:
+        raise ImproperlyConfigured(
+            "Invalid query budget file {path}: {error}".format(path=path, error=error)
+        )
+    if not isinstance(budgets, dict) or not all(
+        isinstance(budget, int) for budget in budgets.values()
+    ):
+        raise ImproperlyConfigured(
+            "Query budget file {path} must map URL names to numbers of "
+            "queries".format(path=path)
+        )
+    return budgets
+
+
+def get_budget(view_name: str) -> Optional[int]:
+    """Return the query budget of the URL name, None if it has none."""
+    return load_budgets(str(settings.QUERY_BUDGETS["FILE"])).get(view_name)
+
+
+def find_violations(
+    stats: RequestStats, view_name: str, budget: Optional[int] = None
+) -> List[str]:
+    """
+    Check the queries of a request against the budget of its view.
+
+    Args:
+        stats (RequestStats): The statistics of the request.
+        view_name (str): URL name of the view.
+        budget (Optional[int]): Maximum number of queries, read from the
+            budget file if not given.
+
+    Returns:
+        List[str]: One message per violation, empty if there is none.
+    """
+    violations: List[str] = []
+    if budget is None:
+        budget = get_budget(view_name)
+    if budget is not None and stats.db_queries > budget:
+        violations.append(
+            "{view}: {count} queries, the budget is {budget}".format(
+                view=view_name, count=stats.db_queries, budget=budget
+            )
+        )
+    threshold: int = settings.QUERY_BUDGETS["REPEATED_QUERIES"]
+    for shape, count in stats.repeated_queries(threshold).items():
+        violations.append(
+            "{view}: N+1 query, executed {count} times: {shape}".format(
+                view=view_name, count=count, shape=shape[:SHAPE_LENGTH]
+            )
+        )
+    return violations
+
+
+class QueryBudgetTestMixin:
+    """
+    TestCase mixin failing the tests whose requests exceed their budgets.
+
+    ``QueryBudgetMiddleware`` raises ``QueryBudgetExceeded`` in the tests of
+    the class instead of logging, and ``assertQueryBudget()`` checks code
+    called outside of a request.
+    """
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        from django.test.utils import override_settings
+
+        super().setUpClass()
+        override = override_settings(
+            QUERY_BUDGETS={**settings.QUERY_BUDGETS, "RAISE": True}
+        )
+        override.enable()
+        cls.addClassCleanup(override.disable)
+
+    @contextmanager
+    def assertQueryBudget(
+        self, view_name: str, budget: Optional[int] = None
+    ) -> Iterator[RequestStats]:
+        """
+        Fail if the block exceeds the budget or repeats a query shape.
+
+        Args:
+            view_name (str): URL name whose budget applies.
+            budget (Optional[int]): Maximum number of queries, read from the
+                budget file if not given.
+
+        Yields:
+            RequestStats: The statistics of the queries of the block.
+        """
+        with collect_stats() as stats:
+            yield stats
+        violations: List[str] = find_violations(stats, view_name, budget)
+        if violations:
+            self.fail("\n".join(violations))
@@ -0,0 +1,249 @@
+"""
+Structured, sampled and non-blocking logging of the requests.
+
+The loguru records are put on a bounded in-process queue and written by a
+background thread as one JSON object per line, so the requests never wait
+for stdout (and the Docker Loki driver behind it). Successful requests are only logged
+for a sample, whose rate can be set per route; errors are always logged.
+
+Slow requests are always logged too, as one ``slow_request`` event with the
+breakdown of their time. The Docker Loki driver only promotes the ``level``
+and ``event`` fields to labels, the other fields are parsed at query time
+with ``| json``, so the number of streams stays small.
+"""
+
+import atexit
+import json
+import os
+import random
+import sys
+import traceback
+from queue import Full, Queue
+from threading import Lock, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, List, Optional, TextIO
+
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from loguru import logger as log
+
+from .instrumentation import RequestStats
+
+# Number of query shapes, by total time, in the slow request records.
+SLOWEST_QUERIES: int = 3
+
+
+class JsonSink:
+    """Loguru sink writing every record as a JSON line."""
+
+    def __init__(self, stream: TextIO) -> None:
+        """
+        Initialize the sink.
+
+        Args:
+            stream (TextIO): Where the lines are written.
+        """
+        self.stream = stream
+
+    def __call__(self, message) -> None:
+        record: Dict[str, Any] = message.record
+        entry: Dict[str, Any] = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "logger": record["name"],
+            "message": record["message"],
+            **record["extra"],
+        }
+        if record["exception"] is not None:
+            entry["exception"] = "".join(
+                traceback.format_exception(
+                    record["exception"].type,
+                    record["exception"].value,
+                    record["exception"].traceback,
+                )
+            )
+        self.stream.write(json.dumps(entry, default=str) + "\n")
+        self.stream.flush()
+
+
+class QueueSink:
+    """
+    Loguru sink handing the records to another sink in a background thread.
+
+    Logging only puts the record on a bounded queue: when the writer cannot
+    keep up, the records are dropped and counted instead of blocking the
+    requests. The loguru ``enqueue`` option is not used because it pickles
+    every record through a pipe, which costs more than writing the line.
+    """
+
+    def __init__(self, sink: Callable, maxsize: int = 10000) -> None:
+        """
+        Initialize the sink.
+
+        Args:
+            sink (Callable): The sink writing the records.
+            maxsize (int, optional): Maximum number of queued records. Defaults to 10000.
+        """
+        self.sink = sink
+        self.maxsize = maxsize
+        self.queue: Queue = Queue(maxsize)
+        self.dropped: int = 0
+        self.lock = Lock()
+        self._pid: Optional[int] = None
+        atexit.register(self.complete)
+
+    def __call__(self, message) -> None:
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        """Start the writer thread, again in every forked worker."""
+        with self.lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = Queue(self.maxsize)
+            Thread(target=self.run, name="log-writer", daemon=True).start()
+            self._pid = os.getpid()
+
+    def run(self) -> None:
+        """Write the queued records, in the writer thread."""
+        while True:
+            message = self.queue.get()
+            try:
+                self.sink(message)
+            except Exception as error:
+                sys.stderr.write("Log record lost: {error}\n".format(error=error))
+            finally:
+                self.queue.task_done()
+
+    def complete(self, timeout: float = 5.0) -> None:
+        """Wait until the queued records are written, at most ``timeout`` seconds."""
+        if self._pid != os.getpid():
+            return
+        deadline: float = monotonic() + timeout
+        while self.queue.unfinished_tasks and monotonic() < deadline:
+            sleep(0.01)
+
+
+def configure_logging() -> None:
+    """
+    Replace the default loguru handler with the JSON sink, queued if the
+    ``ENQUEUE`` option of ``REQUEST_LOGGING`` is set.
+
+    Called once, when the application is ready.
+    """
+    sink: Callable = JsonSink(sys.stdout)
+    if settings.REQUEST_LOGGING.get("ENQUEUE", True):
+        sink = QueueSink(sink)
+    log.remove()
+    log.add(sink, level=settings.LOGLEVEL, format="{message}")
+
+
+class RequestSampler:
+    """
+    Decide which requests are logged from the sample rates of their routes.
+
+    The rates are looked up by URL name, then by URL namespace (``"shopapp:*"``),
+    then ``"default"``, and memoized per URL name.
+    """
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        """
+        Initialize the sampler.
+
+        Args:
+            rates (Dict[str, float]): Share of the requests to log, between 0
+                and 1, by URL name, namespace pattern or "default".
+        """
+        self.rates = rates
+        self.resolved: Dict[str, float] = {}
+
+    def get_rate(self, view_name: str) -> float:
+        """Return the sample rate of the URL name."""
+        rate: Optional[float] = self.resolved.get(view_name)
+        if rate is None:
+            namespace: str = view_name.rpartition(":")[0]
+            rate = self.rates.get(
+                view_name,
+                self.rates.get(
+                    "{namespace}:*".format(namespace=namespace),
+                    self.rates.get("default", 1.0),
+                ),
+            )
+            self.resolved[view_name] = rate
+        return rate
+
+    def is_sampled(self, view_name: str) -> bool:
+        """Return True if a request of the URL name should be logged."""
+        rate: float = self.get_rate(view_name)
+        return rate >= 1 or random.random() < rate
+
+
+def log_request(
+    request: HttpRequest,
+    response: HttpResponse,
+    view_name: str,
+    elapsed: float,
+    **fields: Any,
+) -> None:
+    """
+    Log a processed request, as an error if it has failed.
+
+    Args:
+        request (HttpRequest): The processed request.
+        response (HttpResponse): Its response.
+        view_name (str): URL name of the view.
+        elapsed (float): Processing time in seconds.
+        **fields (Any): Additional structured fields.
+    """
+    failed: bool = response.status_code >= 500
+    log.bind(
+        event="request",
+        method=request.method,
+        path=request.path,
+        view=view_name,
+        status=response.status_code,
+        duration_ms=round(elapsed * 1000, 3),
+        user_agent=request.META.get("HTTP_USER_AGENT", ""),
+        **fields,
+    ).log("ERROR" if failed else "INFO", "request")
+
+
+def log_slow_request(
+    request: HttpRequest,
+    response: HttpResponse,
+    view_name: str,
+    elapsed: float,
+    stats: RequestStats,
+) -> None:
+    """
+    Log a request slower than the ``SLOW_REQUEST_SECONDS`` of ``REQUEST_LOGGING``.
+
+    Args:
+        request (HttpRequest): The processed request.
+        response (HttpResponse): Its response.
+        view_name (str): URL name of the view.
+        elapsed (float): Processing time in seconds.
+        stats (RequestStats): The statistics of the request.
+    """
+    slowest_queries: List[Dict[str, Any]] = [
+        {"sql": shape, "time_ms": round(query_time * 1000, 3), "count": count}
+        for shape, query_time, count in stats.slowest_queries(SLOWEST_QUERIES)
+    ]
+    log.bind(
+        event="slow_request",
+        method=request.method,
+        path=request.path,
+        view=view_name,
+        status=response.status_code,
+        duration_ms=round(elapsed * 1000, 3),
+        db_queries=stats.db_queries,
+        db_time_ms=round(stats.db_time * 1000, 3),
+        slowest_queries=slowest_queries,
+        cache_misses=stats.cache_misses,
+        tier=getattr(request, "user_tier", "unknown"),
+    ).warning("slow request")
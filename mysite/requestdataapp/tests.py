@@ -1,3 +1,1151 @@
-from django.test import TestCase
+import json
+import os
+import pickle
+import sys
+from io import StringIO
+from queue import Empty, Queue
+from tempfile import TemporaryDirectory
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+from threading import Event, Thread, get_ident
+from time import perf_counter, sleep
+from typing import Any, Dict, List, Optional
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.management import call_command
+from django.http import HttpRequest, HttpResponse
+from django.contrib.auth.models import User
+from rest_framework.authtoken.models import Token
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import translation
+from redis import Redis
+from django_redis.cache import RedisCache
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from django.core.cache import cache
+from loguru import logger as log
+
+from .cache_stats import key_namespace, namespace_stats
+from .circuit_breaker import CircuitBreaker, CircuitBreakerRedisCache, _states
+from .cache_encoding import COMPRESSED, SERIALIZER_IDS, EncodingClient
+from .instrumentation import RequestStats, collect_stats, fingerprint_sql
+from .metrics import MetricsRegistry
+from .middlewares import ThrottlingMiddleware, set_useragent_on_request_middleware
+from .profiling import StackSampler, make_profile_token
+from .query_budgets import QueryBudgetExceeded, QueryBudgetTestMixin
+from .request_logging import (
+    JsonSink,
+    QueueSink,
+    RequestSampler,
+    log_request,
+    log_slow_request,
+)
+from .throttling import LocalRateLimiter, RedisRateLimiter
+from .two_tier_cache import LocalTier, TwoTierRedisCache
+from .user_agents import _parse, parse_user_agent
+
+
+class LocalPubSub:
+    """Stand-in for a Redis pub/sub connection of ``LocalRedis``."""
+
+    def __init__(self, redis: "LocalRedis") -> None:
+        self.redis = redis
+        self.messages: Queue = Queue()
+
+    def subscribe(self, channel: str) -> None:
+        self.redis.subscribers.setdefault(channel, []).append(self.messages)
+
+    def get_message(self, timeout: float = 0.0):
+        try:
+            return self.messages.get(timeout=timeout)
+        except Empty:
+            return None
+
+
+class LocalRedis:
+    """
+    Stand-in for a Redis client that runs the token bucket script in Python.
+
+    The buckets live in a dict shared by every limiter using the instance,
+    like a Redis server shared by several workers, and the clock is manual.
+    The plain keys and the pub/sub channels used by the caches are supported
+    too, without expiration.
+    """
+
+    def __init__(self) -> None:
+        self.buckets: Dict[str, Dict[str, float]] = {}
+        self.hashes: Dict[str, Dict[bytes, bytes]] = {}
+        self.values: Dict[str, bytes] = {}
+        self.subscribers: Dict[str, List[Queue]] = {}
+        self.reads: int = 0
+        self.now: float = 1000.0
+
+    def get(self, key: str) -> Any:
+        self.reads += 1
+        return self.values.get(key)
+
+    def mget(self, *keys: str) -> List[Any]:
+        self.reads += 1
+        return [self.values.get(key) for key in keys]
+
+    def set(self, key: str, value: Any, nx: bool = False, **kwargs) -> bool:
+        if nx and key in self.values:
+            return False
+        self.values[key] = value if isinstance(value, bytes) else str(value).encode()
+        return True
+
+    def delete(self, *keys: str) -> int:
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def publish(self, channel: str, message: str) -> None:
+        for messages in self.subscribers.get(channel, []):
+            messages.put({"type": "message", "data": message.encode()})
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> LocalPubSub:
+        return LocalPubSub(self)
+
+    def pipeline(self, transaction: bool = True) -> "LocalRedis":
+        return self
+
+    def execute(self) -> None:
+        pass
+
+    def hincrbyfloat(self, name: str, key: str, amount: float) -> None:
+        values = self.hashes.setdefault(name, {})
+        values[key.encode()] = str(float(values.get(key.encode(), 0)) + amount).encode()
+
+    def hgetall(self, name: str) -> Dict[bytes, bytes]:
+        return dict(self.hashes.get(name, {}))
+
+    def register_script(self, script: str):
+        def run(keys: List[str], args: List[Any]) -> List[Any]:
+            capacity, rate = float(args[0]), float(args[1])
+            bucket = self.buckets.get(
+                keys[0], {"tokens": capacity, "timestamp": self.now}
+            )
+            tokens = min(
+                capacity,
+                bucket["tokens"] + max(0.0, self.now - bucket["timestamp"]) * rate,
+            )
+            allowed, retry_after = 0, 0.0
+            if tokens >= 1:
+                tokens -= 1
+                allowed = 1
+            else:
+                retry_after = (1 - tokens) / rate
+            self.buckets[keys[0]] = {"tokens": tokens, "timestamp": self.now}
+            return [allowed, str(retry_after)]
+
+        return run
+
+
+class PausableRedisHandler(StreamRequestHandler):
+    """Connection of ``PausableRedisServer``, speaking the Redis protocol."""
+
+    def read_command(self) -> Optional[List[bytes]]:
+        line: bytes = self.rfile.readline()
+        if not line:
+            return None
+        command: List[bytes] = []
+        for _ in range(int(line[1:])):
+            size: int = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(size + 2)[:-2])
+        return command
+
+    def handle(self) -> None:
+        while True:
+            command: Optional[List[bytes]] = self.read_command()
+            if command is None:
+                return
+            # A paused server reads the commands and answers them once resumed.
+            self.server.running.wait()
+            try:
+                self.wfile.write(self.server.execute(command))
+            except OSError:
+                return
+
+
+class PausableRedisServer(ThreadingTCPServer):
+    """
+    Stand-in Redis server on a local port, for GET, MGET, SET and DEL,
+    which stops answering while paused like a stalled Redis.
+    """
+
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), PausableRedisHandler)
+        self.values: Dict[bytes, bytes] = {}
+        self.running = Event()
+        self.running.set()
+        Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        # RESP2, like the Redis servers of the deployments.
+        return "redis://127.0.0.1:{port}/0?protocol=2".format(
+            port=self.server_address[1]
+        )
+
+    def pause(self) -> None:
+        self.running.clear()
+
+    def resume(self) -> None:
+        self.running.set()
+
+    def stop(self) -> None:
+        self.resume()
+        self.shutdown()
+        self.server_close()
+
+    @staticmethod
+    def reply(value: Any) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def execute(self, command: List[bytes]) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        if name == b"GET":
+            return self.reply(self.values.get(args[0]))
+        if name == b"MGET":
+            return b"*%d\r\n" % len(args) + b"".join(
+                self.reply(self.values.get(key)) for key in args
+            )
+        if name == b"SET":
+            if b"NX" in map(bytes.upper, args[2:]) and args[0] in self.values:
+                return self.reply(None)
+            self.values[args[0]] = args[1]
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return self.reply(
+                sum(self.values.pop(key, None) is not None for key in args)
+            )
+        # CLIENT SETINFO, SELECT...
+        return b"+OK\r\n"
+
+
+class RedisRateLimiterTestCase(SimpleTestCase):
+    """
+    Test case for the token bucket rate limiter.
+    """
+
+    def test_limit_and_refill(self) -> None:
+        redis = LocalRedis()
+        limiter = RedisRateLimiter(limit=3, period=30, client=redis)
+
+        self.assertEqual(
+            [limiter.hit("1.2.3.4")[0] for _ in range(4)], [True, True, True, False]
+        )
+        self.assertAlmostEqual(limiter.hit("1.2.3.4")[1], 10.0)
+        self.assertTrue(limiter.hit("5.6.7.8")[0])
+
+        redis.now += 10
+        self.assertEqual(limiter.hit("1.2.3.4"), (True, 0.0))
+        self.assertFalse(limiter.hit("1.2.3.4")[0])
+
+    def test_limit_is_shared_by_workers(self) -> None:
+        redis = LocalRedis()
+        factory = RequestFactory()
+        workers = [
+            ThrottlingMiddleware(lambda request: HttpResponse()) for _ in range(2)
+        ]
+        for worker in workers:
+            worker.policies[-1].limiters["anonymous"] = RedisRateLimiter(
+                limit=3, period=30, client=redis
+            )
+
+        statuses: List[int] = []
+        for number in range(4):
+            request: HttpRequest = factory.get("/en/req/get/")
+            with translation.override("en"):
+                request.resolver_match = resolve(request.path_info)
+            response = workers[number % 2].process_view(
+                request, request.resolver_match.func, (), {}
+            )
+            statuses.append(response.status_code if response else 200)
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+    @staticmethod
+    def fail_with_connection_error(keys: List[str], args: List[Any]) -> List[Any]:
+        raise RedisConnectionError("Connection refused")
+
+    def test_falls_back_without_redis(self) -> None:
+        redis = LocalRedis()
+        redis.register_script = lambda script: self.fail_with_connection_error
+        limiter = RedisRateLimiter(limit=1, period=30, client=redis)
+        self.assertTrue(limiter.is_allowed("1.2.3.4"))
+        self.assertTrue(limiter.is_allowed("1.2.3.4"))
+
+        limiter = RedisRateLimiter(
+            limit=1,
+            period=30,
+            client=redis,
+            fallback=LocalRateLimiter(limit=1, period=30),
+        )
+        self.assertTrue(limiter.is_allowed("1.2.3.4"))
+        self.assertFalse(limiter.is_allowed("1.2.3.4"))
+        # Redis is not queried again until the retry interval has passed.
+        redis.register_script = lambda script: self.fail("Redis was queried")
+        limiter._script = None
+        self.assertFalse(limiter.is_allowed("1.2.3.4"))
+
+    def test_script_on_local_redis(self) -> None:
+        client = Redis(host="localhost", port=6379, db=15, socket_connect_timeout=0.1)
+        try:
+            client.ping()
+        except RedisConnectionError:
+            self.skipTest("No Redis server on localhost:6379")
+        limiter = RedisRateLimiter(
+            limit=2, period=60, client=client, prefix="test_throttle"
+        )
+        client.delete("test_throttle:1.2.3.4")
+
+        self.assertEqual(
+            [limiter.hit("1.2.3.4")[0] for _ in range(3)], [True, True, False]
+        )
+        self.assertGreater(limiter.hit("1.2.3.4")[1], 0)
+        self.assertLessEqual(client.pttl("test_throttle:1.2.3.4"), 60000)
+        client.delete("test_throttle:1.2.3.4")
+
+
+class LocalRateLimiterTestCase(SimpleTestCase):
+    """
+    Test case for the bounded in-process rate limiter.
+    """
+
+    def test_limit_and_refill(self) -> None:
+        now = [0.0]
+        limiter = LocalRateLimiter(limit=3, period=30, clock=lambda: now[0])
+
+        self.assertEqual(
+            [limiter.is_allowed("1.2.3.4") for _ in range(4)],
+            [True, True, True, False],
+        )
+        self.assertAlmostEqual(limiter.hit("1.2.3.4")[1], 10.0)
+        now[0] += 10
+        self.assertTrue(limiter.is_allowed("1.2.3.4"))
+        self.assertFalse(limiter.is_allowed("1.2.3.4"))
+
+    def test_memory_is_bounded_under_ip_spray(self) -> None:
+        limiter = LocalRateLimiter(limit=1, period=30, max_entries=100)
+        limiter.is_allowed("10.0.0.1")
+        for number in range(10000):
+            limiter.is_allowed("10.{0}.{1}.{2}".format(*number.to_bytes(3, "big")))
+            # The active client stays in the store while the others are evicted.
+            if number % 50 == 0:
+                self.assertFalse(limiter.is_allowed("10.0.0.1"))
+        self.assertEqual(len(limiter.buckets), 100)
+        self.assertIn("10.0.0.1", limiter.buckets)
+
+
+@override_settings(
+    THROTTLING={
+        "DEFAULT_RATES": {
+            "anonymous": "3/m",
+            "authenticated": "5/m",
+            "token": "4/m",
+            "staff": None,
+        },
+        "POLICIES": [
+            {
+                "name": "strict",
+                "url_names": ["requestdataapp:user-form"],
+                "rates": {"anonymous": "1/m"},
+            },
+            {
+                "name": "api",
+                "path_prefixes": ["/api/"],
+                "rates": {"anonymous": "2/m"},
+            },
+        ],
+    }
+)
+class ThrottlingPoliciesTestCase(TestCase):
+    """
+    Test case for the per-route and per-tier policies of ThrottlingMiddleware.
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+
+    def get_statuses(self, url: str, count: int, **headers) -> List[int]:
+        return [self.client.get(url, headers=headers).status_code for _ in range(count)]
+
+    def test_anonymous_default_rate(self) -> None:
+        statuses = self.get_statuses(reverse("requestdataapp:get-view"), 4)
+        self.assertEqual(statuses, [200, 200, 200, 429])
+
+        response = self.client.get(reverse("shopapp:index"))
+        self.assertEqual(response.status_code, 429)
+        self.assertContains(response, "exceeded the request limit", status_code=429)
+        self.assertGreaterEqual(int(response["Retry-After"]), 1)
+
+    def test_policies_by_url_name_and_prefix(self) -> None:
+        self.assertEqual(
+            self.get_statuses(reverse("requestdataapp:user-form"), 2), [200, 429]
+        )
+        self.assertEqual(self.get_statuses(reverse("myapiapp:hello_world"), 3)[-1], 429)
+        # The policies count separately from the default one.
+        self.assertEqual(
+            self.client.get(reverse("requestdataapp:get-view")).status_code, 200
+        )
+
+    def test_user_tiers(self) -> None:
+        url: str = reverse("requestdataapp:get-view")
+        user: User = User.objects.create_user(username="user", password="password")
+        self.client.force_login(user)
+        self.assertEqual(self.get_statuses(url, 6)[-2:], [200, 429])
+
+        user.is_staff = True
+        user.save()
+        self.assertEqual(set(self.get_statuses(url, 10)), {200})
+
+        self.client.logout()
+        token: Token = Token.objects.get_or_create(user=user)[0]
+        statuses = self.get_statuses(
+            url, 5, authorization="Token {key}".format(key=token.key)
+        )
+        self.assertEqual(statuses[-2:], [200, 429])
+
+    def test_invalid_tokens_are_anonymous(self) -> None:
+        url: str = reverse("requestdataapp:get-view")
+        statuses: List[int] = [
+            self.client.get(
+                url, headers={"authorization": "Token {key}".format(key=key)}
+            ).status_code
+            for key in ("fake1", "fake2", "fake3", "fake4")
+        ]
+        self.assertEqual(statuses, [200, 200, 200, 429])
+        self.assertEqual(
+            self.client.get(url, headers={"authorization": "Bearer fake"}).status_code,
+            429,
+        )
+
+
+class MetricsTestCase(TestCase):
+    """
+    Test case for the request metrics and the Prometheus endpoint.
+    """
+
+    def test_registries_are_aggregated_through_redis(self) -> None:
+        redis = LocalRedis()
+        workers = [MetricsRegistry(client=redis) for _ in range(2)]
+        for worker in workers:
+            worker.inc("django_requests_total")
+            worker.observe(
+                "django_request_duration_seconds", 0.2, labels={"view": "a:b"}
+            )
+            worker.flush(force=True)
+
+        content: str = workers[0].render()
+        self.assertIn("# TYPE django_requests_total counter\n", content)
+        self.assertIn("django_requests_total 2.0\n", content)
+        self.assertIn(
+            'django_request_duration_seconds_bucket{view="a:b",le="0.1"} 0.0', content
+        )
+        self.assertIn(
+            'django_request_duration_seconds_bucket{view="a:b",le="0.25"} 2.0', content
+        )
+        self.assertIn('django_request_duration_seconds_count{view="a:b"} 2.0', content)
+        self.assertLess(content.index('le="0.5"'), content.index('le="10.0"'))
+        self.assertLess(content.index('le="10.0"'), content.index('le="+Inf"'))
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "requestdataapp.instrumentation.InstrumentedLocMemCache"
+            }
+        }
+    )
+    def test_cache_lookups_are_recorded(self) -> None:
+        cache.set("metrics-test", 1)
+        with collect_stats() as stats:
+            cache.get("metrics-test")
+            cache.get("metrics-test-missing")
+            cache.get_many(["metrics-test", "metrics-test-missing"])
+            User.objects.count()
+        self.assertEqual((stats.cache_hits, stats.cache_misses), (2, 2))
+        self.assertEqual(stats.db_queries, 1)
+
+    def test_flushes_skipped_while_redis_fails(self) -> None:
+        now: List[float] = [0.0]
+        client = mock.Mock()
+        client.pipeline.return_value.execute.side_effect = RedisConnectionError()
+        registry = MetricsRegistry(
+            client=client,
+            breaker=CircuitBreaker(
+                failure_threshold=2, reset_timeout=10, clock=lambda: now[0]
+            ),
+        )
+        for _ in range(4):
+            registry.inc("django_requests_total")
+            registry.flush(force=True)
+        self.assertEqual(client.pipeline.return_value.execute.call_count, 2)
+        self.assertEqual(registry.pending, {"django_requests_total": 4})
+
+        client.pipeline.return_value.execute.side_effect = None
+        now[0] = 10.0
+        registry.flush(force=True)
+        self.assertEqual(client.pipeline.return_value.execute.call_count, 3)
+        self.assertEqual(registry.pending, {})
+        self.assertEqual(registry.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_metrics_endpoint(self) -> None:
+        translation.activate("en")
+        registry = MetricsRegistry(client=LocalRedis())
+        for module in ("middlewares", "views"):
+            patcher = mock.patch("requestdataapp.{}.registry".format(module), registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client.get(reverse("requestdataapp:get-view"))
+
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'django_db_queries_total{view="requestdataapp:get-view"}',
+            response.content.decode(),
+        )
+
+        response = self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1")
+        self.assertEqual(response.status_code, 403)
+
+
+class CacheStatsTestCase(TestCase):
+    """
+    Test case for the cache usage by key namespace.
+    """
+
+    def setUp(self) -> None:
+        registry = MetricsRegistry(client=LocalRedis())
+        patcher = mock.patch("requestdataapp.cache_stats.registry", registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_key_namespace(self) -> None:
+        self.assertEqual(
+            key_namespace("computed:user_12_orders_data_export"),
+            "computed:user_*_orders_data_export",
+        )
+        self.assertEqual(
+            key_namespace("computed:products_list:0a1b"), "computed:products_list"
+        )
+        self.assertEqual(
+            key_namespace("template.cache.order_info.0a1b"), "fragment:order_info"
+        )
+        self.assertEqual(key_namespace("page:0a1b"), "page")
+        self.assertEqual(key_namespace("cache_tag:order:3"), "cache_tag")
+
+    @override_settings(
+        CACHES={
+            "default": {
+                "BACKEND": "requestdataapp.instrumentation.InstrumentedLocMemCache"
+            }
+        }
+    )
+    def test_operations_by_namespace(self) -> None:
+        cache.set_many({"orders:1": 1, "orders:2": 2})
+        cache.get("orders:1")
+        cache.get_many(["orders:2", "orders:3"])
+        cache.delete("orders:1")
+        cache.set("unused:1", 1)
+
+        stats = namespace_stats()
+        self.assertEqual(stats["orders"]["hits"], 2)
+        self.assertEqual(stats["orders"]["misses"], 1)
+        self.assertEqual(stats["orders"]["sets"], 2)
+        self.assertEqual(stats["orders"]["deletes"], 1)
+        self.assertAlmostEqual(stats["orders"]["hit_ratio"], 2 / 3)
+        self.assertGreater(stats["orders"]["get_ms"], 0)
+
+        stdout = StringIO()
+        call_command("cache_stats", stdout=stdout)
+        self.assertIn("never hit", stdout.getvalue().split("unused")[1])
+
+    def test_endpoint_is_staff_only(self) -> None:
+        translation.activate("en")
+        url: str = reverse("requestdataapp:cache-stats")
+        user: User = User.objects.create_user(username="user")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("namespaces", response.json())
+
+
+class TwoTierCacheTestCase(SimpleTestCase):
+    """
+    Test case for the in-process tier of the Redis cache.
+    """
+
+    def make_cache(self, redis: LocalRedis, worker: str) -> TwoTierRedisCache:
+        """Create the cache of a worker, on a server shared with the others."""
+        cache = TwoTierRedisCache(
+            "redis://{test}-{worker}".format(test=self.id(), worker=worker),
+            {"OPTIONS": {"LOCAL_CACHE": {"TIMEOUT": 60}}},
+        )
+        cache.client._clients = [redis]
+        cache.local_tier_enabled()
+        self.assertTrue(cache.state.subscribed.wait(1))
+        return cache
+
+    def wait_for(self, condition) -> None:
+        for _ in range(100):
+            if condition():
+                return
+            sleep(0.01)
+        self.fail("Condition not met")
+
+    def test_local_tier_bounds(self) -> None:
+        now = [0.0]
+        tier = LocalTier(
+            timeout=5,
+            max_entries=3,
+            max_bytes=100,
+            max_entry_bytes=60,
+            clock=lambda: now[0],
+        )
+        self.assertFalse(tier.set("big", "x", 61, tier.generation))
+        for key in ("a", "b", "c"):
+            self.assertTrue(tier.set(key, key, 30, tier.generation))
+        tier.get("a")
+        tier.set("d", "d", 30, tier.generation)
+        self.assertEqual(list(tier.entries), ["c", "a", "d"])
+        self.assertEqual(tier.size, 90)
+
+        generation: int = tier.generation
+        tier.invalidate(["c"])
+        self.assertFalse(tier.set("c", "old", 30, generation))
+        now[0] = 5.0
+        self.assertIsNot(tier.get("a"), "a")
+        self.assertEqual(tier.size, 30)
+
+    def test_reads_and_invalidations(self) -> None:
+        redis = LocalRedis()
+        worker_a = self.make_cache(redis, "a")
+        worker_b = self.make_cache(redis, "b")
+
+        worker_a.set("products", [1, 2])
+        self.assertEqual(worker_b.get("products"), [1, 2])
+        self.assertEqual(worker_b.get("products"), [1, 2])
+        self.assertEqual(redis.reads, 1)
+        self.assertEqual(worker_b.get("missing", "default"), "default")
+        self.assertEqual(
+            worker_b.get_many(["products", "missing"]), {"products": [1, 2]}
+        )
+
+        worker_a.set("products", [1, 2, 3])
+        self.wait_for(lambda: worker_b.get("products") == [1, 2, 3])
+        worker_a.delete("products")
+        self.wait_for(lambda: worker_b.get("products") is None)
+
+        stats = worker_b.tier_stats()
+        self.assertGreaterEqual(stats["local"]["hits"], 2)
+        self.assertGreaterEqual(stats["redis"]["misses"], 2)
+        self.assertGreater(stats["local"]["hit_ratio"], 0)
+
+    def test_local_tier_unused_while_unsubscribed(self) -> None:
+        redis = LocalRedis()
+        cache = self.make_cache(redis, "a")
+        cache.set("key", "value")
+        cache.state.subscribed.clear()
+        cache.get("key")
+        cache.get("key")
+        self.assertEqual(redis.reads, 2)
+        self.assertEqual(cache.tier_stats()["local"]["hits"], 0)
+
+
+class CircuitBreakerCacheTestCase(SimpleTestCase):
+    """
+    Test case for the failover of the Redis cache to a local cache.
+    """
+
+    def setUp(self) -> None:
+        self.server = PausableRedisServer()
+        self.addCleanup(self.server.stop)
+        self.addCleanup(_states.pop, self.server.url, None)
+        self.cache = CircuitBreakerRedisCache(
+            self.server.url,
+            {
+                "OPTIONS": {
+                    "SOCKET_CONNECT_TIMEOUT": 0.1,
+                    "SOCKET_TIMEOUT": 0.1,
+                    "LOCAL_CACHE": {"TIMEOUT": 0},
+                    "CIRCUIT_BREAKER": {"FAILURE_THRESHOLD": 2, "RESET_TIMEOUT": 60},
+                }
+            },
+        )
+        self.now = 0.0
+        self.cache.breaker.clock = lambda: self.now
+
+    def test_circuit_breaker_states(self) -> None:
+        breaker = CircuitBreaker(
+            failure_threshold=2, reset_timeout=10, clock=lambda: self.now
+        )
+        self.assertFalse(breaker.record_failure())
+        breaker.record_success()
+        self.assertFalse(breaker.record_failure())
+        self.assertTrue(breaker.record_failure())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        self.now = 10.0
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        self.assertTrue(breaker.record_failure())
+        self.assertFalse(breaker.allow())
+
+        self.now = 20.0
+        self.assertTrue(breaker.allow())
+        self.assertTrue(breaker.record_success())
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failover_and_recovery(self) -> None:
+        self.cache.set("product", "old")
+        self.assertEqual(self.cache.get("product"), "old")
+
+        self.server.pause()
+        started_at: float = perf_counter()
+        self.assertIsNone(self.cache.get("product"))
+        self.cache.set("product", "new")
+        self.assertLess(perf_counter() - started_at, 1.0)
+        self.assertEqual(self.cache.breaker.state, CircuitBreaker.OPEN)
+
+        # Redis is left alone while the circuit is open.
+        started_at = perf_counter()
+        for _ in range(10):
+            self.assertEqual(self.cache.get("product"), "new")
+        self.assertLess(perf_counter() - started_at, 0.1)
+
+        # A failed probe keeps the circuit open.
+        self.now = 60.0
+        self.assertEqual(self.cache.get("product"), "new")
+        self.assertEqual(self.cache.breaker.state, CircuitBreaker.OPEN)
+
+        # The probe closes the circuit, without reading back the old value.
+        self.server.resume()
+        self.now = 120.0
+        self.assertIsNone(self.cache.get("product"))
+        self.assertEqual(self.cache.breaker.state, CircuitBreaker.CLOSED)
+        self.assertNotIn(b":1:product", self.server.values)
+        self.cache.set("product", "newest")
+        self.assertEqual(self.cache.get("product"), "newest")
+
+
+class CacheEncodingTestCase(SimpleTestCase):
+    """
+    Test case for the serializers and the compression by key prefix.
+    """
+
+    def setUp(self) -> None:
+        self.redis = LocalRedis()
+        self.cache = RedisCache(
+            "redis://{test}".format(test=self.id()),
+            {
+                "OPTIONS": {
+                    "CLIENT_CLASS": "requestdataapp.cache_encoding.EncodingClient",
+                    "ENCODINGS": {
+                        "default": {"COMPRESS_MIN_BYTES": 1024},
+                        "export:": {"SERIALIZER": "json"},
+                        "export:raw:": {"SERIALIZER": "pickle"},
+                    },
+                }
+            },
+        )
+        self.cache.client._clients = [self.redis]
+
+    def stored(self, key: str) -> bytes:
+        return self.redis.values[self.cache.make_key(key)]
+
+    def test_prefixes(self) -> None:
+        client: EncodingClient = self.cache.client
+        self.assertEqual(
+            client.get_encoding("export:raw:x")[:2], ("export:raw:", "pickle")
+        )
+        self.assertEqual(client.get_encoding("export:x")[:2], ("export:", "json"))
+        self.assertEqual(client.get_encoding("other"), ("default", "pickle", 1024))
+
+        self.cache.set("export:rows", {"rows": [1, 2]})
+        self.assertEqual(self.stored("export:rows")[0], SERIALIZER_IDS["json"])
+        self.assertEqual(self.cache.get("export:rows"), {"rows": [1, 2]})
+        self.cache.set("export:raw:rows", {1, 2})
+        self.assertEqual(self.cache.get("export:raw:rows"), {1, 2})
+
+    def test_json_falls_back_to_pickle(self) -> None:
+        self.cache.set("export:set", {1, 2})
+        self.assertEqual(self.stored("export:set")[0], SERIALIZER_IDS["pickle"])
+        self.assertEqual(self.cache.get("export:set"), {1, 2})
+
+    def test_compression_threshold(self) -> None:
+        small, large = "x" * 100, "x" * 10000
+        self.cache.set_many({"small": small, "large": large})
+        self.assertEqual(self.stored("small")[0], SERIALIZER_IDS["pickle"])
+        self.assertEqual(self.stored("large")[0], SERIALIZER_IDS["pickle"] | COMPRESSED)
+        self.assertLess(len(self.stored("large")), 1000)
+        self.assertEqual(
+            self.cache.get_many(["small", "large"]), {"small": small, "large": large}
+        )
+
+    def test_integers_and_legacy_entries(self) -> None:
+        self.cache.set("counter", 1)
+        self.assertEqual(self.stored("counter"), b"1")
+        self.redis.values[self.cache.make_key("legacy")] = pickle.dumps(["old"])
+        self.assertEqual(self.cache.get("legacy"), ["old"])
+
+
+class QueryBudgetTestCase(QueryBudgetTestMixin, TestCase):
+    """
+    Test case for the N+1 query detection and the query budgets.
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+
+    def test_fingerprint_ignores_the_values(self) -> None:
+        self.assertEqual(
+            fingerprint_sql("SELECT * FROM t WHERE id = 1 AND name = 'a''b'"),
+            fingerprint_sql("SELECT  *\nFROM t WHERE id = %s AND name = %s"),
+        )
+        self.assertEqual(
+            fingerprint_sql("SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 21"),
+            "SELECT * FROM t WHERE id IN (...) LIMIT ?",
+        )
+
+    def test_repeated_queries_fail(self) -> None:
+        users = [User.objects.create(username="user{0}".format(i)) for i in range(5)]
+        with self.assertQueryBudget("users", budget=10):
+            User.objects.filter(pk__in=[user.pk for user in users]).count()
+            User.objects.get(pk=users[0].pk)
+
+        with self.assertRaisesMessage(AssertionError, "N+1 query, executed 5 times"):
+            with self.assertQueryBudget("users", budget=10):
+                for user in users:
+                    User.objects.get(pk=user.pk)
+
+        with self.assertRaisesMessage(AssertionError, "3 queries, the budget is 2"):
+            with self.assertQueryBudget("users", budget=2):
+                for user in users[:3]:
+                    User.objects.get(pk=user.pk)
+
+    def test_requests_over_budget_fail(self) -> None:
+        with TemporaryDirectory() as directory:
+            path: str = os.path.join(directory, "budgets.json")
+            with open(path, "w") as file:
+                json.dump({"requestdataapp:get-view": 0}, file)
+            budgets = {**settings.QUERY_BUDGETS, "FILE": path}
+            with override_settings(QUERY_BUDGETS=budgets):
+                self.client.get(reverse("requestdataapp:get-view"))
+
+            User.objects.create_user(username="reader", password="secret")
+            self.client.login(username="reader", password="secret")
+            with override_settings(QUERY_BUDGETS=budgets):
+                with self.assertRaises(QueryBudgetExceeded):
+                    self.client.get(reverse("requestdataapp:get-view"))
+            with override_settings(QUERY_BUDGETS={**budgets, "RAISE": False}):
+                response = self.client.get(reverse("requestdataapp:get-view"))
+            self.assertEqual(response.status_code, 200)
+
+
+@override_settings(SERVER_TIMING=True)
+class ServerTimingTestCase(TestCase):
+    """
+    Test case for the Server-Timing header.
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+
+    def get_metrics(self, response: HttpResponse) -> Dict[str, str]:
+        return {
+            metric.split(";")[0]: metric
+            for metric in response["Server-Timing"].split(", ")
+        }
+
+    def test_template_view(self) -> None:
+        response = self.client.get(reverse("requestdataapp:get-view"))
+        metrics = self.get_metrics(response)
+        self.assertEqual(
+            set(metrics), {"db", "cache", "view", "template", "total"}, metrics
+        )
+        self.assertIn('desc="0 queries"', metrics["db"])
+
+    def test_api_view(self) -> None:
+        user = User.objects.create_user(username="reader", password="secret")
+        self.client.force_login(user)
+        response = self.client.get(
+            reverse("myapiapp:users"), HTTP_ACCEPT="application/json"
+        )
+        metrics = self.get_metrics(response)
+        self.assertIn("render", metrics)
+        self.assertNotIn("template", metrics)
+        self.assertRegex(metrics["db"], r"^db;dur=[\d.]+;desc=\"\d+ queries\"$")
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled(self) -> None:
+        response = self.client.get(reverse("requestdataapp:get-view"))
+        self.assertNotIn("Server-Timing", response)
+
+
+class RequestLoggingTestCase(SimpleTestCase):
+    """
+    Test case for the sampled, queued JSON request logs.
+    """
+
+    def test_sample_rates_by_route(self) -> None:
+        sampler = RequestSampler(
+            {"default": 0.0, "shopapp:*": 1.0, "shopapp:products-export": 0.0}
+        )
+        self.assertTrue(sampler.is_sampled("shopapp:index"))
+        self.assertFalse(sampler.is_sampled("shopapp:products-export"))
+        self.assertFalse(sampler.is_sampled("blogapp:articles"))
+        self.assertEqual(RequestSampler({}).get_rate("metrics"), 1.0)
+
+    def test_queued_json_lines(self) -> None:
+        stream = StringIO()
+        sink = QueueSink(JsonSink(stream))
+        handler_id: int = log.add(sink, format="{message}")
+        self.addCleanup(log.remove, handler_id)
+
+        request = RequestFactory().get("/en/req/get/", HTTP_USER_AGENT="test")
+        log_request(request, HttpResponse(status=503), "requestdataapp:get-view", 0.5)
+        sink.complete()
+
+        entry: Dict[str, Any] = json.loads(stream.getvalue().splitlines()[-1])
+        self.assertEqual(entry["level"], "ERROR")
+        self.assertEqual(entry["message"], "request")
+        self.assertEqual(entry["view"], "requestdataapp:get-view")
+        self.assertEqual(entry["status"], 503)
+        self.assertEqual(entry["duration_ms"], 500.0)
+        self.assertEqual(entry["user_agent"], "test")
+        self.assertNotIn("\x1b[", stream.getvalue())
+
+    def test_slow_request_record(self) -> None:
+        stream = StringIO()
+        handler_id: int = log.add(JsonSink(stream), format="{message}")
+        self.addCleanup(log.remove, handler_id)
+
+        stats = RequestStats()
+        for sql, elapsed in (
+            ("SELECT * FROM a WHERE id = %s", 0.1),
+            ("SELECT * FROM b", 0.5),
+            ("SELECT * FROM a WHERE id = %s", 0.2),
+            ("SELECT * FROM c", 0.01),
+            ("SELECT * FROM d", 0.02),
+        ):
+            stats.query_shapes[fingerprint_sql(sql)] += 1
+            stats.query_times[fingerprint_sql(sql)] += elapsed
+        stats.db_queries, stats.cache_misses = 5, 2
+        request = RequestFactory().get("/en/shop/orders/")
+        request.user_tier = "staff"
+        log_slow_request(request, HttpResponse(), "shopapp:orders_list", 2.0, stats)
+
+        entry: Dict[str, Any] = json.loads(stream.getvalue())
+        self.assertEqual(entry["event"], "slow_request")
+        self.assertEqual(entry["level"], "WARNING")
+        self.assertEqual(entry["view"], "shopapp:orders_list")
+        self.assertEqual(entry["tier"], "staff")
+        self.assertEqual(entry["cache_misses"], 2)
+        self.assertEqual(
+            [query["sql"] for query in entry["slowest_queries"]],
+            ["SELECT * FROM b", "SELECT * FROM a WHERE id = ?", "SELECT * FROM d"],
+        )
+        self.assertEqual(entry["slowest_queries"][1]["count"], 2)
+
+    def test_full_queue_drops_records(self) -> None:
+        sink = QueueSink(lambda message: None, maxsize=1)
+        sink._pid = os.getpid()  # No writer thread, nothing is consumed.
+        sink("first")
+        sink("second")
+        self.assertEqual(sink.dropped, 1)
+        sink.queue.get_nowait()
+        sink.queue.task_done()
+
+
+class UserAgentTestCase(SimpleTestCase):
+    """
+    Test case for the cached, structured user agent of the requests.
+    """
+
+    def test_parse(self) -> None:
+        cases = [
+            (
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 Edg/126.0.2592.87",
+                ("Edge", "Windows", "desktop", False),
+            ),
+            (
+                "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) "
+                "AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.5 "
+                "Mobile/15E148 Safari/604.1",
+                ("Safari", "iOS", "mobile", False),
+            ),
+            (
+                "Mozilla/5.0 (Linux; Android 14; SM-X710) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36",
+                ("Chrome", "Android", "tablet", False),
+            ),
+            (
+                "Mozilla/5.0 (compatible; Googlebot/2.1; "
+                "+http://www.google.com/bot.html)",
+                (None, None, "bot", True),
+            ),
+            ("curl/8.5.0", (None, None, "bot", True)),
+            ("", (None, None, "bot", True)),
+        ]
+        for string, expected in cases:
+            user_agent = parse_user_agent(string)
+            self.assertEqual(
+                (
+                    user_agent.browser,
+                    user_agent.os,
+                    user_agent.device,
+                    user_agent.is_bot,
+                ),
+                expected,
+                msg=string,
+            )
+        self.assertEqual(parse_user_agent(cases[1][0]).os_version, "17.5")
+
+    def test_lazy_and_cached_on_request(self) -> None:
+        _parse.cache_clear()
+        middleware = set_useragent_on_request_middleware(lambda request: request)
+        requests: List[HttpRequest] = [
+            middleware(RequestFactory().get("/", HTTP_USER_AGENT="Firefox/127.0"))
+            for _ in range(3)
+        ]
+        self.assertEqual(_parse.cache_info().currsize, 0)
+
+        self.assertEqual(requests[0].user_agent.browser, "Firefox")
+        self.assertEqual(str(requests[1].user_agent), "Firefox/127.0")
+        self.assertIs(requests[2].user_agent.is_bot, False)
+        self.assertEqual(_parse.cache_info().misses, 1)
+        self.assertEqual(_parse.cache_info().hits, 2)
+
+    def test_raw_string(self) -> None:
+        middleware = set_useragent_on_request_middleware(lambda request: request)
+        request: HttpRequest = middleware(RequestFactory().get("/"))
+        self.assertEqual(str(request.user_agent), "unknown")
+        self.assertIs(request.user_agent.is_bot, True)
+
+        string: str = "Firefox/127.0 " + "x" * 1000
+        request = middleware(RequestFactory().get("/", HTTP_USER_AGENT=string))
+        self.assertEqual(str(request.user_agent), string)
+        self.assertEqual(request.user_agent.browser, "Firefox")
+
+
+def busy_loop(seconds: float) -> None:
+    started_at: float = perf_counter()
+    while perf_counter() - started_at < seconds:
+        pass
+
+
+class ProfilingTestCase(TestCase):
+    """
+    Test case for the on-demand profiling of staff requests.
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        media_root = TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root: str = media_root.name
+        self.staff: User = User.objects.create_user(
+            username="staff", password="password", is_staff=True
+        )
+
+    def test_sampler(self) -> None:
+        with StackSampler(get_ident(), interval=0.001) as sampler:
+            busy_loop(0.05)
+        self.assertGreater(sum(sampler.stacks.values()), 0)
+        self.assertIn("busy_loop (requestdataapp/tests.py:", sampler.collapsed())
+        for line in sampler.collapsed().splitlines():
+            stack, count = line.rsplit(" ", 1)
+            self.assertIn(";", stack)
+            self.assertTrue(count.isdigit())
+        self.assertIn("busy_loop", sampler.summary("title", top=5))
+
+    def test_overlapping_samplers_restore_switch_interval(self) -> None:
+        switch_interval: float = sys.getswitchinterval()
+        first = StackSampler(get_ident(), interval=0.001).__enter__()
+        second = StackSampler(get_ident(), interval=0.002).__enter__()
+        self.assertEqual(sys.getswitchinterval(), 0.001)
+        first.__exit__(None, None, None)
+        self.assertEqual(sys.getswitchinterval(), 0.001)
+        second.__exit__(None, None, None)
+        self.assertEqual(sys.getswitchinterval(), switch_interval)
+
+    def test_staff_request_is_profiled(self) -> None:
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse("requestdataapp:get-view"),
+            headers={"x-profile": make_profile_token(self.staff.pk)},
+        )
+        path: str = response["X-Profile-Path"]
+        self.assertTrue(path.startswith("profiles/"))
+        self.assertTrue(os.path.isfile(os.path.join(self.media_root, path)))
+        with open(
+            os.path.join(self.media_root, path[: -len(".collapsed")] + ".txt")
+        ) as file:
+            self.assertTrue(file.readline().startswith("GET /en/req/get/ in "))
+
+        response = self.client.get(
+            reverse("requestdataapp:get-view"),
+            {"_profile": make_profile_token(self.staff.pk)},
+        )
+        self.assertIn("X-Profile-Path", response)
+
+    def test_other_requests_are_not_profiled(self) -> None:
+        url: str = reverse("requestdataapp:get-view")
+        token: str = make_profile_token(self.staff.pk)
+        self.assertNotIn(
+            "X-Profile-Path", self.client.get(url, headers={"x-profile": token})
+        )
+
+        user: User = User.objects.create_user(username="user", password="password")
+        self.client.force_login(user)
+        self.assertNotIn(
+            "X-Profile-Path",
+            self.client.get(url, headers={"x-profile": make_profile_token(user.pk)}),
+        )
+        self.client.force_login(self.staff)
+        self.assertNotIn(
+            "X-Profile-Path", self.client.get(url, headers={"x-profile": "forged"})
+        )
+        self.assertFalse(os.path.isdir(os.path.join(self.media_root, "profiles")))
+
+
+class WarmCacheCommandTestCase(TestCase):
+    """
+    Test case for the cache warm-up command.
+    """
+
+    def test_resources_cached_under_live_keys(self) -> None:
+        from shopapp.models import Product
+
+        translation.activate("en")
+        cache.clear()
+        stdout = StringIO()
+        call_command(
+            "warm_cache",
+            host="testserver",
+            concurrency=2,
+            languages=["en"],
+            stdout=stdout,
+        )
+        self.assertIn("en products feed", stdout.getvalue())
+        self.assertIn("6 resources", stdout.getvalue())
+
+        # Without the signals, the new product does not invalidate the feed.
+        Product.objects.bulk_create([Product(name="Lamp", price=1)])
+        response = self.client.get(reverse("shopapp:latest_products_feed"))
+        self.assertNotContains(response, "Lamp")
@@ -0,0 +1,345 @@
+"""
+Rate limiting of the requests, shared by all the workers through Redis.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.core.exceptions import ImproperlyConfigured
+from loguru import logger as log
+from redis.exceptions import RedisError
+
+from mysite.cache import get_redis_client, uses_redis_cache
+
+# Token bucket: the bucket holds up to ``capacity`` tokens and refills at
+# ``rate`` tokens per second, every request takes one token. The clock of the
+# Redis server is used, so workers on different hosts agree on the time.
+# Floats are returned as strings, Redis would truncate Lua numbers to integers.
+TOKEN_BUCKET_SCRIPT: str = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+
+local bucket = redis.call("HMGET", KEYS[1], "tokens", "timestamp")
+local tokens = tonumber(bucket[1]) or capacity
+local timestamp = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - timestamp) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+
+redis.call("HSET", KEYS[1], "tokens", tostring(tokens), "timestamp", tostring(now))
+redis.call("PEXPIRE", KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, tostring(retry_after)}
+"""
+
+
+class LocalRateLimiter:
+    """
+    Token bucket rate limiter kept in the memory of the worker.
+
+    At most ``max_entries`` buckets are kept: every hit moves the bucket of
+    the client to the end of an ordered dict and the least recently seen
+    bucket is dropped when the store is full, so both the updates and the
+    eviction are O(1) and the memory stays bounded whatever the number of
+    distinct clients.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        period: float,
+        max_entries: int = 10000,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        """
+        Initialize the rate limiter.
+
+        Args:
+            limit (int): Number of requests allowed in a burst.
+            period (float): Time in seconds to refill the whole bucket.
+            max_entries (int, optional): Maximum number of buckets. Defaults to 10000.
+            clock (Callable[[], float], optional): Returns the current time in seconds.
+        """
+        self.limit = limit
+        self.period = period
+        self.max_entries = max_entries
+        self.clock = clock
+        self.buckets: OrderedDict[str, Tuple[float, float]] = OrderedDict()
+        self.lock = Lock()
+
+    def hit(self, identifier: str) -> Tuple[bool, float]:
+        """
+        Take a token from the bucket of the client.
+
+        Args:
+            identifier (str): Identifies the client, e.g. its IP address.
+
+        Returns:
+            Tuple[bool, float]: Whether the request is allowed and the number
+                of seconds to wait before the next request is allowed.
+        """
+        now: float = self.clock()
+        rate: float = self.limit / self.period
+        with self.lock:
+            tokens, timestamp = self.buckets.pop(identifier, (self.limit, now))
+            tokens = min(self.limit, tokens + max(0.0, now - timestamp) * rate)
+            allowed: bool = tokens >= 1
+            retry_after: float = 0.0
+            if allowed:
+                tokens -= 1
+            else:
+                retry_after = (1 - tokens) / rate
+            self.buckets[identifier] = (tokens, now)
+            if len(self.buckets) > self.max_entries:
+                self.buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def is_allowed(self, identifier: str) -> bool:
+        """Return False if the client has exceeded the limit."""
+        return self.hit(identifier)[0]
+
+
+class RedisRateLimiter:
+    """
+    Token bucket rate limiter stored in Redis.
+
+    Each call is a single round trip running one atomic Lua script, so the
+    limit holds across every gunicorn worker and thread, and buckets of idle
+    clients expire by themselves.
+
+    Redis is queried with a short timeout. When it fails, the requests are
+    counted by the in-process fallback limiter, and Redis is left alone for
+    ``retry_interval`` seconds, so an unreachable Redis does not slow down
+    every request.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        period: float,
+        client: Optional[Any] = None,
+        prefix: str = "throttle",
+        fallback: Optional[LocalRateLimiter] = None,
+        timeout: float = 0.05,
+        retry_interval: float = 5.0,
+    ) -> None:
+        """
+        Initialize the rate limiter.
+
+        Args:
+            limit (int): Number of requests allowed in a burst.
+            period (float): Time in seconds to refill the whole bucket.
+            client (Optional[Any]): Redis client, a client of the server of the
+                default cache is created if not given.
+            prefix (str, optional): Prefix of the Redis keys. Defaults to "throttle".
+            fallback (Optional[LocalRateLimiter]): Used while Redis is unavailable,
+                the requests are allowed if not given.
+            timeout (float, optional): Socket timeout of the created client in
+                seconds. Defaults to 0.05.
+            retry_interval (float, optional): Seconds to wait after a failure
+                before using Redis again. Defaults to 5.0.
+        """
+        self.limit = limit
+        self.period = period
+        self.prefix = prefix
+        self.fallback = fallback
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self._client = client
+        self._script = None
+        self._retry_at: float = 0.0
+
+    @property
+    def client(self) -> Any:
+        """Return the Redis client, connecting to the default cache server lazily."""
+        if self._client is None:
+            self._client = get_redis_client(timeout=self.timeout)
+        return self._client
+
+    def hit_redis(self, identifier: str) -> Tuple[bool, float]:
+        """
+        Take a token from the bucket of the client in Redis.
+
+        Args:
+            identifier (str): Identifies the client, e.g. its IP address.
+
+        Returns:
+            Tuple[bool, float]: Whether the request is allowed and the number
+                of seconds to wait before the next request is allowed.
+
+        Raises:
+            RedisError: If Redis cannot be reached or times out.
+        """
+        if self._script is None:
+            self._script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        allowed, retry_after = self._script(
+            keys=[
+                "{prefix}:{identifier}".format(
+                    prefix=self.prefix, identifier=identifier
+                )
+            ],
+            args=[self.limit, self.limit / self.period],
+        )
+        return bool(int(allowed)), float(retry_after)
+
+    def hit(self, identifier: str) -> Tuple[bool, float]:
+        """
+        Take a token from the bucket of the client, falling back if Redis fails.
+
+        Args:
+            identifier (str): Identifies the client, e.g. its IP address.
+
+        Returns:
+            Tuple[bool, float]: Whether the request is allowed and the number
+                of seconds to wait before the next request is allowed.
+        """
+        if monotonic() >= self._retry_at:
+            try:
+                return self.hit_redis(identifier)
+            except RedisError as error:
+                log.warning(
+                    "Rate limiter unavailable, retry in {interval}s: {error}",
+                    interval=self.retry_interval,
+                    error=error,
+                )
+                self._retry_at = monotonic() + self.retry_interval
+        if self.fallback is None:
+            return True, 0.0
+        return self.fallback.hit(identifier)
+
+    def is_allowed(self, identifier: str) -> bool:
+        """Return False if the client has exceeded the limit."""
+        return self.hit(identifier)[0]
+
+
+def get_rate_limiter(
+    limit: int, period: float, prefix: str = "throttle"
+) -> RedisRateLimiter | LocalRateLimiter:
+    """
+    Create the rate limiter matching the cache of the project.
+
+    With a Redis default cache the limit is shared through Redis, with an
+    in-process fallback. Otherwise (a single node setup) the limit is kept
+    in the memory of the worker.
+
+    Args:
+        limit (int): Number of requests allowed in a burst.
+        period (float): Time in seconds to refill the whole bucket.
+        prefix (str, optional): Prefix of the Redis keys. Defaults to "throttle".
+
+    Returns:
+        RedisRateLimiter | LocalRateLimiter: The rate limiter.
+    """
+    local = LocalRateLimiter(limit=limit, period=period)
+    if not uses_redis_cache():
+        return local
+    return RedisRateLimiter(limit=limit, period=period, prefix=prefix, fallback=local)
+
+
+RATE_PERIODS: Dict[str, int] = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+
+def parse_rate(rate: str) -> Tuple[int, float]:
+    """
+    Parse a rate such as ``"30/40s"``, ``"100/m"`` or ``"1000/h"``.
+
+    Args:
+        rate (str): Number of requests, a slash, an optional count and a unit
+            among s, m, h and d.
+
+    Returns:
+        Tuple[int, float]: The number of requests and the period in seconds.
+
+    Raises:
+        ImproperlyConfigured: If the rate cannot be parsed.
+    """
+    try:
+        limit, period = rate.split("/")
+        count: str = period[:-1] or "1"
+        return int(limit), int(count) * RATE_PERIODS[period[-1]]
+    except (ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured("Invalid throttling rate {rate!r}".format(rate=rate))
+
+
+class ThrottlePolicy:
+    """
+    Rate limits applied to the URLs matched by name or by path prefix.
+
+    Every user tier gets its own limiter, a tier with a None rate is not
+    limited.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rates: Dict[str, Optional[str]],
+        url_names: Optional[List[str]] = None,
+        path_prefixes: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Initialize the policy.
+
+        Args:
+            name (str): Name of the policy, part of the limiter keys.
+            rates (Dict[str, Optional[str]]): Rate of each user tier.
+            url_names (Optional[List[str]]): Namespaced URL names matched.
+            path_prefixes (Optional[List[str]]): Path prefixes matched, without
+                the language prefix.
+        """
+        self.name = name
+        self.url_names = frozenset(url_names or ())
+        self.path_prefixes = tuple(path_prefixes or ())
+        self.limiters: Dict[str, Optional[RedisRateLimiter | LocalRateLimiter]] = {}
+        for tier, rate in rates.items():
+            if rate is None:
+                self.limiters[tier] = None
+                continue
+            limit, period = parse_rate(rate)
+            self.limiters[tier] = get_rate_limiter(
+                limit=limit,
+                period=period,
+                prefix="throttle:{name}:{tier}".format(name=name, tier=tier),
+            )
+
+    def matches(self, url_name: Optional[str], path: str) -> bool:
+        """Return True if the policy applies to the URL name or the path."""
+        return url_name in self.url_names or path.startswith(self.path_prefixes)
+
+
+def load_policies(config: Dict[str, Any]) -> List[ThrottlePolicy]:
+    """
+    Build the throttle policies from the ``THROTTLING`` setting.
+
+    The rates of the ``DEFAULT_RATES`` tiers missing from a policy are
+    inherited, and a last policy named "default" matches every request.
+
+    Args:
+        config (Dict[str, Any]): The ``THROTTLING`` setting.
+
+    Returns:
+        List[ThrottlePolicy]: The policies, in matching order.
+    """
+    default_rates: Dict[str, Optional[str]] = config.get("DEFAULT_RATES", {})
+    policies: List[ThrottlePolicy] = [
+        ThrottlePolicy(
+            name=policy["name"],
+            rates={**default_rates, **policy.get("rates", {})},
+            url_names=policy.get("url_names"),
+            path_prefixes=policy.get("path_prefixes"),
+        )
+        for policy in config.get("POLICIES", [])
+    ]
+    policies.append(
+        ThrottlePolicy(name="default", rates=default_rates, path_prefixes=["/"])
+    )
+    return policies
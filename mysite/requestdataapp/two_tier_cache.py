@@ -0,0 +1,413 @@
+"""
+Redis cache backend with a small in-process tier in front of Redis.
+
+The values read from Redis are kept decoded in a size-bounded LRU of the
+worker for a few seconds, so the hot keys (model versions, exports,
+template fragments) are neither fetched nor unpickled on every lookup.
+
+Every write and delete publishes the key on a Redis channel, and a thread
+of each worker evicts the published keys from its tier. The in-process
+tier is only used while the worker is subscribed, and is emptied when the
+subscription is (re)established, so missed messages cannot leave stale
+values behind; the short timeout bounds the staleness otherwise.
+
+The values returned from the in-process tier are shared by the requests
+of the worker and must not be modified.
+"""
+
+import os
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django_redis.cache import CONNECTION_INTERRUPTED, RedisCache, omit_exception
+from django_redis.exceptions import ConnectionInterrupted
+from loguru import logger as log
+from redis.exceptions import RedisError
+
+from .metrics import registry
+
+INVALIDATION_CHANNEL: str = "cache-invalidation"
+# Published to empty the in-process tiers, e.g. when the cache is cleared.
+ALL_KEYS: str = "*"
+RESUBSCRIBE_INTERVAL: float = 5.0
+
+_MISSING = object()
+
+
+class LocalTier:
+    """Thread-safe LRU of decoded values, bounded in entries and in bytes."""
+
+    def __init__(
+        self,
+        timeout: float = 5.0,
+        max_entries: int = 1000,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_entry_bytes: int = 1024 * 1024,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        """
+        Initialize the tier.
+
+        Args:
+            timeout (float, optional): Seconds a value is kept. Defaults to 5.0.
+            max_entries (int, optional): Maximum number of values. Defaults to 1000.
+            max_bytes (int, optional): Maximum encoded size of all the values.
+                Defaults to 32 MiB.
+            max_entry_bytes (int, optional): Larger values are not kept.
+                Defaults to 1 MiB.
+            clock (Callable[[], float], optional): Source of the time.
+        """
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.clock = clock
+        self.entries: OrderedDict = OrderedDict()
+        self.size: int = 0
+        # Changed by every invalidation, see ``set()``.
+        self.generation: int = 0
+        self.lock = Lock()
+
+    def get(self, key: str) -> Any:
+        """Return the value of the key, ``_MISSING`` if absent or expired."""
+        with self.lock:
+            entry: Optional[Tuple[Any, float, int]] = self.entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires_at, size = entry
+            if expires_at <= self.clock():
+                del self.entries[key]
+                self.size -= size
+                return _MISSING
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, size: int, generation: int) -> bool:
+        """
+        Keep a value read from Redis.
+
+        Args:
+            key (str): The Redis key.
+            value (Any): The decoded value.
+            size (int): Size of the encoded value in bytes.
+            generation (int): The generation read before the value was
+                fetched: if a key was invalidated since, the value may be
+                older than the invalidation and is not kept.
+
+        Returns:
+            bool: True if the value is kept.
+        """
+        if self.timeout <= 0 or size > self.max_entry_bytes:
+            return False
+        with self.lock:
+            if generation != self.generation:
+                return False
+            previous: Optional[Tuple[Any, float, int]] = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[2]
+            self.entries[key] = (value, self.clock() + self.timeout, size)
+            self.size += size
+            while self.entries and (
+                len(self.entries) > self.max_entries or self.size > self.max_bytes
+            ):
+                self.size -= self.entries.popitem(last=False)[1][2]
+            return True
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        """Evict the keys, or every value if one of them is ``ALL_KEYS``."""
+        with self.lock:
+            self.generation += 1
+            for key in keys:
+                if key == ALL_KEYS:
+                    self.entries.clear()
+                    self.size = 0
+                    return
+                entry: Optional[Tuple[Any, float, int]] = self.entries.pop(key, None)
+                if entry is not None:
+                    self.size -= entry[2]
+
+    def clear(self) -> None:
+        """Evict every value."""
+        self.invalidate([ALL_KEYS])
+
+
+class TierState:
+    """
+    In-process tier, subscription and lookup counts of a cache in a worker.
+
+    Django creates an instance of the cache backend per thread, the state is
+    shared by the instances of the same server and channel.
+    """
+
+    def __init__(self, local: LocalTier) -> None:
+        self.local = local
+        self.subscribed = Event()
+        self.subscriber_pid: Optional[int] = None
+        self.lookups: Dict[Tuple[str, bool], int] = {}
+        self.lock = Lock()
+
+
+_states: Dict[Tuple[str, str], TierState] = {}
+_states_lock = Lock()
+
+
+class TwoTierRedisCache(RedisCache):
+    """
+    django_redis cache backend reading through an in-process ``LocalTier``.
+
+    Configured by the ``LOCAL_CACHE`` dictionary of the cache ``OPTIONS``,
+    with the ``TIMEOUT``, ``MAX_ENTRIES``, ``MAX_BYTES`` and
+    ``MAX_ENTRY_BYTES`` arguments of ``LocalTier`` and the invalidation
+    ``CHANNEL``. Only ``get()`` fills the in-process tier.
+    """
+
+    def __init__(self, server: str, params: Dict[str, Any]) -> None:
+        super().__init__(server, params)
+        options: Dict[str, Any] = params.get("OPTIONS", {}).get("LOCAL_CACHE", {})
+        self.channel: str = options.get("CHANNEL", INVALIDATION_CHANNEL)
+        with _states_lock:
+            state: Optional[TierState] = _states.get((str(server), self.channel))
+            if state is None:
+                state = _states[str(server), self.channel] = TierState(
+                    LocalTier(
+                        timeout=options.get("TIMEOUT", 5.0),
+                        max_entries=options.get("MAX_ENTRIES", 1000),
+                        max_bytes=options.get("MAX_BYTES", 32 * 1024 * 1024),
+                        max_entry_bytes=options.get("MAX_ENTRY_BYTES", 1024 * 1024),
+                    )
+                )
+        self.state: TierState = state
+        self.local: LocalTier = state.local
+
+    def local_tier_enabled(self) -> bool:
+        """
+        Return True if the in-process tier can be used.
+
+        Starts the subscriber thread of the worker on first use.
+        """
+        if self.local.timeout <= 0:
+            return False
+        state: TierState = self.state
+        if state.subscriber_pid != os.getpid():
+            with state.lock:
+                if state.subscriber_pid != os.getpid():
+                    state.subscribed.clear()
+                    self.local.clear()
+                    Thread(
+                        target=self.listen, name="cache-invalidation", daemon=True
+                    ).start()
+                    state.subscriber_pid = os.getpid()
+        return state.subscribed.is_set()
+
+    def listen(self) -> None:
+        """Evict the published keys from the in-process tier, in its own thread."""
+        while True:
+            try:
+                pubsub = self.client.get_client(write=True).pubsub(
+                    ignore_subscribe_messages=True
+                )
+                pubsub.subscribe(self.channel)
+                # Messages may have been missed while not subscribed.
+                self.local.clear()
+                self.state.subscribed.set()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None:
+                        self.local.invalidate(message["data"].decode().split("\n"))
+            except RedisError as error:
+                self.state.subscribed.clear()
+                self.local.clear()
+                log.warning(
+                    "Cache invalidations not received, in-process tier disabled: "
+                    "{error}",
+                    error=error,
+                )
+                sleep(RESUBSCRIBE_INTERVAL)
+
+    def publish(self, keys: List[str]) -> None:
+        """Evict the Redis keys from the in-process tiers of all the workers."""
+        if self.local.timeout <= 0 or not keys:
+            return
+        self.local.invalidate(keys)
+        try:
+            self.client.get_client(write=True).publish(self.channel, "\n".join(keys))
+        except RedisError as error:
+            # The other workers keep their values until the local timeout.
+            log.warning("Cache invalidation not published: {error}", error=error)
+
+    def make_keys(
+        self, keys: Iterable[Any], version: Optional[int] = None
+    ) -> List[str]:
+        """Return the Redis keys of cache keys."""
+        return [str(self.client.make_key(key, version=version)) for key in keys]
+
+    def count(self, tier: str, hit: bool) -> None:
+        """Count a lookup in a tier, for the metrics and ``tier_stats()``."""
+        lookups: Dict[Tuple[str, bool], int] = self.state.lookups
+        with self.state.lock:
+            lookups[tier, hit] = lookups.get((tier, hit), 0) + 1
+        registry.inc(
+            "django_cache_tier_hits_total" if hit else "django_cache_tier_misses_total",
+            labels={"tier": tier},
+        )
+
+    def tier_stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return the hits, misses and hit ratio of each tier in this worker.
+
+        Returns:
+            Dict[str, Dict[str, float]]: The statistics of the "local" and
+                "redis" tiers.
+        """
+        with self.state.lock:
+            lookups: Dict[Tuple[str, bool], int] = dict(self.state.lookups)
+        stats: Dict[str, Dict[str, float]] = {}
+        for tier in ("local", "redis"):
+            hits: int = lookups.get((tier, True), 0)
+            misses: int = lookups.get((tier, False), 0)
+            stats[tier] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            }
+        return stats
+
+    @omit_exception(return_value=CONNECTION_INTERRUPTED)
+    def _get(
+        self, key: Any, default: Any = None, version: Optional[int] = None, client=None
+    ) -> Any:
+        redis_key: str = self.make_keys([key], version)[0]
+        local_tier_enabled: bool = self.local_tier_enabled()
+        if local_tier_enabled:
+            value: Any = self.local.get(redis_key)
+            self.count("local", value is not _MISSING)
+            if value is not _MISSING:
+                return value
+
+        generation: int = self.local.generation
+        if client is None:
+            client = self.client.get_client(write=False)
+        try:
+            encoded: Optional[bytes] = client.get(redis_key)
+        except RedisError as error:
+            raise ConnectionInterrupted(connection=client) from error
+        self.count("redis", encoded is not None)
+        if encoded is None:
+            return default
+        value = self.client.decode(encoded)
+        if local_tier_enabled:
+            self.local.set(redis_key, value, len(encoded), generation)
+        return value
+
+    def get_many(
+        self, keys: Iterable[Any], version: Optional[int] = None, client=None
+    ) -> Dict[Any, Any]:
+        keys = list(keys)
+        values: Dict[Any, Any] = {}
+        if self.local_tier_enabled():
+            for key, redis_key in zip(keys, self.make_keys(keys, version)):
+                value: Any = self.local.get(redis_key)
+                self.count("local", value is not _MISSING)
+                if value is not _MISSING:
+                    values[key] = value
+        missing: List[Any] = [key for key in keys if key not in values]
+        if missing:
+            found: Dict[Any, Any] = super().get_many(
+                missing, version=version, client=client
+            )
+            for key in missing:
+                self.count("redis", key in found)
+            values.update(found)
+        return values
+
+    def set(
+        self,
+        key: Any,
+        value: Any,
+        timeout: Any = DEFAULT_TIMEOUT,
+        version: Optional[int] = None,
+        **kwargs
+    ) -> bool:
+        try:
+            return super().set(key, value, timeout, version=version, **kwargs)
+        finally:
+            self.publish(self.make_keys([key], version))
+
+    def add(
+        self,
+        key: Any,
+        value: Any,
+        timeout: Any = DEFAULT_TIMEOUT,
+        version: Optional[int] = None,
+        **kwargs
+    ) -> bool:
+        added: bool = super().add(key, value, timeout, version=version, **kwargs)
+        if added:
+            self.publish(self.make_keys([key], version))
+        return added
+
+    def delete(self, key: Any, version: Optional[int] = None, **kwargs) -> bool:
+        try:
+            return super().delete(key, version=version, **kwargs)
+        finally:
+            self.publish(self.make_keys([key], version))
+
+    def set_many(
+        self,
+        data: Dict[Any, Any],
+        timeout: Any = DEFAULT_TIMEOUT,
+        version: Optional[int] = None,
+        **kwargs
+    ) -> List[Any]:
+        try:
+            return super().set_many(data, timeout, version=version, **kwargs)
+        finally:
+            self.publish(self.make_keys(data, version))
+
+    def delete_many(
+        self, keys: Iterable[Any], version: Optional[int] = None, **kwargs
+    ) -> int:
+        keys = list(keys)
+        try:
+            return super().delete_many(keys, version=version, **kwargs)
+        finally:
+            self.publish(self.make_keys(keys, version))
+
+    def incr(
+        self, key: Any, delta: int = 1, version: Optional[int] = None, **kwargs
+    ) -> int:
+        try:
+            return super().incr(key, delta, version=version, **kwargs)
+        finally:
+            self.publish(self.make_keys([key], version))
+
+    def decr(
+        self, key: Any, delta: int = 1, version: Optional[int] = None, **kwargs
+    ) -> int:
+        try:
+            return super().decr(key, delta, version=version, **kwargs)
+        finally:
+            self.publish(self.make_keys([key], version))
+
+    def incr_version(
+        self, key: Any, delta: int = 1, version: Optional[int] = None, **kwargs
+    ) -> int:
+        try:
+            return super().incr_version(key, delta, version=version, **kwargs)
+        finally:
+            self.publish(self.make_keys([key], version))
+
+    def delete_pattern(self, *args, **kwargs) -> int:
+        try:
+            return super().delete_pattern(*args, **kwargs)
+        finally:
+            self.publish([ALL_KEYS])
+
+    def clear(self) -> None:
+        try:
+            return super().clear()
+        finally:
+            self.publish([ALL_KEYS])
@@ -1,6 +1,6 @@
 from django.urls import path
 from typing import List
-from .views import process_get_view, user_form, handle_file_upload
+from .views import cache_stats_view, process_get_view, user_form, handle_file_upload
 
 app_name = "requestdataapp"
 
@@ -9,4 +9,5 @@ urlpatterns: List[path] = [
     path("get/", process_get_view, name="get-view"),
     path("bio/", user_form, name="user-form"),
     path("upload/", handle_file_upload, name="file-upload"),
+    path("cache-stats/", cache_stats_view, name="cache-stats"),
 ]
@@ -0,0 +1,171 @@
+"""
+Parsing of the User-Agent header into browser, OS, device class and bot flag.
+"""
+
+import re
+from functools import lru_cache
+from typing import Optional, Pattern, Sequence, Tuple
+
+# Longer strings are truncated before parsing, so the cache stays bounded.
+MAX_LENGTH: int = 512
+CACHE_SIZE: int = 1024
+# String of the requests without a User-Agent header.
+UNKNOWN: str = "unknown"
+
+BOT: Pattern = re.compile(
+    r"bot\b|bot/|crawl|spider|slurp|archiver|curl/|wget/|python-requests|"
+    r"python-urllib|httpclient|okhttp|go-http-client|headless|lighthouse|"
+    r"monitor|preview|scan",
+    re.IGNORECASE,
+)
+# The order matters: Edge and Opera also announce Chrome, Chrome announces Safari.
+BROWSERS: Sequence[Tuple[str, Pattern]] = (
+    ("Edge", re.compile(r"Edg(?:e|A|iOS)?/([\d.]+)")),
+    ("Opera", re.compile(r"(?:OPR|Opera)/([\d.]+)")),
+    ("Yandex Browser", re.compile(r"YaBrowser/([\d.]+)")),
+    ("Samsung Internet", re.compile(r"SamsungBrowser/([\d.]+)")),
+    ("Chrome", re.compile(r"(?:Chrome|CriOS)/([\d.]+)")),
+    ("Firefox", re.compile(r"(?:Firefox|FxiOS)/([\d.]+)")),
+    ("Safari", re.compile(r"Version/([\d.]+).*Safari/")),
+    ("Internet Explorer", re.compile(r"(?:MSIE |Trident/.*rv:)([\d.]+)")),
+)
+OPERATING_SYSTEMS: Sequence[Tuple[str, Pattern]] = (
+    ("Windows", re.compile(r"Windows NT ([\d.]+)")),
+    ("Android", re.compile(r"Android ?([\d.]*)")),
+    ("iOS", re.compile(r"(?:iPhone|iPad|iPod).*? OS ([\d_]+)")),
+    ("macOS", re.compile(r"Mac OS X ?([\d_.]*)")),
+    ("Chrome OS", re.compile(r"CrOS \S+ ([\d.]+)")),
+    ("Linux", re.compile(r"Linux()")),
+)
+TABLET: Pattern = re.compile(r"iPad|Tablet|Kindle|Silk/", re.IGNORECASE)
+MOBILE: Pattern = re.compile(r"Mobi|iPhone|iPod|Android|Windows Phone", re.IGNORECASE)
+
+
+class UserAgent:
+    """
+    Structured User-Agent header.
+
+    Attributes:
+        string: The raw header, also returned by ``str()``.
+        browser: Browser family, e.g. "Chrome", None if unknown.
+        browser_version: Version of the browser, "" if unknown.
+        os: Operating system family, e.g. "Android", None if unknown.
+        os_version: Version of the operating system, "" if unknown.
+        device: One of "desktop", "mobile", "tablet", "bot" and "other".
+        is_bot: True for crawlers, scripts and monitoring tools.
+    """
+
+    __slots__ = (
+        "string",
+        "browser",
+        "browser_version",
+        "os",
+        "os_version",
+        "device",
+        "is_bot",
+    )
+
+    def __init__(
+        self,
+        string: str,
+        browser: Optional[str] = None,
+        browser_version: str = "",
+        os: Optional[str] = None,
+        os_version: str = "",
+        device: str = "other",
+        is_bot: bool = False,
+    ) -> None:
+        self.string = string
+        self.browser = browser
+        self.browser_version = browser_version
+        self.os = os
+        self.os_version = os_version
+        self.device = device
+        self.is_bot = is_bot
+
+    @property
+    def is_mobile(self) -> bool:
+        return self.device == "mobile"
+
+    @property
+    def is_tablet(self) -> bool:
+        return self.device == "tablet"
+
+    def __str__(self) -> str:
+        return self.string
+
+    def __repr__(self) -> str:
+        return "<UserAgent {browser} {os} {device}>".format(
+            browser=self.browser, os=self.os, device=self.device
+        )
+
+
+def _search(
+    rules: Sequence[Tuple[str, Pattern]], string: str
+) -> Tuple[Optional[str], str]:
+    """Return the name and the version of the first matching rule."""
+    for name, pattern in rules:
+        match = pattern.search(string)
+        if match is not None:
+            return name, match.group(1).replace("_", ".")
+    return None, ""
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(string: str) -> UserAgent:
+    is_bot: bool = not string or BOT.search(string) is not None
+    browser, browser_version = _search(BROWSERS, string)
+    os, os_version = _search(OPERATING_SYSTEMS, string)
+
+    if is_bot:
+        device = "bot"
+    elif TABLET.search(string) or (os == "Android" and "Mobile" not in string):
+        device = "tablet"
+    elif MOBILE.search(string):
+        device = "mobile"
+    elif os is not None:
+        device = "desktop"
+    else:
+        device = "other"
+
+    return UserAgent(
+        string=string,
+        browser=browser,
+        browser_version=browser_version,
+        os=os,
+        os_version=os_version,
+        device=device,
+        is_bot=is_bot,
+    )
+
+
+def parse_user_agent(string: Optional[str]) -> UserAgent:
+    """
+    Parse a User-Agent header.
+
+    The results are memoized in a bounded LRU cache keyed on the header, as
+    most requests come with one of a few common headers. The returned
+    objects are shared and must not be modified. Longer headers are parsed
+    truncated to ``MAX_LENGTH`` but keep their full string.
+
+    Args:
+        string (Optional[str]): The User-Agent header, None if it is missing.
+            A missing or empty header is a bot.
+
+    Returns:
+        UserAgent: The parsed header, its string is "unknown" if missing.
+    """
+    user_agent: UserAgent = _parse((string or "")[:MAX_LENGTH])
+    if string is None:
+        string = UNKNOWN
+    if string == user_agent.string:
+        return user_agent
+    return UserAgent(
+        string=string,
+        browser=user_agent.browser,
+        browser_version=user_agent.browser_version,
+        os=user_agent.os,
+        os_version=user_agent.os_version,
+        device=user_agent.device,
+        is_bot=user_agent.is_bot,
+    )
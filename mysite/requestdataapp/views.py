@@ -1,8 +1,12 @@
 from collections.abc import Callable
+from django.conf import settings
 from django.core.files.storage import FileSystemStorage
 from django.shortcuts import render
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, HttpResponseForbidden, JsonResponse
+from redis.exceptions import RedisError
+from .cache_stats import namespace_stats
 from .forms import UploadForm
+from .metrics import registry
 from loguru import logger as log
 from functools import wraps
 
@@ -104,3 +108,50 @@ def handle_file_upload(request: HttpRequest) -> HttpResponse:
         template_name="requestdataapp/file-upload.html",
         context=context,
     )
+
+
+def metrics_view(request: HttpRequest) -> HttpResponse:
+    """
+    Expose the metrics of all the workers in the Prometheus text format.
+
+    Only staff users and the addresses of ``METRICS_ALLOWED_IPS`` can read
+    the metrics.
+
+    Args:
+        request: The HttpRequest object.
+
+    Returns:
+        HttpResponse: The metrics, 503 if Redis cannot be reached.
+    """
+    if (
+        request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS
+        and not request.user.is_staff
+    ):
+        return HttpResponseForbidden()
+    try:
+        content = registry.render()
+    except RedisError as error:
+        log.warning("Metrics unavailable: {error}", error=error)
+        return HttpResponse(status=503)
+    return HttpResponse(content, content_type="text/plain; version=0.0.4")
+
+
+def cache_stats_view(request: HttpRequest) -> HttpResponse:
+    """
+    Expose the cache usage by key namespace as JSON, to staff users only.
+
+    Args:
+        request: The HttpRequest object.
+
+    Returns:
+        HttpResponse: The statistics of ``namespace_stats()`` under
+            "namespaces", 503 if Redis cannot be reached.
+    """
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    try:
+        stats = namespace_stats()
+    except RedisError as error:
+        log.warning("Metrics unavailable: {error}", error=error)
+        return HttpResponse(status=503)
+    return JsonResponse({"namespaces": stats})
@@ -4,20 +4,31 @@ Module for registering admins for the application/site
 
 from django.urls import path
 from http.client import HTTPResponse
+from uuid import uuid4
 
 from django.db.models import Model
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Any
 from django.contrib import admin
 from django.db.models import QuerySet
-from django.http import HttpRequest
+from django.http import HttpRequest, JsonResponse
 from django.shortcuts import render, redirect
+from django.utils import timezone
 
 from .models import Product, Order, ProductImage
 from .admin_mixins import ExportAsCSVMixin
 
 from .forms import CSVImportForm, JSONImportForm
 from typing import Dict
-from .utils import save_csv_products, save_json_orders
+from .utils import (
+    get_import_progress,
+    load_json_orders,
+    save_orders_data,
+    save_product_rows,
+    validate_csv_products,
+    validate_orders_data,
+    touch_product_orders,
+    invalidate_products,
+)
 
 
 class OrderInline(admin.TabularInline):
@@ -35,7 +46,9 @@ def make_archived(
     modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet
 ):
     """Action to archive products."""
-    queryset.update(archived=True)
+    queryset.update(archived=True, updated_at=timezone.now())
+    touch_product_orders(queryset.values("pk"))
+    invalidate_products(queryset.values_list("pk", flat=True))
 
 
 @admin.action(description="Unarchived products")
@@ -43,7 +56,9 @@ def make_unarchived(
     modeladmin: admin.ModelAdmin, request: HttpRequest, queryset: QuerySet
 ):
     """Action to un archive products."""
-    queryset.update(archived=False)
+    queryset.update(archived=False, updated_at=timezone.now())
+    touch_product_orders(queryset.values("pk"))
+    invalidate_products(queryset.values_list("pk", flat=True))
 
 
 @admin.register(Product)
@@ -87,9 +102,14 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
     ]
 
     def import_csv(self, request: HttpRequest) -> HTTPResponse:
-        """Method for importing CSV file."""
+        """
+        Method for importing CSV file.
+
+        The whole file is validated first. With "dry run" checked, or when
+        some rows are invalid, the report is rendered and nothing is written.
+        """
         if request.method == "GET":
-            form: CSVImportForm = CSVImportForm()
+            form: CSVImportForm = CSVImportForm(initial={"task_id": uuid4().hex})
             context: Dict[str, Optional[CSVImportForm]] = {
                 "form": form,
             }
@@ -107,13 +127,29 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
                 context=context,
                 status=400,
             )
-        save_csv_products(
+        report: Dict[str, Any] = validate_csv_products(
             csv_file=form.cleaned_data["csv_file"].file, encoding=request.encoding
         )
+        if form.cleaned_data["dry_run"] or report["errors"]:
+            context: Dict[str, Any] = {
+                "form": CSVImportForm(initial={"task_id": uuid4().hex}),
+                "report": report,
+            }
+            return render(
+                request=request,
+                template_name="admin/csv_form.html",
+                context=context,
+                status=400 if report["errors"] else 200,
+            )
+        save_product_rows(rows=report["rows"], task_id=form.cleaned_data["task_id"])
 
         self.message_user(request=request, message="Data from CSV was imported.")
         return redirect(to="..")
 
+    def import_progress(self, request: HttpRequest, task_id: str) -> JsonResponse:
+        """Return the progress of an import for the admin page to poll."""
+        return JsonResponse(get_import_progress(task_id) or {"status": "pending"})
+
     def get_urls(self) -> List[path]:
         urls: List[path] = super().get_urls()
         new_urls: List[path] = [
@@ -121,7 +157,12 @@ class ProductAdmin(admin.ModelAdmin, ExportAsCSVMixin):
                 "import-products-csv/",
                 self.import_csv,
                 name="import_products_csv",
-            )
+            ),
+            path(
+                "import-progress/<str:task_id>/",
+                self.admin_site.admin_view(self.import_progress),
+                name="import_products_progress",
+            ),
         ]
         return new_urls + urls
 
@@ -160,9 +201,14 @@ class OrderAdmin(admin.ModelAdmin):
         return obj.user.first_name or obj.user.username
 
     def import_json(self, request: HttpRequest) -> HTTPResponse:
-        """Method for importing JSON file."""
+        """
+        Method for importing JSON file.
+
+        Every order is validated first. With "dry run" checked, or when some
+        orders are invalid, the report is rendered and nothing is written.
+        """
         if request.method == "GET":
-            json_form: JSONImportForm = JSONImportForm()
+            json_form: JSONImportForm = JSONImportForm(initial={"task_id": uuid4().hex})
             context: Dict[str, Optional[JSONImportForm]] = {
                 "form": json_form,
             }
@@ -182,19 +228,25 @@ class OrderAdmin(admin.ModelAdmin):
                 status=400,
             )
         try:
-            json_file = json_form.cleaned_data["json_file"]
-            json_file.seek(0)
-            added_file = save_json_orders(
+            orders_data: List[Dict] = load_json_orders(
                 json_file=json_form.cleaned_data["json_file"],
                 encoding=request.encoding,
             )
-
-            if isinstance(added_file, str):
-                message_error: str = added_file
-                self.message_user(
+            report: Dict[str, Any] = validate_orders_data(orders_data)
+            if json_form.cleaned_data["dry_run"] or report["errors"]:
+                context: Dict[str, Any] = {
+                    "form": JSONImportForm(initial={"task_id": uuid4().hex}),
+                    "report": report,
+                }
+                return render(
                     request=request,
-                    message=message_error,
+                    template_name="admin/json_form.html",
+                    context=context,
+                    status=400 if report["errors"] else 200,
                 )
+            save_orders_data(
+                orders_data=orders_data, task_id=json_form.cleaned_data["task_id"]
+            )
 
             self.message_user(
                 request=request,
@@ -209,6 +261,10 @@ class OrderAdmin(admin.ModelAdmin):
             )
             return redirect(to="..")
 
+    def import_progress(self, request: HttpRequest, task_id: str) -> JsonResponse:
+        """Return the progress of an import for the admin page to poll."""
+        return JsonResponse(get_import_progress(task_id) or {"status": "pending"})
+
     def get_urls(self) -> List[path]:
         """Get the URLs for the admin interface, including custom URLs."""
         urls: List[path] = super().get_urls()
@@ -217,6 +273,11 @@ class OrderAdmin(admin.ModelAdmin):
                 "import-orders-json/",
                 self.import_json,
                 name="import_orders_json",
-            )
+            ),
+            path(
+                "import-progress/<str:task_id>/",
+                self.admin_site.admin_view(self.import_progress),
+                name="import_orders_progress",
+            ),
         ]
         return new_urls + urls
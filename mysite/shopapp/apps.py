@@ -10,3 +10,7 @@ class ShopappConfig(AppConfig):
 
     default_auto_field: str = "django.db.models.BigAutoField"
     name: str = "shopapp"
+
+    def ready(self) -> None:
+        """Connect the signal receivers of the application."""
+        from . import signals  # noqa: F401
@@ -0,0 +1,334 @@
+"""
+Module with the content negotiation and compression of the Shopapp exports.
+"""
+
+import json
+import zlib
+from csv import writer as csv_writer
+from datetime import datetime, timedelta
+from hashlib import md5
+from urllib.parse import urlencode
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.http import HttpRequest, HttpResponse, StreamingHttpResponse
+from django.http.request import MediaType
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
+from django.utils.translation import get_language
+
+EXPORT_FORMATS: Dict[str, str] = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+EXPORT_ARTIFACT_KEY: str = "export_artifact:{name}:{digest}"
+EXPORT_ARTIFACT_TIMEOUT: int = 24 * 60 * 60
+GZIP_LEVEL: int = 6
+ROWS_PER_CHUNK: int = 500
+CURSOR_SALT: str = "shopapp.exports.cursor"
+# Rows saved by transactions that were still running when a delta export was
+# built carry an older updated_at: the next cursor starts before the oldest
+# running transaction, with an overlap for the timestamps taken before it
+# wrote anything and for the databases not reporting it.
+CURSOR_OVERLAP: timedelta = timedelta(seconds=5)
+# Tombstones of the deletions are kept that long (see the prune_deleted_objects
+# command), older cursors must start over with a full sync.
+DELETED_OBJECTS_RETENTION: timedelta = timedelta(days=30)
+
+
+class CursorExpired(ValueError):
+    """The ``since`` cursor is older than the retention of the tombstones."""
+
+
+def _quality(media_type: MediaType) -> float:
+    """Return the q parameter of an Accept header item."""
+    try:
+        return float(media_type.params.get("q", 1))
+    except ValueError:
+        return 0.0
+
+
+def negotiate_format(
+    request: HttpRequest, formats: Sequence[str], default: str
+) -> Optional[str]:
+    """
+    Pick the export format from the ``Accept`` header.
+
+    Args:
+        request (HttpRequest): The incoming request.
+        formats (Sequence[str]): Keys of ``EXPORT_FORMATS`` offered by the view.
+        default (str): Format used for a missing header or wildcards.
+
+    Returns:
+        Optional[str]: The chosen format, or None if none is acceptable.
+    """
+    header: str = request.headers.get("Accept", "")
+    if not header.strip():
+        return default
+    media_types: List[MediaType] = [
+        MediaType(token) for token in header.split(",") if token.strip()
+    ]
+    # Wildcards resolve to the default format first.
+    ordered: List[str] = [default] + [item for item in formats if item != default]
+    # sorted() is stable, so equally weighted types keep the client's order.
+    for media_type in sorted(media_types, key=_quality, reverse=True):
+        if _quality(media_type) <= 0:
+            break
+        for export_format in ordered:
+            if media_type.match(EXPORT_FORMATS[export_format]):
+                return export_format
+    return None
+
+
+def accepts_gzip(request: HttpRequest) -> bool:
+    """
+    Return True if the ``Accept-Encoding`` header allows gzip.
+
+    An explicit ``gzip`` entry takes precedence over ``*``, and a quality
+    of 0 means not acceptable.
+    """
+    qualities: Dict[str, float] = {}
+    for token in request.headers.get("Accept-Encoding", "").split(","):
+        coding, *params = token.split(";")
+        quality: float = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities.setdefault(coding.strip().lower(), quality)
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
+
+def oldest_transaction_start() -> Optional[datetime]:
+    """
+    Return the start of the oldest other transaction that has written data.
+
+    Only PostgreSQL reports it, None is returned on the other databases.
+    """
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT MIN(xact_start) FROM pg_stat_activity "
+            "WHERE datname = current_database() AND backend_xid IS NOT NULL "
+            "AND pid <> pg_backend_pid()"
+        )
+        return cursor.fetchone()[0]
+
+
+def cursor_start() -> datetime:
+    """
+    Return the moment the next delta export must start at.
+
+    Rows written by the running transactions, e.g. a long import, become
+    visible when it commits but keep the updated_at of their save, so the
+    next export starts before the oldest of them.
+    """
+    now: datetime = timezone.now()
+    started_at: Optional[datetime] = oldest_transaction_start()
+    return now if started_at is None else min(now, started_at)
+
+
+def make_cursor(moment: datetime) -> str:
+    """Return the opaque ``since`` token of a delta export starting at the moment."""
+    return signing.dumps((moment - CURSOR_OVERLAP).isoformat(), salt=CURSOR_SALT)
+
+
+def parse_cursor(token: str) -> Optional[datetime]:
+    """
+    Read the ``since`` parameter of a delta export.
+
+    Args:
+        token (str): A token returned as ``next_cursor``, an ISO 8601 datetime,
+            or an empty string to request the first full sync.
+
+    Returns:
+        Optional[datetime]: The moment to export changes after, None for a
+            full sync.
+
+    Raises:
+        CursorExpired: If the deletions since the moment may have been pruned.
+        ValueError: If the token is neither a valid cursor nor a datetime.
+    """
+    if not token:
+        return None
+    try:
+        moment: Optional[datetime] = parse_datetime(
+            signing.loads(token, salt=CURSOR_SALT)
+        )
+    except signing.BadSignature:
+        moment = parse_datetime(token)
+    if moment is None:
+        raise ValueError("Invalid cursor")
+    if is_naive(moment):
+        moment = make_aware(moment)
+    if moment < timezone.now() - DELETED_OBJECTS_RETENTION:
+        raise CursorExpired("Expired cursor")
+    return moment
+
+
+def gzip_stream(
+    chunks: Iterable[bytes], on_complete: Optional[Callable[[bytes], None]] = None
+) -> Iterator[bytes]:
+    """
+    Compress the chunks into a gzip stream while they are produced.
+
+    Args:
+        chunks (Iterable[bytes]): The uncompressed document.
+        on_complete (Optional[Callable[[bytes], None]]): Called with the whole
+            compressed document once the stream has been fully consumed.
+
+    Yields:
+        bytes: Parts of the gzip stream.
+    """
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    parts: List[bytes] = []
+    for chunk in chunks:
+        data: bytes = compressor.compress(chunk)
+        if data:
+            parts.append(data)
+            yield data
+    data = compressor.flush()
+    parts.append(data)
+    yield data
+    if on_complete is not None:
+        on_complete(b"".join(parts))
+
+
+def _batched(rows: Iterable[Any], size: int = ROWS_PER_CHUNK) -> Iterator[List[Any]]:
+    """Group the rows into lists of at most ``size`` items."""
+    batch: List[Any] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def render_json(rows: Iterable[Dict[str, Any]], root: str) -> Iterator[bytes]:
+    """Render the rows as ``{"<root>": [...]}`` one chunk at a time."""
+    yield '{{"{root}": ['.format(root=root).encode()
+    separator: str = ""
+    for batch in _batched(rows):
+        yield (
+            separator
+            + ", ".join(json.dumps(row, cls=DjangoJSONEncoder) for row in batch)
+        ).encode()
+        separator = ", "
+    yield b"]}"
+
+
+def render_ndjson(rows: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """Render the rows as newline delimited JSON, one object per line."""
+    for batch in _batched(rows):
+        yield "".join(
+            json.dumps(row, cls=DjangoJSONEncoder) + "\n" for row in batch
+        ).encode()
+
+
+class Echo:
+    """File-like object whose ``write`` returns the value instead of storing it."""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def render_csv(
+    rows: Iterable[Dict[str, Any]], fields: Sequence[str]
+) -> Iterator[bytes]:
+    """Render the rows as CSV with a header row."""
+    writer = csv_writer(Echo())
+    yield writer.writerow(fields).encode()
+    for batch in _batched(rows):
+        yield "".join(
+            writer.writerow([row[field] for field in fields]) for row in batch
+        ).encode()
+
+
+def export_response(
+    request: HttpRequest,
+    name: str,
+    export_format: str,
+    version: Any,
+    chunks: Callable[[], Iterable[bytes]],
+    filename: Optional[str] = None,
+    query_params: Sequence[str] = (),
+) -> HttpResponse | StreamingHttpResponse:
+    """
+    Build the response of an export, gzip-compressed if the client accepts it.
+
+    Compressed documents are streamed while they are produced and then
+    cached under the content version, the language and the query parameters
+    the export uses, so repeated downloads of an unchanged export are served
+    from the cache without producing or compressing anything. Other
+    parameters are left out of the key, so they cannot fill the cache with
+    copies of the same export.
+
+    Args:
+        request (HttpRequest): The incoming request.
+        name (str): Name of the export, part of the cache key.
+        export_format (str): Key of ``EXPORT_FORMATS``.
+        version (Any): Content version of the exported data.
+        chunks (Callable[[], Iterable[bytes]]): Produces the uncompressed document.
+        filename (Optional[str]): Sets ``Content-Disposition`` if given.
+        query_params (Sequence[str]): The query parameters changing the
+            document, e.g. the filters of the exported queryset.
+
+    Returns:
+        HttpResponse | StreamingHttpResponse: The export response.
+    """
+    content_type: str = EXPORT_FORMATS[export_format]
+    if export_format != "csv":
+        content_type += "; charset=utf-8"
+
+    if accepts_gzip(request):
+        digest: str = md5(
+            "{format}|{language}|{query}|{version}".format(
+                format=export_format,
+                language=get_language(),
+                query=urlencode(
+                    [
+                        (param, value)
+                        for param in sorted(set(query_params))
+                        for value in request.GET.getlist(param)
+                        if value
+                    ]
+                ),
+                version=version,
+            ).encode()
+        ).hexdigest()
+        key: str = EXPORT_ARTIFACT_KEY.format(name=name, digest=digest)
+        artifact: Optional[bytes] = cache.get(key)
+        if artifact is not None:
+            response = HttpResponse(artifact, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(
+                gzip_stream(
+                    chunks(),
+                    on_complete=lambda data: cache.set(
+                        key, data, EXPORT_ARTIFACT_TIMEOUT
+                    ),
+                ),
+                content_type=content_type,
+            )
+        response["Content-Encoding"] = "gzip"
+    else:
+        response = StreamingHttpResponse(chunks(), content_type=content_type)
+
+    if filename:
+        response["Content-Disposition"] = "attachment; filename={filename}".format(
+            filename=filename
+        )
+    patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+    return response
@@ -247,11 +247,31 @@ class GroupForm(forms.ModelForm):
         }
 
 
-class CSVImportForm(forms.Form):
+class ImportForm(forms.Form):
+    """
+    Base form for the admin imports.
+
+    Attributes:
+        dry_run (BooleanField): Validate the whole file without writing it.
+        task_id (CharField): Identifier the admin page uses to poll the
+            progress of the import.
+    """
+
+    dry_run: Field = forms.BooleanField(
+        required=False,
+        label=_("Dry run"),
+        help_text=_("Only validate the file and estimate the import duration"),
+    )
+    task_id: Field = forms.CharField(required=False, widget=forms.HiddenInput)
+
+
+class CSVImportForm(ImportForm):
     """Form for importing CSV data."""
 
     csv_file: Field = forms.FileField(label=_("CSV file"))
 
+    field_order: List[str] = ["csv_file", "dry_run", "task_id"]
+
     def clean_csv_file(self):
         csv_file = self.cleaned_data.get("csv_file")
         if not csv_file.name.endswith(".csv"):
@@ -259,30 +279,28 @@ class CSVImportForm(forms.Form):
         return csv_file
 
 
-class JSONImportForm(forms.Form):
+class JSONImportForm(ImportForm):
     """Form for importing JSON data."""
 
     json_file: Field = forms.FileField(
         label=_("JSON file"),
     )
 
+    field_order: List[str] = ["json_file", "dry_run", "task_id"]
+
     def clean_json_file(self):
-        """Validates the JSON file."""
+        """
+        Validates the JSON file format.
+
+        The orders themselves are validated by ``validate_orders_data``,
+        which reports the errors of every order at once.
+        """
         json_file = self.cleaned_data.get("json_file")
         if not json_file.name.endswith(".json"):
             raise forms.ValidationError(_("The file must have an extension .json"))
         try:
-            data = json.load(json_file)
-            validated_orders = []
-            for order_data in data:
-                form: OrderForm = OrderForm(data=order_data)
-                if not form.is_valid():
-                    error_messages = form.errors.as_data()
-                    raise forms.ValidationError(error_messages)
-                validated_orders.append(form.cleaned_data)
-            return json_file
-
-        except json.JSONDecodeError:
+            json.load(json_file)
+        except (json.JSONDecodeError, UnicodeDecodeError):
             raise forms.ValidationError(_("Invalid JSON format"))
-        except Exception as error_message:
-            raise forms.ValidationError(str(error_message))
+        json_file.seek(0)
+        return json_file
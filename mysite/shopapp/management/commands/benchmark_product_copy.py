@@ -0,0 +1,96 @@
+from decimal import Decimal
+from io import StringIO
+from timeit import default_timer
+from typing import Any, Callable, Dict, List
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from shopapp.models import Product
+from shopapp.utils import bulk_insert_products, use_copy, write_products_csv
+
+
+class Command(BaseCommand):
+    """
+    Compare the COPY and the batched ORM paths of product import and export.
+
+    Every measurement runs inside a transaction that is rolled back, so the
+    command can be run against a database with real data.
+
+    Example:
+        python manage.py benchmark_product_copy --rows 100000
+    """
+
+    help = "Benchmark COPY against batched ORM for product import and export"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--rows", type=int, default=20000)
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def measure(self, label: str, rows: int, action: Callable[[], Any]) -> float:
+        """Run the action in a rolled back transaction and print its throughput."""
+        with transaction.atomic():
+            started_at: float = default_timer()
+            action()
+            elapsed: float = default_timer() - started_at
+            transaction.set_rollback(True)
+        self.stdout.write(
+            "{label:<12} {rows} rows in {elapsed:.3f}s ({rate:.0f} rows/s)".format(
+                label=label, rows=rows, elapsed=elapsed, rate=rows / elapsed
+            )
+        )
+        return elapsed
+
+    def handle(self, *args, **options) -> None:
+        count: int = options["rows"]
+        rows: List[Dict[str, Any]] = [
+            {
+                "name": "Benchmark product {number}".format(number=number),
+                "description": "Benchmark description {number}".format(number=number),
+                "price": Decimal("{number}.99".format(number=number % 10000)),
+                "discount": number % 50,
+            }
+            for number in range(count)
+        ]
+        fields: List[str] = ["name", "description", "price", "discount"]
+
+        def import_and_export(copy: bool) -> None:
+            ids: List[int] = bulk_insert_products(
+                rows, batch_size=options["batch_size"], copy=copy
+            )
+            write_products_csv(
+                queryset=Product.objects.filter(pk__in=ids),
+                fields=fields,
+                stream=StringIO(),
+                copy=copy,
+            )
+
+        self.stdout.write(
+            self.style.SUCCESS("Benchmark {count} products".format(count=count))
+        )
+        orm_import: float = self.measure(
+            "orm import",
+            count,
+            lambda: bulk_insert_products(
+                rows, batch_size=options["batch_size"], copy=False
+            ),
+        )
+        self.measure("orm total", count, lambda: import_and_export(copy=False))
+
+        if not use_copy():
+            self.stdout.write(
+                self.style.WARNING("COPY is only available on PostgreSQL, skipped")
+            )
+            return
+
+        copy_import: float = self.measure(
+            "copy import", count, lambda: bulk_insert_products(rows, copy=True)
+        )
+        self.measure("copy total", count, lambda: import_and_export(copy=True))
+        self.stdout.write(
+            self.style.SUCCESS(
+                "COPY import is {ratio:.1f}x faster".format(
+                    ratio=orm_import / copy_import
+                )
+            )
+        )
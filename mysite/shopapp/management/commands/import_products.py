@@ -0,0 +1,263 @@
+import codecs
+import csv
+import io
+import mmap
+import os
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from itertools import islice
+from timeit import default_timer
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+import django
+from django.core.exceptions import ValidationError
+from django.core.management import BaseCommand, CommandError
+from django.db import connections
+
+from shopapp.utils import bulk_insert_products, validate_product_row
+
+
+def split_byte_ranges(
+    path: str, chunk_size: int, encoding: str = "utf-8"
+) -> Tuple[List[str], List[Tuple[int, int, int]]]:
+    """
+    Split a CSV file into byte ranges aligned to line boundaries.
+
+    Every range starts right after a newline and ends right after one, so each
+    range can be parsed independently. Quoted values spanning several lines
+    are therefore not supported.
+
+    Args:
+        path (str): Path to the CSV file.
+        chunk_size (int): Approximate size of a range in bytes.
+        encoding (str, optional): Encoding of the file, a UTF-8 BOM is skipped.
+            Defaults to "utf-8".
+
+    Returns:
+        Tuple[List[str], List[Tuple[int, int, int]]]: The header columns and
+            the ``(start, end, first_line)`` of the data ranges: their byte
+            offsets and the line number of their first row in the file.
+    """
+    if codecs.lookup(encoding).name == "utf-8":
+        encoding = "utf-8-sig"
+    with open(path, mode="rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return [], []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            size: int = len(mapped)
+            header_end: int = mapped.find(b"\n")
+            header_end = size if header_end == -1 else header_end + 1
+            header: List[str] = next(
+                csv.reader([mapped[:header_end].decode(encoding).strip()])
+            )
+
+            ranges: List[Tuple[int, int, int]] = []
+            start: int = header_end
+            line: int = 2
+            while start < size:
+                end: int = mapped.find(b"\n", min(start + chunk_size, size))
+                end = size if end == -1 else end + 1
+                ranges.append((start, end, line))
+                line += mapped[start:end].count(b"\n")
+                start = end
+    return header, ranges
+
+
+def parse_byte_range(
+    path: str, start: int, end: int, first_line: int, header: List[str], encoding: str
+) -> Dict[str, Any]:
+    """
+    Parse and validate one byte range of the CSV file in a worker process.
+
+    Args:
+        path (str): Path to the CSV file.
+        start (int): Offset of the first byte of the range.
+        end (int): Offset right after the last byte of the range.
+        first_line (int): Line number of the first row of the range in the file.
+        header (List[str]): Column names taken from the first line.
+        encoding (str): Encoding of the file.
+
+    Returns:
+        Dict[str, Any]: The worker pid, the validated rows, the row errors
+            and the time spent on parsing and validation.
+    """
+    started_at: float = default_timer()
+    with open(path, mode="rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            text: str = mapped[start:end].decode(encoding)
+
+    rows: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    reader = csv.DictReader(io.StringIO(text), fieldnames=header)
+    for line_number, row in enumerate(reader, start=first_line):
+        try:
+            rows.append(validate_product_row(row))
+        except ValidationError as error:
+            errors.append(
+                "line {line}: {error}".format(
+                    line=line_number, error=error.message_dict
+                )
+            )
+
+    return {
+        "pid": os.getpid(),
+        "rows": rows,
+        "errors": errors,
+        "elapsed": default_timer() - started_at,
+    }
+
+
+def iter_parsed_ranges(
+    executor: ProcessPoolExecutor,
+    path: str,
+    ranges: List[Tuple[int, int, int]],
+    header: List[str],
+    encoding: str,
+    max_in_flight: int,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Parse the byte ranges in the pool, yielding the results as they complete.
+
+    At most ``max_in_flight`` ranges are submitted at a time, so the parsed
+    rows waiting for the writer stay bounded whatever the size of the file.
+
+    Args:
+        executor (ProcessPoolExecutor): The pool of parser processes.
+        path (str): Path to the CSV file.
+        ranges (List[Tuple[int, int, int]]): The ranges of ``split_byte_ranges``.
+        header (List[str]): Column names taken from the first line.
+        encoding (str): Encoding of the file.
+        max_in_flight (int): Maximum number of submitted ranges not yet read.
+
+    Yields:
+        Dict[str, Any]: The results of ``parse_byte_range``.
+    """
+    remaining = iter(ranges)
+    pending: Set[Future] = set()
+    while True:
+        for start, end, first_line in islice(remaining, max_in_flight - len(pending)):
+            pending.add(
+                executor.submit(
+                    parse_byte_range, path, start, end, first_line, header, encoding
+                )
+            )
+        if not pending:
+            return
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+class Command(BaseCommand):
+    """
+    Import products from a large CSV file using several processes.
+
+    The file is split into byte ranges with mmap, each range is parsed and
+    validated in a process pool, and the main process is the only writer:
+    it inserts the validated rows (with COPY on PostgreSQL) as soon as a
+    range is ready, while the workers keep parsing the next ones.
+
+    Example:
+        python manage.py import_products products.csv --workers 16
+    """
+
+    help = "Import products from a CSV file using a pool of parser processes"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("csv_path", type=str, help="Path to the CSV file")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of parser processes (default: number of CPUs)",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=4 * 1024 * 1024,
+            help="Approximate size of a byte range in bytes (default: 4 MiB)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows per INSERT statement without COPY (default: 1000)",
+        )
+        parser.add_argument("--encoding", type=str, default="utf-8")
+
+    def handle(self, *args, **options) -> None:
+        csv_path: str = options["csv_path"]
+        if not os.path.isfile(csv_path):
+            raise CommandError("File {path} does not exist".format(path=csv_path))
+
+        started_at: float = default_timer()
+        header, ranges = split_byte_ranges(
+            csv_path, options["chunk_size"], options["encoding"]
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Import {path}: {count} ranges, {workers} workers".format(
+                    path=csv_path, count=len(ranges), workers=options["workers"]
+                )
+            )
+        )
+
+        # Forked workers must not share the parent's database sockets.
+        connections.close_all()
+
+        imported: int = 0
+        errors: List[str] = []
+        write_time: float = 0.0
+        worker_stats: Dict[int, Dict[str, float]] = defaultdict(
+            lambda: {"rows": 0, "elapsed": 0.0}
+        )
+        # The workers set Django up themselves, they are not forked under the
+        # spawn and forkserver start methods.
+        with ProcessPoolExecutor(
+            max_workers=options["workers"], initializer=django.setup
+        ) as executor:
+            for result in iter_parsed_ranges(
+                executor,
+                csv_path,
+                ranges,
+                header,
+                options["encoding"],
+                max_in_flight=options["workers"] * 2,
+            ):
+                stats: Dict[str, float] = worker_stats[result["pid"]]
+                stats["rows"] += len(result["rows"]) + len(result["errors"])
+                stats["elapsed"] += result["elapsed"]
+                errors.extend(result["errors"])
+
+                write_started_at: float = default_timer()
+                bulk_insert_products(result["rows"], batch_size=options["batch_size"])
+                write_time += default_timer() - write_started_at
+                imported += len(result["rows"])
+
+        for error in errors:
+            self.stderr.write(error)
+
+        for pid, stats in sorted(worker_stats.items()):
+            self.stdout.write(
+                "worker {pid}: {rows} rows in {elapsed:.2f}s ({rate:.0f} rows/s)".format(
+                    pid=pid,
+                    rows=int(stats["rows"]),
+                    elapsed=stats["elapsed"],
+                    rate=stats["rows"] / stats["elapsed"] if stats["elapsed"] else 0,
+                )
+            )
+
+        elapsed: float = default_timer() - started_at
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Imported {imported} products, {failed} rows rejected, "
+                "{elapsed:.2f}s total ({write_time:.2f}s writing, "
+                "{rate:.0f} rows/s)".format(
+                    imported=imported,
+                    failed=len(errors),
+                    elapsed=elapsed,
+                    write_time=write_time,
+                    rate=imported / elapsed if elapsed else 0,
+                )
+            )
+        )
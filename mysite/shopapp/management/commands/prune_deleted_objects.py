@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from shopapp.exports import DELETED_OBJECTS_RETENTION
+from shopapp.utils import prune_deleted_objects
+
+
+class Command(BaseCommand):
+    """
+    Delete the tombstones older than the retention of the delta exports.
+
+    The cursors older than the retention are refused by the delta exports,
+    their clients start over with a full sync, so the tombstones are no
+    longer needed. Run it daily, e.g. from cron.
+
+    Example:
+        python manage.py prune_deleted_objects
+    """
+
+    help = "Delete the tombstones of the deletions older than the retention"
+
+    def handle(self, *args, **options) -> None:
+        before: datetime = timezone.now() - DELETED_OBJECTS_RETENTION
+        count: int = prune_deleted_objects(before)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Deleted {count} tombstones older than {before}".format(
+                    count=count, before=before.isoformat()
+                )
+            )
+        )
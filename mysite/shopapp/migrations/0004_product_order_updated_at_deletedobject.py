@@ -0,0 +1,50 @@
+# Generated by Django 5.0.7 on 2026-10-19 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shopapp", "0003_alter_product_description_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name="DeletedObject",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("model_label", models.CharField(max_length=100)),
+                ("object_pk", models.BigIntegerField()),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "verbose_name": "Deleted object",
+                "verbose_name_plural": "Deleted objects",
+                "indexes": [
+                    models.Index(
+                        fields=["model_label", "deleted_at"],
+                        name="shopapp_del_model_l_51bc52_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -58,6 +58,7 @@ class Product(models.Model):
         price (Decimal): The price of the product, with a maximum of 8 digits, including 2 decimal places. Defaults to 0.
         discount (int): The discount percentage applied to the product, represented as a small integer. Defaults to 0.
         created_at (datetime): The date and time when the product was created. Automatically set when the product is created.
+        updated_at (datetime): The date and time of the last change of the product, used by the delta exports.
         archived (bool): Indicates whether the product is archived. Defaults to False.
     """
 
@@ -73,6 +74,7 @@ class Product(models.Model):
     price: DecimalField = models.DecimalField(default=0, max_digits=8, decimal_places=2)
     discount: PositiveSmallIntegerField = models.PositiveSmallIntegerField(default=0)
     created_at: DateTimeField = models.DateTimeField(auto_now_add=True)
+    updated_at: DateTimeField = models.DateTimeField(auto_now=True, db_index=True)
     archived: BooleanField = models.BooleanField(default=False)
     created_by: ForeignKey = models.ForeignKey(
         to=User, on_delete=models.CASCADE, null=True, blank=True
@@ -157,6 +159,7 @@ class Order(models.Model):
         delivery_address (str): The delivery address for the order. Can be left blank or null.
         promocode (str): A promotional code applied to the order. Can be left blank but cannot be null. Maximum length is 20 characters.
         created_at (datetime): The date and time when the order was created. Automatically set when the order is created.
+        updated_at (datetime): The date and time of the last change of the order or of its products list.
         user (User): A reference to the user who placed the order. If the user is deleted, the order remains (using PROTECT).
         products (ManyToManyField): A many-to-many relationship with the `Product` model. Allows an order to include multiple products.
                                     The related name 'orders' allows accessing all orders for a product.
@@ -174,6 +177,7 @@ class Order(models.Model):
         max_length=20, default=" # 123sale123", null=False, blank=True
     )
     created_at: DateTimeField = models.DateTimeField(auto_now_add=True)
+    updated_at: DateTimeField = models.DateTimeField(auto_now=True, db_index=True)
     user: User = models.ForeignKey(User, on_delete=models.PROTECT)
     products: ManyToManyField = models.ManyToManyField(
         to=Product, related_name="orders"
@@ -189,3 +193,29 @@ class Order(models.Model):
     def __str__(self) -> str:
         """Return a string representation of the order."""
         return "Order #{order_id}".format(order_id=self.id)
+
+
+class DeletedObject(models.Model):
+    """
+    Tombstone of a deleted product or order, read by the delta exports.
+
+    Attributes:
+        model_label (str): Label of the model of the deleted object, e.g. "shopapp.product".
+        object_pk (int): Primary key the deleted object had.
+        deleted_at (datetime): The date and time of the deletion.
+    """
+
+    class Meta:
+        indexes: List[models.Index] = [
+            models.Index(fields=["model_label", "deleted_at"]),
+        ]
+        verbose_name: Tuple[str] = _("Deleted object")
+        verbose_name_plural: Tuple[str] = _("Deleted objects")
+
+    model_label: CharField = models.CharField(max_length=100)
+    object_pk: models.BigIntegerField = models.BigIntegerField()
+    deleted_at: DateTimeField = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self) -> str:
+        """Return a string representation of the tombstone."""
+        return "{label} #{pk}".format(label=self.model_label, pk=self.object_pk)
@@ -0,0 +1,128 @@
+"""
+Signal receivers of the application Shopapp.
+"""
+
+from typing import Set
+
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from mysite.cache import (
+    bump_model_version_on_commit,
+    instance_tag,
+    invalidate_tags_on_commit,
+)
+
+from .models import DeletedObject, Order, Product
+from .utils import touch_product_orders
+
+USER_ORDERS_TAG: str = "user:{pk}:orders"
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, **kwargs) -> None:
+    """Invalidate the cached product exports."""
+    bump_model_version_on_commit(Product)
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+@receiver(m2m_changed, sender=Order.products.through)
+def order_changed(sender, **kwargs) -> None:
+    """Invalidate the cached order exports."""
+    bump_model_version_on_commit(Order)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_fragments(sender, instance, **kwargs) -> None:
+    """Invalidate the cached fragments showing the product, its orders too."""
+    invalidate_tags_on_commit([instance_tag(instance)])
+
+
+@receiver(post_save, sender=Order)
+@receiver(post_delete, sender=Order)
+def invalidate_order_fragments(sender, instance, **kwargs) -> None:
+    """Invalidate the cached fragments showing the order or its user's orders."""
+    invalidate_tags_on_commit(
+        [instance_tag(instance), USER_ORDERS_TAG.format(pk=instance.user_id)]
+    )
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def invalidate_order_products_fragments(
+    sender, instance, action, reverse, pk_set, **kwargs
+) -> None:
+    """Invalidate the cached fragments of the orders whose products have changed."""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        orders = [instance]
+    elif pk_set:
+        orders = Order.objects.filter(pk__in=pk_set).only("pk", "user_id")
+    else:
+        # The cleared orders are unknown, but their fragments carry the product tag.
+        invalidate_tags_on_commit([instance_tag(instance)])
+        return
+    tags: Set[str] = set()
+    for order in orders:
+        tags.update((instance_tag(order), USER_ORDERS_TAG.format(pk=order.user_id)))
+    invalidate_tags_on_commit(tags)
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Order)
+def create_tombstone(sender, instance, **kwargs) -> None:
+    """Remember the deletion for the delta exports."""
+    DeletedObject.objects.create(
+        model_label=sender._meta.label_lower, object_pk=instance.pk
+    )
+
+
+@receiver(m2m_changed, sender=Order.products.through)
+def touch_order_products(sender, instance, action, reverse, pk_set, **kwargs) -> None:
+    """Move ``updated_at`` of the orders whose products list has changed."""
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        orders = Order.objects.filter(pk=instance.pk)
+    elif pk_set:
+        orders = Order.objects.filter(pk__in=pk_set)
+    else:
+        # A cleared reverse relation does not report which orders were affected.
+        orders = Order.objects.none()
+    orders.update(updated_at=timezone.now())
+
+
+@receiver(pre_save, sender=Product)
+def touch_archived_product_orders(
+    sender, instance, raw, update_fields, **kwargs
+) -> None:
+    """Move ``updated_at`` of the orders of a product being (un)archived."""
+    if raw or instance.pk is None:
+        return
+    if update_fields is not None and "archived" not in update_fields:
+        return
+    if (
+        Product.objects.filter(pk=instance.pk)
+        .exclude(archived=instance.archived)
+        .exists()
+    ):
+        touch_product_orders([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def touch_deleted_product_orders(sender, instance, **kwargs) -> None:
+    """
+    Move ``updated_at`` of the orders of a product being deleted, the
+    cascade removes it from their products lists without ``m2m_changed``.
+    """
+    touch_product_orders([instance.pk])
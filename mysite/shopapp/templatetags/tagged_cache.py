@@ -0,0 +1,89 @@
+"""
+Template fragment cache invalidated by dependency tags.
+
+Usage::
+
+    {% load tagged_cache %}
+    {% tagged_cache 86400 order_info order.pk tags order order.products.all %}
+        .. order block ..
+    {% endtagged_cache %}
+
+The arguments before ``tags`` are those of the ``{% cache %}`` tag, the ones
+after it are the tags of the fragment: strings such as ``"user:3:orders"``,
+model instances, tagged ``<model name>:<pk>``, or iterables of them. The
+fragment is cached per language and is invalidated with ``invalidate_tags()``
+when any of its tags is, see ``shopapp.signals``.
+"""
+
+from typing import Any, List
+
+from django.db.models import Model
+from django.template import Library, TemplateSyntaxError
+from django.templatetags.cache import CacheNode
+from django.utils.translation import get_language
+
+from mysite.cache import get_tag_versions, instance_tag
+
+register = Library()
+
+
+def collect_tags(values: List[Any]) -> List[str]:
+    """Return the tags of the values of the ``tags`` arguments."""
+    tags: List[str] = []
+    for value in values:
+        if isinstance(value, Model):
+            tags.append(instance_tag(value))
+        elif isinstance(value, str):
+            tags.append(value)
+        elif value is not None:
+            tags.extend(collect_tags(list(value)))
+    return tags
+
+
+class TagVersions:
+    """
+    Last ``vary_on`` variable of a tagged fragment.
+
+    Resolves to the language and the versions of the tags, so the key of the
+    fragment changes as soon as one of its tags is invalidated.
+    """
+
+    def __init__(self, tags: List[Any]) -> None:
+        self.tags = tags
+
+    def resolve(self, context) -> List[Any]:
+        tags: List[str] = collect_tags([tag.resolve(context) for tag in self.tags])
+        return [get_language(), *get_tag_versions(tags)]
+
+
+@register.tag("tagged_cache")
+def do_tagged_cache(parser, token) -> CacheNode:
+    """
+    Cache a template fragment until it expires or one of its tags is invalidated.
+
+    Usage::
+
+        {% tagged_cache [expire_time] [fragment_name] [var1] .. tags [tag1] .. %}
+    """
+    nodelist = parser.parse(("endtagged_cache",))
+    parser.delete_first_token()
+    tokens: List[str] = token.split_contents()
+    if tokens[-1].startswith("using="):
+        cache_name = parser.compile_filter(tokens[-1].removeprefix("using="))
+        tokens = tokens[:-1]
+    else:
+        cache_name = None
+    if "tags" not in tokens[3:]:
+        raise TemplateSyntaxError(
+            "'{tag}' tag requires an expire time, a fragment name and "
+            "tags".format(tag=tokens[0])
+        )
+    tags_at: int = tokens.index("tags", 3)
+    return CacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(argument) for argument in tokens[3:tags_at]]
+        + [TagVersions([parser.compile_filter(tag) for tag in tokens[tags_at + 1 :]])],
+        cache_name,
+    )
@@ -3,18 +3,61 @@ Module for unit testing of views and the shopapp application
 """
 
 from http.client import HTTPResponse
+from io import BytesIO, StringIO
+import gzip
+import json
+from tempfile import NamedTemporaryFile
+from threading import Thread
+from time import sleep, time
+from unittest import mock, skipUnless
+from concurrent.futures import ThreadPoolExecutor
 
-from django.contrib.auth.models import Permission, User
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.db.models import QuerySet
 from django.urls import reverse
-from django.test import TestCase
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
 from django.conf import settings
+from django.utils import timezone, translation
+from django.core.cache import cache
 
-from shopapp.utils import add_two_numbers
-from shopapp.models import Product, Order
+from django.template import Context, Template
+
+from mysite.cache import (
+    COMPUTED_KEY,
+    COMPUTE_LOCK_KEY,
+    cache_page_for,
+    get_or_compute,
+    get_tag_versions,
+    invalidate_tags,
+)
+
+from shopapp.exports import accepts_gzip, parse_cursor
+from shopapp.utils import (
+    add_two_numbers,
+    validate_product_row,
+    save_csv_products,
+    bulk_insert_products,
+    get_import_progress,
+    save_product_rows,
+)
+from shopapp.management.commands.import_products import (
+    split_byte_ranges,
+    parse_byte_range,
+    iter_parsed_ranges,
+)
+from shopapp.admin import make_archived
+from shopapp.models import DeletedObject, Product, Order
+from datetime import timedelta
+from decimal import Decimal
 from string import ascii_letters
 from random import choices
 from typing import List, Dict
+import os
 
 
 class AddTwoNumbersTestCase(TestCase):
@@ -71,7 +114,8 @@ class ShopAppTestCase(TestCase):
         permission: Permission = Permission.objects.get(
             codename=permission_codename, content_type__app_label="shopapp"
         )
-        user.user_permissions.add(permission)
+        with cls.captureOnCommitCallbacks(execute=True):
+            user.user_permissions.add(permission)
         return user
 
     @classmethod
@@ -331,3 +375,666 @@ class OrdersExportTestCase(ShopAppTestCase):
 
         for product in self.order.products.filter(archived=False):
             self.assertIn(str(product.pk), response_content)
+
+
+class ImportProductsCommandTestCase(TestCase):
+    """
+    Test case for the byte range splitting and row validation of import_products
+    """
+
+    def setUp(self) -> None:
+        self.csv_file = NamedTemporaryFile(mode="w", suffix=".csv", delete=False)
+        self.csv_file.write("name,price,discount\n")
+        for number in range(50):
+            self.csv_file.write(f"Product {number},{number + 1}.50,5\n")
+        self.csv_file.write("Broken,not a price,5\n")
+        self.csv_file.close()
+
+    def tearDown(self) -> None:
+        os.remove(self.csv_file.name)
+
+    def test_ranges_cover_every_row_once(self) -> None:
+        header, ranges = split_byte_ranges(self.csv_file.name, chunk_size=64)
+        self.assertEqual(header, ["name", "price", "discount"])
+        self.assertGreater(len(ranges), 1)
+
+        rows: List[dict] = []
+        errors: List[str] = []
+        for start, end, first_line in ranges:
+            result = parse_byte_range(
+                self.csv_file.name, start, end, first_line, header, "utf-8"
+            )
+            rows.extend(result["rows"])
+            errors.extend(result["errors"])
+
+        self.assertEqual(len(rows), 50)
+        self.assertEqual(len(errors), 1)
+        # The header is line 1, the broken row comes after the 50 valid ones.
+        self.assertTrue(errors[0].startswith("line 52:"))
+        self.assertEqual(
+            sorted(row["name"] for row in rows),
+            sorted(f"Product {number}" for number in range(50)),
+        )
+
+    def test_ranges_in_flight_are_bounded(self) -> None:
+        header, ranges = split_byte_ranges(self.csv_file.name, chunk_size=64)
+        submitted: List[tuple] = []
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            submit = executor.submit
+            with mock.patch.object(
+                executor,
+                "submit",
+                side_effect=lambda *args: submitted.append(args) or submit(*args),
+            ):
+                results = iter_parsed_ranges(
+                    executor, self.csv_file.name, ranges, header, "utf-8", 2
+                )
+                rows: List[dict] = next(results)["rows"]
+                self.assertEqual(len(submitted), 2)
+                for result in results:
+                    rows.extend(result["rows"])
+        self.assertEqual(len(submitted), len(ranges))
+        self.assertEqual(len(rows), 50)
+
+    def test_header_encoding(self) -> None:
+        with open(self.csv_file.name, mode="wb") as file:
+            file.write("название,price\nСтол,10\n".encode("cp1251"))
+        header, ranges = split_byte_ranges(self.csv_file.name, 64, "cp1251")
+        self.assertEqual(header, ["название", "price"])
+        self.assertEqual(len(ranges), 1)
+
+        with open(self.csv_file.name, mode="wb") as file:
+            file.write("name,price\nTable,10\n".encode("utf-8-sig"))
+        header, ranges = split_byte_ranges(self.csv_file.name, 64, "UTF8")
+        self.assertEqual(header, ["name", "price"])
+
+    def test_validate_product_row(self) -> None:
+        row = validate_product_row({"name": "Table", "price": "10.5", "discount": ""})
+        self.assertEqual(row, {"name": "Table", "price": Decimal("10.5")})
+        with self.assertRaises(ValidationError):
+            validate_product_row({"name": "Table", "price": "123456789"})
+        with self.assertRaises(ValidationError):
+            validate_product_row({"name": "Table", "unknown": "1"})
+
+
+class ProductCSVImportExportTestCase(TestCase):
+    """
+    Test case for the CSV import and export of products without COPY
+    """
+
+    def test_import_and_upsert(self) -> None:
+        products: List[Product] = save_csv_products(
+            csv_file=BytesIO(b"name,price,discount\nChair,10.50,5\nTable,99,\n"),
+            encoding="utf-8",
+        )
+        self.assertEqual(
+            sorted(product.name for product in products), ["Chair", "Table"]
+        )
+
+        chair: Product = Product.objects.get(name="Chair")
+        bulk_insert_products([{"id": chair.pk, "price": Decimal("12.00")}], copy=False)
+        chair.refresh_from_db()
+        self.assertEqual(chair.price, Decimal("12.00"))
+        self.assertEqual(chair.discount, 5)
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_download_csv(self) -> None:
+        Product.objects.create(name="Chair", price="10.50", discount=5)
+        response = self.client.get(reverse("shopapp:product-download-csv"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            b"".join(response.streaming_content).decode().splitlines(),
+            ["name,description,price,discount", "Chair,,10.50,5"],
+        )
+
+
+class ProductCopyImportTestCase(TestCase):
+    """
+    Test case for the import of products with partial rows, with and without COPY
+    """
+
+    def check_import_and_upsert(self, copy: bool) -> None:
+        bulk_insert_products(
+            [
+                {"name": "Chair", "price": Decimal("10.50")},
+                {"name": "Table", "price": Decimal("99.00"), "discount": 7},
+            ],
+            copy=copy,
+        )
+        chair: Product = Product.objects.get(name="Chair")
+        table: Product = Product.objects.get(name="Table")
+        self.assertEqual(
+            (chair.description, chair.discount, chair.archived), ("", 0, False)
+        )
+        self.assertEqual(table.discount, 7)
+
+        Product.objects.filter(pk=chair.pk).update(discount=5, archived=True)
+        bulk_insert_products(
+            [
+                {"id": chair.pk, "price": Decimal("12.00")},
+                {"id": table.pk, "discount": 8},
+            ],
+            copy=copy,
+        )
+        chair.refresh_from_db()
+        table.refresh_from_db()
+        self.assertEqual(
+            (chair.price, chair.discount, chair.archived), (Decimal("12.00"), 5, True)
+        )
+        self.assertEqual((table.price, table.discount), (Decimal("99.00"), 8))
+        self.assertEqual(Product.objects.count(), 2)
+
+    def test_import_and_upsert(self) -> None:
+        self.check_import_and_upsert(copy=False)
+
+    @skipUnless(connection.vendor == "postgresql", "COPY requires PostgreSQL")
+    def test_copy_import_and_upsert(self) -> None:
+        self.check_import_and_upsert(copy=True)
+
+
+class AdminImportDryRunTestCase(TestCase):
+    """
+    Test case for the dry run and the progress of the admin imports
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        self.user: User = User.objects.create_superuser(
+            username="admin", password="password"
+        )
+        self.client.force_login(self.user)
+        self.product: Product = Product.objects.create(name="Chair", price="10.00")
+
+    def post_csv(self, content: bytes, dry_run: bool, task_id: str = ""):
+        return self.client.post(
+            reverse("admin:import_products_csv"),
+            {
+                "csv_file": SimpleUploadedFile("products.csv", content),
+                "dry_run": "on" if dry_run else "",
+                "task_id": task_id,
+            },
+        )
+
+    def test_csv_dry_run_does_not_write(self) -> None:
+        content: bytes = (
+            f"id,name,price\n{self.product.pk},Chair,12\n,Table,99\n".encode()
+        )
+        response = self.post_csv(content, dry_run=True)
+        self.assertEqual(response.status_code, 200)
+        report = response.context["report"]
+        self.assertEqual((report["inserts"], report["updates"]), (1, 1))
+        self.assertEqual(report["errors"], [])
+        self.assertGreater(report["estimated_seconds"], 0)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_csv_errors_are_reported_per_row(self) -> None:
+        response = self.post_csv(
+            b"name,price\nTable,99\n,10\nLamp,abc\n", dry_run=False
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            [error["row"] for error in response.context["report"]["errors"]], [3, 4]
+        )
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_csv_import_publishes_progress(self) -> None:
+        response = self.post_csv(
+            b"name,price\nTable,99\n", dry_run=False, task_id="abc"
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            get_import_progress("abc"), {"status": "done", "processed": 1, "total": 1}
+        )
+        response = self.client.get(
+            reverse("admin:import_products_progress", kwargs={"task_id": "abc"})
+        )
+        self.assertEqual(response.json()["status"], "done")
+
+    def test_json_dry_run_reports_invalid_orders(self) -> None:
+        orders: bytes = (
+            f'[{{"user": {self.user.pk}, "products": [{self.product.pk}], '
+            f'"phone": "+71234567890", "promocode": "", "delivery_address": "Moscow"}},'
+            f'{{"user": {self.user.pk}, "phone": "wrong"}}]'
+        ).encode()
+        response = self.client.post(
+            reverse("admin:import_orders_json"),
+            {
+                "json_file": SimpleUploadedFile("orders.json", orders),
+                "dry_run": "on",
+            },
+        )
+        self.assertEqual(response.status_code, 400)
+        report = response.context["report"]
+        self.assertEqual(report["inserts"], 1)
+        self.assertEqual([error["row"] for error in report["errors"]], [2])
+        self.assertFalse(Order.objects.exists())
+
+
+class GetOrComputeTestCase(TestCase):
+    """
+    Test case for the stampede protection of the expensive cached values
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.calls: int = 0
+
+    def compute(self) -> int:
+        self.calls += 1
+        sleep(0.1)
+        return self.calls
+
+    def test_single_flight_on_miss(self) -> None:
+        results: List[int] = []
+        threads = [
+            Thread(
+                target=lambda: results.append(get_or_compute("key", self.compute, 60))
+            )
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [1] * 5)
+
+    def test_stale_value_served_while_recomputed(self) -> None:
+        cache.set(COMPUTED_KEY.format(key="key"), ("stale", time() - 1, 0.1), 60)
+        cache.add(COMPUTE_LOCK_KEY.format(key="key"), True, 30)
+        self.assertEqual(get_or_compute("key", self.compute, 60), "stale")
+        self.assertEqual(self.calls, 0)
+
+        cache.delete(COMPUTE_LOCK_KEY.format(key="key"))
+        self.assertEqual(get_or_compute("key", self.compute, 60), 1)
+        self.assertEqual(get_or_compute("key", self.compute, 60), 1)
+        self.assertIsNone(cache.get(COMPUTE_LOCK_KEY.format(key="key")))
+
+    def test_early_expiration(self) -> None:
+        cache.set(COMPUTED_KEY.format(key="key"), ("cached", time() + 1, 0.5), 60)
+        with mock.patch("mysite.cache.random.random", return_value=0.5):
+            self.assertEqual(get_or_compute("key", self.compute, 60), "cached")
+        # -log(1 - 0.99) * 0.5 is more than the second left.
+        with mock.patch("mysite.cache.random.random", return_value=0.99):
+            self.assertEqual(get_or_compute("key", self.compute, 60), 1)
+
+    def test_products_export_is_cached(self) -> None:
+        translation.activate("en")
+        Product.objects.create(name="Chair", price="10.50")
+        self.client.get(reverse("shopapp:products-export"))
+        Product.objects.create(name="Table", price="20")
+        response = self.client.get(reverse("shopapp:products-export"))
+        self.assertEqual(len(response.json()["products"]), 1)
+
+
+class TaggedFragmentCacheTestCase(TestCase):
+    """
+    Test case for the template fragments invalidated by tags
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        cache.clear()
+        self.user: User = User.objects.create_user(username="buyer", password="pwd")
+        self.client.force_login(self.user)
+        self.chair: Product = Product.objects.create(name="Chair", price="10.50")
+        self.first: Order = Order.objects.create(user=self.user, promocode="FIRST")
+        self.second: Order = Order.objects.create(user=self.user, promocode="SECOND")
+        self.first.products.add(self.chair)
+
+    def test_tag_versions(self) -> None:
+        versions: List[int] = get_tag_versions(["a", "b"])
+        self.assertEqual(get_tag_versions(["a", "b"]), versions)
+        invalidate_tags(["b"])
+        self.assertEqual(get_tag_versions(["a", "b"])[0], versions[0])
+        self.assertNotEqual(get_tag_versions(["a", "b"])[1], versions[1])
+
+    def test_fragment_invalidated_by_tag(self) -> None:
+        template = Template(
+            "{% load tagged_cache %}"
+            "{% tagged_cache 3600 fragment tags 'box' order %}{{ value }}"
+            "{% endtagged_cache %}"
+        )
+
+        def render(value: str) -> str:
+            return template.render(Context({"value": value, "order": self.first}))
+
+        self.assertEqual(render("old"), "old")
+        self.assertEqual(render("new"), "old")
+        invalidate_tags(["box"])
+        self.assertEqual(render("new"), "new")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.save()
+            # Rendered before the commit, the fragment keeps the old versions.
+            self.assertEqual(render("newer"), "new")
+        self.assertEqual(render("newer"), "newer")
+
+    def test_order_blocks(self) -> None:
+        url: str = reverse("shopapp:user_orders_list", kwargs={"pk": self.user.pk})
+        response = self.client.get(url)
+        self.assertContains(response, "FIRST")
+        self.assertContains(response, "SECOND")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.chair.price = Decimal("12.00")
+            self.chair.save()
+            self.second.promocode = "CHANGED"
+            self.second.save()
+            table: Product = Product.objects.create(name="Table", price="20")
+            self.second.products.add(table)
+        response = self.client.get(url)
+        self.assertContains(response, "12.00")
+        self.assertContains(response, "CHANGED")
+        self.assertContains(response, "Table")
+
+    def test_product_cards_after_import(self) -> None:
+        self.user.user_permissions.add(Permission.objects.get(codename="view_product"))
+        url: str = reverse("shopapp:products_list")
+        self.assertContains(self.client.get(url), "10.50")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            save_product_rows(
+                [{"id": self.chair.pk, "name": "Armchair", "price": Decimal("12.00")}]
+            )
+        response = self.client.get(url)
+        self.assertContains(response, "Armchair")
+        self.assertContains(response, "12.00")
+        self.assertNotContains(response, "10.50")
+
+
+class PageCacheTestCase(TestCase):
+    """
+    Test case for the pages cached per language, audience and model version
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        cache.clear()
+        self.factory = RequestFactory()
+        self.calls: int = 0
+
+        @cache_page_for(60, models=(Product,), cookies=("theme",))
+        def view(request) -> HttpResponse:
+            self.calls += 1
+            return HttpResponse(str(self.calls))
+
+        self.view = view
+
+    def get(self, user=None, **extra) -> str:
+        request = self.factory.get("/en/page/", **extra)
+        request.user = user or AnonymousUser()
+        return self.view(request).content.decode()
+
+    def test_varies_on_audience(self) -> None:
+        self.assertEqual(self.get(), "1")
+        self.assertEqual(self.get(), "1")
+        self.assertEqual(self.get(HTTP_COOKIE="theme=dark"), "2")
+        self.assertEqual(self.get(HTTP_ACCEPT="application/json"), "3")
+
+        buyer: User = User.objects.create_user(username="buyer")
+        other: User = User.objects.create_user(username="other")
+        self.assertEqual(self.get(buyer), "4")
+        self.assertEqual(self.get(other), "4")
+        with self.captureOnCommitCallbacks(execute=True):
+            buyer.user_permissions.add(Permission.objects.get(codename="add_product"))
+        self.assertEqual(self.get(User.objects.get(pk=buyer.pk)), "5")
+
+        translation.activate("ru")
+        self.assertEqual(self.get(), "6")
+
+    def test_invalidated_by_model_version(self) -> None:
+        self.assertEqual(self.get(), "1")
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name="Chair", price="10")
+            # A page rendered before the commit is keyed by the old version.
+            self.assertEqual(self.get(), "1")
+        self.assertEqual(self.get(), "2")
+
+    def test_uncacheable_responses(self) -> None:
+        @cache_page_for(60)
+        def view(request) -> HttpResponse:
+            self.calls += 1
+            response = HttpResponse(str(self.calls))
+            response.set_cookie("seen", "1")
+            return response
+
+        request = self.factory.get("/en/page/")
+        request.user = AnonymousUser()
+        view(request)
+        view(request)
+        self.assertEqual(self.calls, 2)
+
+
+class PublicCacheControlTestCase(TestCase):
+    """
+    Test case for the HTTP caching headers of the anonymous read endpoints
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        cache.clear()
+
+    def test_anonymous_responses_are_public(self) -> None:
+        for url, max_age in (
+            (reverse("shopapp:latest_products_feed"), 300),
+            (reverse("blogapp:articles_list"), 60),
+            (reverse("django.contrib.sitemaps.views.sitemap"), 3600),
+            (reverse("shopapp:product-list"), 60),
+        ):
+            for _ in range(2):
+                response = self.client.get(url, HTTP_ACCEPT="application/json")
+                self.assertEqual(response.status_code, 200)
+                self.assertIn("public", response["Cache-Control"])
+                self.assertIn("max-age={0}".format(max_age), response["Cache-Control"])
+                self.assertIn("stale-while-revalidate", response["Cache-Control"])
+                self.assertIn("Cookie", response["Vary"])
+                self.assertIn("Accept-Language", response["Vary"])
+
+    def test_authenticated_responses_are_private(self) -> None:
+        self.client.force_login(User.objects.create_user(username="reader"))
+        response = self.client.get(reverse("shopapp:latest_products_feed"))
+        self.assertIn("private", response["Cache-Control"])
+        self.assertNotIn("public", response["Cache-Control"])
+
+
+class ProductsExportNegotiationTestCase(TestCase):
+    """
+    Test case for the formats and the compression of the products export
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        cache.clear()
+        self.product: Product = Product.objects.create(name="Chair", price="10.50")
+
+    def test_ndjson(self) -> None:
+        response = self.client.get(
+            reverse("shopapp:products-export"), HTTP_ACCEPT="application/x-ndjson"
+        )
+        self.assertEqual(
+            response["Content-Type"], "application/x-ndjson; charset=utf-8"
+        )
+        lines: List[str] = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [
+                {
+                    "pk": self.product.pk,
+                    "name": "Chair",
+                    "price": "10.50",
+                    "archived": False,
+                }
+            ],
+        )
+
+    def test_gzip_csv_is_cached_until_products_change(self) -> None:
+        headers: Dict[str, str] = {
+            "HTTP_ACCEPT": "text/csv;q=0.9, application/json;q=0.5",
+            "HTTP_ACCEPT_ENCODING": "br, gzip",
+        }
+        response = self.client.get(reverse("shopapp:products-export"), **headers)
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        body: bytes = gzip.decompress(b"".join(response.streaming_content))
+        self.assertEqual(
+            body.decode().splitlines(),
+            ["pk,name,price,archived", f"{self.product.pk},Chair,10.50,False"],
+        )
+
+        cached = self.client.get(reverse("shopapp:products-export"), **headers)
+        self.assertFalse(cached.streaming)
+        self.assertEqual(gzip.decompress(cached.content), body)
+
+        self.product.name = "Table"
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        fresh = self.client.get(reverse("shopapp:products-export"), **headers)
+        self.assertTrue(fresh.streaming)
+        self.assertIn(b"Table", gzip.decompress(b"".join(fresh.streaming_content)))
+
+    def test_accepts_gzip(self) -> None:
+        factory = RequestFactory()
+        for header, expected in (
+            ("", False),
+            ("gzip", True),
+            ("br;q=1.0, GZIP;q=0.5", True),
+            ("*", True),
+            ("gzip;q=0, *", False),
+            ("identity, gzip;q=0", False),
+            ("gzip;q=0.000", False),
+            ("*;q=0, gzip", True),
+            ("gzip;q=bad", False),
+        ):
+            with self.subTest(header=header):
+                request = factory.get("/", HTTP_ACCEPT_ENCODING=header)
+                self.assertIs(accepts_gzip(request), expected)
+
+    def test_artifact_key_ignores_unused_parameters(self) -> None:
+        Product.objects.create(name="Table", price="99.00")
+        url: str = reverse("shopapp:product-download-csv")
+        first = self.client.get(url, {"name": "Chair"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(first.streaming)
+        b"".join(first.streaming_content)
+
+        cached = self.client.get(
+            url, {"name": "Chair", "junk": "1"}, HTTP_ACCEPT_ENCODING="gzip"
+        )
+        self.assertFalse(cached.streaming)
+        self.assertNotIn(b"Table", gzip.decompress(cached.content))
+
+        other = self.client.get(url, {"name": "Table"}, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(other.streaming)
+        self.assertIn(b"Table", gzip.decompress(b"".join(other.streaming_content)))
+
+    def test_not_acceptable(self) -> None:
+        response = self.client.get(
+            reverse("shopapp:products-export"), HTTP_ACCEPT="image/png"
+        )
+        self.assertEqual(response.status_code, 406)
+
+
+class DeltaExportTestCase(TestCase):
+    """
+    Test case for the ?since= delta exports of products and orders
+    """
+
+    def setUp(self) -> None:
+        translation.activate("en")
+        self.user: User = User.objects.create_user(
+            username="staff", password="password", is_staff=True
+        )
+        self.client.force_login(self.user)
+        self.kept: Product = Product.objects.create(name="Kept", price="1.00")
+        self.changed: Product = Product.objects.create(name="Changed", price="2.00")
+        self.removed: Product = Product.objects.create(name="Removed", price="3.00")
+        self.order: Order = Order.objects.create(user=self.user)
+        self.order.products.add(self.kept)
+
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        Product.objects.update(updated_at=an_hour_ago)
+        Order.objects.update(updated_at=an_hour_ago)
+        self.since: str = (timezone.now() - timedelta(minutes=30)).isoformat()
+
+    def test_products_delta(self) -> None:
+        self.changed.archived = True
+        self.changed.save()
+        removed_pk: int = self.removed.pk
+        self.removed.delete()
+
+        response = self.client.get(
+            reverse("shopapp:products-export"), {"since": self.since}
+        )
+        data = response.json()
+        self.assertEqual([row["pk"] for row in data["products"]], [self.changed.pk])
+        self.assertTrue(data["products"][0]["archived"])
+        self.assertEqual(data["deleted"], [removed_pk])
+        self.assertLess(parse_cursor(data["next_cursor"]), timezone.now())
+
+        response = self.client.get(
+            reverse("shopapp:products-export"), {"since": "not a cursor"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_orders_delta_follows_products_list(self) -> None:
+        response = self.client.get(
+            reverse("shopapp:orders-export"), {"since": self.since}
+        )
+        self.assertEqual(response.json()["orders"], [])
+
+        self.order.products.add(self.changed)
+        response = self.client.get(
+            reverse("shopapp:orders-export"), {"since": self.since}
+        )
+        orders = response.json()["orders"]
+        self.assertEqual([order["pk"] for order in orders], [self.order.pk])
+        self.assertEqual(
+            sorted(orders[0]["products"]), sorted([self.kept.pk, self.changed.pk])
+        )
+
+    def test_orders_delta_follows_archived_and_deleted_products(self) -> None:
+        make_archived(None, None, Product.objects.filter(pk=self.kept.pk))
+        response = self.client.get(
+            reverse("shopapp:orders-export"), {"since": self.since}
+        )
+        orders = response.json()["orders"]
+        self.assertEqual([order["pk"] for order in orders], [self.order.pk])
+        self.assertEqual(orders[0]["products"], [])
+
+        self.order.products.add(self.changed)
+        Order.objects.update(updated_at=timezone.now() - timedelta(hours=1))
+        self.changed.delete()
+        response = self.client.get(
+            reverse("shopapp:orders-export"), {"since": self.since}
+        )
+        self.assertEqual(
+            [order["pk"] for order in response.json()["orders"]], [self.order.pk]
+        )
+
+    def test_cursor_starts_before_running_transactions(self) -> None:
+        started_at = timezone.now() - timedelta(minutes=10)
+        with mock.patch(
+            "shopapp.exports.oldest_transaction_start", return_value=started_at
+        ):
+            response = self.client.get(
+                reverse("shopapp:products-export"), {"since": self.since}
+            )
+        self.assertLess(parse_cursor(response.json()["next_cursor"]), started_at)
+
+    def test_expired_cursor_and_pruned_tombstones(self) -> None:
+        response = self.client.get(
+            reverse("shopapp:products-export"),
+            {"since": (timezone.now() - timedelta(days=31)).isoformat()},
+        )
+        self.assertEqual(response.status_code, 410)
+
+        removed_pk, kept_pk = self.removed.pk, self.kept.pk
+        self.removed.delete()
+        self.kept.delete()
+        DeletedObject.objects.filter(object_pk=removed_pk).update(
+            deleted_at=timezone.now() - timedelta(days=31)
+        )
+        call_command("prune_deleted_objects", stdout=StringIO())
+        self.assertEqual(
+            list(DeletedObject.objects.values_list("object_pk", flat=True)),
+            [kept_pk],
+        )
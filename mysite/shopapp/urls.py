@@ -3,6 +3,9 @@ Module containing the urls of the application Shopapp.
 """
 
 from django.urls import path, include
+
+from mysite.cache import cache_page_for, public_cache_control
+from .models import Product
 from .views import (
     ShopIndexView,
     GroupListView,
@@ -29,7 +32,6 @@ from .views import (
 from typing import List
 from rest_framework.routers import DefaultRouter
 
-
 app_name: str = "shopapp"
 router: DefaultRouter = DefaultRouter()
 router.register(prefix="products", viewset=ProductViewSet, basename="product")
@@ -51,7 +53,13 @@ urlpatterns: List[path] = [
         ProductDeleteView.as_view(),
         name="product_archive",
     ),
-    path("products/latest/feed/", LatestProductsFeed(), name="latest_products_feed"),
+    path(
+        "products/latest/feed/",
+        public_cache_control(60 * 5, stale_while_revalidate=60 * 10)(
+            cache_page_for(60 * 10, models=(Product,))(LatestProductsFeed())
+        ),
+        name="latest_products_feed",
+    ),
     path("orders/", OrderListView.as_view(), name="orders_list"),
     path("orders/export/", OrderDataExportView.as_view(), name="orders-export"),
     path("orders/<int:pk>/", OrderDetailsView.as_view(), name="order_details"),
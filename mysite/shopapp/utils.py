@@ -1,46 +1,675 @@
-from io import TextIOWrapper
-from csv import DictReader
-from typing import List, Optional, IO
-from .models import Product, Order
+from io import TextIOWrapper, StringIO
+from csv import DictReader, writer as csv_writer
+from tempfile import SpooledTemporaryFile
+from typing import (
+    Any,
+    Dict,
+    FrozenSet,
+    IO,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+)
+from .models import Product, Order, DeletedObject
+from .exports import Echo
+from .forms import OrderForm
+from mysite.cache import bump_model_version_on_commit, invalidate_tags_on_commit
 import json
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Field, QuerySet, Model
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.translation import get_language
+from modeltranslation.settings import DEFAULT_LANGUAGE
+from modeltranslation.utils import build_localized_fieldname
+from timeit import default_timer
+from datetime import datetime
 
 
 def add_two_numbers(a, b):
     return a + b
 
 
-def save_csv_products(csv_file: IO[bytes], encoding: Optional[str]) -> List[Product]:
+PRODUCT_IMPORT_FIELDS: List[str] = [
+    "id",
+    "name",
+    "name_en",
+    "name_ru",
+    "description",
+    "description_en",
+    "description_ru",
+    "price",
+    "discount",
+    "archived",
+]
+
+
+def validate_product_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate one CSV row against the Product model fields.
+
+    Empty cells are dropped so that model defaults apply, unknown columns
+    are rejected.
+
+    Args:
+        row (Dict[str, Any]): The raw row as read by ``csv.DictReader``.
+
+    Returns:
+        Dict[str, Any]: Cleaned values ready to be passed to ``Product(**row)``.
+
+    Raises:
+        ValidationError: If a column is unknown or a value does not pass
+            the model field validation.
+    """
+    cleaned: Dict[str, Any] = {}
+    errors: Dict[str, List[str]] = {}
+    for column, value in row.items():
+        if column not in PRODUCT_IMPORT_FIELDS:
+            errors[str(column)] = ["Unknown column"]
+            continue
+        if value is None or value == "":
+            continue
+        try:
+            cleaned[column] = Product._meta.get_field(column).clean(value, None)
+        except ValidationError as error:
+            errors[column] = error.messages
+    if "name" not in cleaned and "name_en" not in cleaned:
+        errors.setdefault("name", []).append("This field cannot be blank.")
+    if errors:
+        raise ValidationError(errors)
+    return cleaned
+
+
+PRODUCT_TRANSLATED_FIELDS: List[str] = ["name", "description"]
+COPY_NULL: str = "\\N"
+
+
+def use_copy() -> bool:
+    """Return True if the default database supports COPY (PostgreSQL)."""
+    return connection.vendor == "postgresql"
+
+
+def _sync_translated_fields(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Mirror the original and default-language columns of translated fields.
+
+    ``Product(**row)`` does this through modeltranslation, COPY bypasses the
+    model so the columns have to be filled in by hand.
+    """
+    for field in PRODUCT_TRANSLATED_FIELDS:
+        default_field: str = build_localized_fieldname(field, DEFAULT_LANGUAGE)
+        if field in row and default_field not in row:
+            row[default_field] = row[field]
+        elif default_field in row and field not in row:
+            row[field] = row[default_field]
+    return row
+
+
+def _copy_data(rows: List[Dict[str, Any]]) -> Tuple[List[str], List[str], StringIO]:
+    """
+    Build the COPY data of product rows.
+
+    The model defaults are not database defaults, so besides the columns of
+    the rows every NOT NULL column is written, with the default of its field
+    where a row has no value. Only the columns of the rows and ``updated_at``
+    are updated on conflict, so partial rows keep the other values.
+
+    Args:
+        rows (List[Dict[str, Any]]): Rows cleaned by ``validate_product_row``,
+            all with the same columns.
+
+    Returns:
+        Tuple[List[str], List[str], StringIO]: The columns written, the
+            columns updated on conflict and the CSV data.
+    """
+    rows = [_sync_translated_fields(dict(row)) for row in rows]
+    row_columns = set().union(*rows)
+    fields: List[Field] = [
+        field
+        for field in Product._meta.concrete_fields
+        if field.name in row_columns or not (field.null or field.primary_key)
+    ]
+    defaults: Dict[str, Any] = {field.name: field.get_default() for field in fields}
+    defaults["created_at"] = defaults["updated_at"] = timezone.now()
+
+    buffer: StringIO = StringIO()
+    writer = csv_writer(buffer)
+    for row in rows:
+        values: List[Any] = []
+        for field in fields:
+            value: Any = row.get(field.name, defaults[field.name])
+            values.append(COPY_NULL if value is None else value)
+        writer.writerow(values)
+    buffer.seek(0)
+
+    update_columns: List[str] = [
+        field.column
+        for field in fields
+        if field.name in row_columns and not field.primary_key
+    ]
+    if "updated_at" not in update_columns:
+        update_columns.append("updated_at")
+    return [field.column for field in fields], update_columns, buffer
+
+
+def _copy_products(rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Load product rows with ``COPY ... FROM STDIN`` through a staging table.
+
+    Rows without ``id`` are inserted, rows with ``id`` are upserted with
+    ``ON CONFLICT (id) DO UPDATE`` so that re-importing an export updates the
+    existing products instead of failing.
+
+    Args:
+        rows (List[Dict[str, Any]]): Rows cleaned by ``validate_product_row``,
+            all with the same columns.
+
+    Returns:
+        List[int]: Primary keys of the inserted or updated products.
+    """
+    columns, update_columns, buffer = _copy_data(rows)
+
+    quote = connection.ops.quote_name
+    table: str = quote(Product._meta.db_table)
+    staging: str = quote(Product._meta.db_table + "_staging")
+    column_list: str = ", ".join(quote(column) for column in columns)
+    data_columns: List[str] = [column for column in columns if column != "id"]
+    data_column_list: str = ", ".join(quote(column) for column in data_columns)
+    update_list: str = ", ".join(
+        "{column} = EXCLUDED.{column}".format(column=quote(column))
+        for column in update_columns
+    )
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS {staging}".format(staging=staging))
+        cursor.execute(
+            "CREATE TEMPORARY TABLE {staging} ON COMMIT DROP AS "
+            "SELECT {columns} FROM {table} WITH NO DATA".format(
+                staging=staging, columns=column_list, table=table
+            )
+        )
+        cursor.copy_expert(
+            "COPY {staging} ({columns}) FROM STDIN "
+            "WITH (FORMAT csv, NULL '{null}')".format(
+                staging=staging, columns=column_list, null=COPY_NULL
+            ),
+            buffer,
+        )
+        cursor.execute(
+            "INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} "
+            "{where} RETURNING id".format(
+                table=table,
+                columns=data_column_list,
+                staging=staging,
+                where="WHERE id IS NULL" if "id" in columns else "",
+            )
+        )
+        ids: List[int] = [pk for pk, in cursor.fetchall()]
+        if "id" in columns:
+            cursor.execute(
+                "INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} "
+                "WHERE id IS NOT NULL ON CONFLICT (id) DO UPDATE SET {updates} "
+                "RETURNING id".format(
+                    table=table,
+                    columns=column_list,
+                    staging=staging,
+                    updates=update_list,
+                )
+            )
+            ids.extend(pk for pk, in cursor.fetchall())
+            # Explicit ids bypass the sequence, move it past the largest one.
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), MAX(id)) "
+                "FROM {table}".format(table=table),
+                [Product._meta.db_table],
+            )
+    return ids
+
+
+def _bulk_create_products(
+    rows: List[Dict[str, Any]], batch_size: int = 1000
+) -> List[int]:
+    """
+    Insert product rows with batched ``bulk_create``, the non-PostgreSQL path.
+
+    Rows with ``id`` update the existing products, like the COPY path. The
+    rows must have the same columns.
+    """
+    columns = set().union(*(_sync_translated_fields(dict(row)) for row in rows))
+    upsert: bool = "id" in columns and len(columns) > 1
+    products: List[Product] = [Product(**row) for row in rows]
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            products,
+            batch_size=batch_size,
+            update_conflicts=upsert,
+            unique_fields=["id"] if upsert else None,
+            update_fields=sorted(columns - {"id"} | {"updated_at"}) if upsert else None,
+        )
+    return [product.pk for product in products]
+
+
+def bulk_insert_products(
+    rows: List[Dict[str, Any]],
+    batch_size: int = 1000,
+    copy: Optional[bool] = None,
+) -> List[int]:
+    """
+    Write validated product rows, using COPY when the backend supports it.
+
+    ``validate_product_row`` drops the empty values, so the rows of a file
+    may have different columns. They are written in groups of rows with the
+    same columns, and existing products only get the columns of their row.
+
+    Args:
+        rows (List[Dict[str, Any]]): Rows cleaned by ``validate_product_row``.
+        batch_size (int): Rows per INSERT statement on the ORM path.
+        copy (Optional[bool]): Force (True) or disable (False) the COPY path,
+            by default it is used on PostgreSQL.
+
+    Returns:
+        List[int]: Primary keys of the inserted or updated products.
+    """
+    if not rows:
+        return []
+    groups: Dict[FrozenSet[str], List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(frozenset(row), []).append(row)
+    ids: List[int] = []
+    for group in groups.values():
+        if use_copy() if copy is None else copy:
+            ids.extend(_copy_products(group))
+        else:
+            ids.extend(_bulk_create_products(group, batch_size=batch_size))
+    if any("archived" in row for row in rows):
+        touch_product_orders(ids)
+    invalidate_products(ids)
+    return ids
+
+
+IMPORT_PROGRESS_KEY: str = "import_progress:{task_id}"
+IMPORT_PROGRESS_TIMEOUT: int = 60 * 60
+IMPORT_THROUGHPUT_KEY: str = "import_throughput:{kind}"
+# Rows per second used for estimates until a real import has been measured.
+DEFAULT_IMPORT_THROUGHPUT: Dict[str, float] = {"products": 2000.0, "orders": 100.0}
+IMPORT_BATCH_SIZE: int = 5000
+
+
+def set_import_progress(
+    task_id: Optional[str], processed: int, total: int, status: str = "running"
+) -> None:
+    """
+    Publish the progress of an import in the cache for the admin page to poll.
+
+    Args:
+        task_id (Optional[str]): Identifier of the import, nothing is
+            published without it.
+        processed (int): Number of rows written so far.
+        total (int): Number of rows to write.
+        status (str): One of "running", "done" or "failed".
+    """
+    if not task_id:
+        return
+    cache.set(
+        IMPORT_PROGRESS_KEY.format(task_id=task_id),
+        {"status": status, "processed": processed, "total": total},
+        IMPORT_PROGRESS_TIMEOUT,
+    )
+
+
+def get_import_progress(task_id: str) -> Optional[Dict[str, Any]]:
+    """Return the progress published by ``set_import_progress``, if any."""
+    return cache.get(IMPORT_PROGRESS_KEY.format(task_id=task_id))
+
+
+def record_import_throughput(kind: str, rows: int, seconds: float) -> None:
+    """Remember the write throughput of the last real import of this kind."""
+    if rows and seconds > 0:
+        cache.set(IMPORT_THROUGHPUT_KEY.format(kind=kind), rows / seconds, None)
+
+
+def _import_report(
+    kind: str,
+    total: int,
+    errors: List[Dict[str, Any]],
+    updates: int,
+    validation_seconds: float,
+) -> Dict[str, Any]:
+    """
+    Build the dry run report of an import.
+
+    The estimated duration is the measured validation time plus the time the
+    valid rows would take at the write throughput of the last real import.
+    """
+    valid: int = total - len(errors)
+    write_rate: float = cache.get(
+        IMPORT_THROUGHPUT_KEY.format(kind=kind), DEFAULT_IMPORT_THROUGHPUT[kind]
+    )
+    return {
+        "kind": kind,
+        "total": total,
+        "valid": valid,
+        "errors": errors,
+        "inserts": valid - updates,
+        "updates": updates,
+        "validation_seconds": validation_seconds,
+        "validation_rate": total / validation_seconds if validation_seconds else 0.0,
+        "estimated_seconds": validation_seconds + valid / write_rate,
+    }
+
+
+def validate_csv_products(
+    csv_file: IO[bytes], encoding: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Validate a whole products CSV file without writing anything.
+
+    Args:
+        csv_file (IO[bytes]): The uploaded CSV file.
+        encoding (Optional[str]): Encoding of the file.
+
+    Returns:
+        Dict[str, Any]: The report with per-row errors (row numbers count the
+            header as row 1), expected insert and update counts, the measured
+            validation throughput, the estimated import duration and the
+            cleaned ``rows`` ready for ``save_product_rows``.
+    """
+    started_at: float = default_timer()
+    text_file = TextIOWrapper(csv_file, encoding=encoding)
+    rows: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    total: int = 0
+    for row_number, row in enumerate(DictReader(text_file), start=2):
+        total += 1
+        try:
+            rows.append(validate_product_row(row))
+        except ValidationError as error:
+            errors.append({"row": row_number, "errors": error.message_dict})
+    text_file.detach()
+
+    ids: List[int] = [row["id"] for row in rows if "id" in row]
+    updates: int = Product.objects.filter(pk__in=ids).count() if ids else 0
+    report: Dict[str, Any] = _import_report(
+        kind="products",
+        total=total,
+        errors=errors,
+        updates=updates,
+        validation_seconds=default_timer() - started_at,
+    )
+    report["rows"] = rows
+    return report
+
+
+def save_product_rows(
+    rows: List[Dict[str, Any]],
+    task_id: Optional[str] = None,
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> List[int]:
+    """
+    Write validated product rows in one transaction, batch by batch.
+
+    The progress is published after every batch when ``task_id`` is given.
+
+    Returns:
+        List[int]: Primary keys of the inserted or updated products.
+    """
+    started_at: float = default_timer()
+    ids: List[int] = []
+    set_import_progress(task_id, 0, len(rows))
+    try:
+        with transaction.atomic():
+            for start in range(0, len(rows), batch_size):
+                ids.extend(bulk_insert_products(rows[start : start + batch_size]))
+                set_import_progress(task_id, len(ids), len(rows))
+    except Exception:
+        set_import_progress(task_id, 0, len(rows), status="failed")
+        raise
+    set_import_progress(task_id, len(rows), len(rows), status="done")
+    record_import_throughput("products", len(rows), default_timer() - started_at)
+    return ids
+
+
+def save_csv_products(
+    csv_file: IO[bytes], encoding: Optional[str], task_id: Optional[str] = None
+) -> List[Product]:
+    """Save products from CSV file to database"""
     csv_file = TextIOWrapper(csv_file, encoding=encoding)
     reader = DictReader(csv_file)
 
-    products: List[Product] = [Product(**row) for row in reader]
-    Product.objects.bulk_create(products)
-    return products
+    rows: List[Dict[str, Any]] = [validate_product_row(row) for row in reader]
+    ids: List[int] = save_product_rows(rows, task_id=task_id)
+    return list(Product.objects.filter(pk__in=ids).select_related("created_by"))
 
 
-def save_json_orders(json_file: IO[bytes], encoding: Optional[str]) -> List[Order]:
-    """Save orders from JSON file to database"""
-    json_file = TextIOWrapper(json_file, encoding=encoding)
-    data_from_json_file = json.load(json_file)
-    orders = []
+def write_products_csv(
+    queryset: QuerySet[Product],
+    fields: Sequence[str],
+    stream: IO,
+    copy: Optional[bool] = None,
+) -> None:
+    """
+    Write products as CSV with a header row to the stream.
+
+    On PostgreSQL the rows are produced by ``COPY (...) TO STDOUT`` directly
+    from the database, translated fields are taken in the active language
+    with a fallback to the default one, like modeltranslation does.
+    Elsewhere the queryset is iterated in chunks.
+
+    Args:
+        queryset (QuerySet[Product]): Filtered products to export.
+        fields (Sequence[str]): Names of the exported fields.
+        stream (IO): Any object with a ``write`` method, e.g. an HttpResponse.
+        copy (Optional[bool]): Force (True) or disable (False) the COPY path.
+    """
+    if not (use_copy() if copy is None else copy):
+        writer = csv_writer(stream)
+        writer.writerow(fields)
+        for values in queryset.values_list(*fields).iterator(chunk_size=2000):
+            writer.writerow(values)
+        return
+
+    quote = connection.ops.quote_name
+    language: str = get_language() or DEFAULT_LANGUAGE
+    select: List[str] = []
+    for field in fields:
+        if field in PRODUCT_TRANSLATED_FIELDS:
+            expression: str = "COALESCE({localized}, {default}, {field})".format(
+                localized=quote(build_localized_fieldname(field, language)),
+                default=quote(build_localized_fieldname(field, DEFAULT_LANGUAGE)),
+                field=quote(field),
+            )
+        else:
+            expression = quote(Product._meta.get_field(field).column)
+        select.append(
+            "{expression} AS {alias}".format(expression=expression, alias=quote(field))
+        )
+
+    pk_sql, pk_params = queryset.order_by().values("pk").query.sql_with_params()
+    with connection.cursor() as cursor:
+        query: str = cursor.mogrify(
+            "SELECT {select} FROM {table} WHERE id IN ({pks}) ORDER BY id".format(
+                select=", ".join(select),
+                table=quote(Product._meta.db_table),
+                pks=pk_sql,
+            ),
+            pk_params,
+        ).decode()
+        cursor.copy_expert(
+            "COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)".format(query=query),
+            stream,
+        )
+
+
+def load_json_orders(json_file: IO[bytes], encoding: Optional[str]) -> List[Dict]:
+    """
+    Read the list of orders from a JSON file.
+
+    Raises:
+        TypeError: If the file does not contain a list of objects.
+    """
+    text_file = TextIOWrapper(json_file, encoding=encoding)
+    data_from_json_file = json.load(text_file)
+    text_file.detach()
+    if not isinstance(data_from_json_file, list):
+        raise TypeError("The file must contain a list of orders")
     for order_data in data_from_json_file:
         if not isinstance(order_data, dict):
             raise TypeError("Each order must be a dictionary")
+    return data_from_json_file
+
+
+def validate_orders_data(orders_data: List[Dict]) -> Dict[str, Any]:
+    """
+    Validate every order with ``OrderForm`` without writing anything.
+
+    Args:
+        orders_data (List[Dict]): Orders as loaded by ``load_json_orders``.
 
-        product_id: List[int] = order_data.pop("products", [])
-        user_id: Optional[List[int]] = order_data.pop("user", None)
+    Returns:
+        Dict[str, Any]: The report with per-order errors (orders are numbered
+            from 1), expected insert and update counts, the measured validation
+            throughput and the estimated import duration.
+    """
+    started_at: float = default_timer()
+    errors: List[Dict[str, Any]] = []
+    ids: List[int] = []
+    for order_number, order_data in enumerate(orders_data, start=1):
+        form = OrderForm(data=order_data)
+        if not form.is_valid():
+            errors.append({"row": order_number, "errors": form.errors.get_json_data()})
+            continue
+        order_id: Optional[int] = order_data.get("id", order_data.get("pk"))
+        if order_id is not None:
+            ids.append(order_id)
 
-        if user_id is not None:
-            user: Optional[User] = get_object_or_404(User, id=user_id)
-            order_data["user"] = user
+    updates: int = Order.objects.filter(pk__in=ids).count() if ids else 0
+    return _import_report(
+        kind="orders",
+        total=len(orders_data),
+        errors=errors,
+        updates=updates,
+        validation_seconds=default_timer() - started_at,
+    )
 
-        order: Order = Order(**order_data)
-        order.save()
-        order.products.set(Product.objects.filter(id__in=product_id))
-        orders.append(order)
 
+def save_orders_data(
+    orders_data: List[Dict], task_id: Optional[str] = None
+) -> List[Order]:
+    """
+    Save orders to database in one transaction.
+
+    The progress is published every hundred orders when ``task_id`` is given.
+    """
+    started_at: float = default_timer()
+    orders = []
+    set_import_progress(task_id, 0, len(orders_data))
+    try:
+        with transaction.atomic():
+            for order_data in orders_data:
+                order_data = dict(order_data)
+                product_id: List[int] = order_data.pop("products", [])
+                user_id: Optional[List[int]] = order_data.pop("user", None)
+
+                if user_id is not None:
+                    user: Optional[User] = get_object_or_404(User, id=user_id)
+                    order_data["user"] = user
+
+                order: Order = Order(**order_data)
+                order.save()
+                order.products.set(Product.objects.filter(id__in=product_id))
+                orders.append(order)
+                if len(orders) % 100 == 0:
+                    set_import_progress(task_id, len(orders), len(orders_data))
+    except Exception:
+        set_import_progress(task_id, 0, len(orders_data), status="failed")
+        raise
+
+    set_import_progress(task_id, len(orders), len(orders_data), status="done")
+    record_import_throughput("orders", len(orders), default_timer() - started_at)
     return orders
+
+
+def save_json_orders(
+    json_file: IO[bytes], encoding: Optional[str], task_id: Optional[str] = None
+) -> List[Order]:
+    """Save orders from JSON file to database"""
+    return save_orders_data(load_json_orders(json_file, encoding), task_id=task_id)
+
+
+def iter_products_csv(
+    queryset: QuerySet[Product],
+    fields: Sequence[str],
+    copy: Optional[bool] = None,
+    chunk_size: int = 64 * 1024,
+) -> Iterator[bytes]:
+    """
+    Produce the CSV export of ``write_products_csv`` chunk by chunk.
+
+    The COPY output is spooled to a temporary file first since psycopg2 can
+    only push it into a file object, the ORM path is rendered row by row.
+
+    Yields:
+        bytes: Parts of the UTF-8 encoded CSV document.
+    """
+    if use_copy() if copy is None else copy:
+        with SpooledTemporaryFile(max_size=16 * 1024 * 1024) as spool:
+            write_products_csv(queryset, fields, spool, copy=True)
+            spool.seek(0)
+            yield from iter(lambda: spool.read(chunk_size), b"")
+        return
+
+    writer = csv_writer(Echo())
+    rows: List[str] = [writer.writerow(fields)]
+    for values in queryset.values_list(*fields).iterator(chunk_size=2000):
+        rows.append(writer.writerow(values))
+        if len(rows) >= 1000:
+            yield "".join(rows).encode()
+            rows = []
+    yield "".join(rows).encode()
+
+
+def invalidate_products(product_pks: Iterable[int]) -> None:
+    """
+    Invalidate the cached exports and fragments of bulk written products.
+
+    Bulk writes do not send ``post_save``, so every bulk path calls this
+    instead of the signal handlers.
+    """
+    bump_model_version_on_commit(Product)
+    invalidate_tags_on_commit(["product:{pk}".format(pk=pk) for pk in product_pks])
+
+
+def touch_product_orders(product_pks: Iterable[int]) -> None:
+    """
+    Move ``updated_at`` of the orders of the products.
+
+    The order exports only list the products that are not archived, so the
+    orders change when one of their products is archived, unarchived or
+    deleted.
+    """
+    Order.objects.filter(products__in=product_pks).update(updated_at=timezone.now())
+    bump_model_version_on_commit(Order)
+
+
+def prune_deleted_objects(before: datetime) -> int:
+    """Delete the tombstones older than the moment, return how many."""
+    return DeletedObject.objects.filter(deleted_at__lt=before).delete()[0]
+
+
+def deleted_since(model: Type[Model], since: datetime) -> List[int]:
+    """Return the primary keys of the objects of the model deleted after ``since``."""
+    return sorted(
+        set(
+            DeletedObject.objects.filter(
+                model_label=model._meta.label_lower, deleted_at__gt=since
+            ).values_list("object_pk", flat=True)
+        )
+    )
@@ -2,10 +2,7 @@
 Module that contains the views of the application Shopapp.
 """
 
-from csv import DictWriter
-
-from django.core.cache import cache
-from django.db.models import QuerySet, Model, Field, CharField, TextField
+from django.db.models import QuerySet, Model, Field, CharField, TextField, Prefetch
 from django.forms import ModelForm
 from django.shortcuts import render, redirect, reverse, get_object_or_404
 from django.http import HttpResponse, HttpRequest, HttpResponseRedirect, JsonResponse
@@ -17,9 +14,10 @@ from django.contrib.auth.mixins import (
 )
 from django.contrib.syndication.views import Feed
 from django.urls import reverse_lazy
+from django.utils.cache import patch_vary_headers
 from django.utils.decorators import method_decorator
+from django.utils.translation import get_language
 from django.views import View
-from django.views.decorators.cache import cache_page
 from django.views.generic import (
     ListView,
     DetailView,
@@ -28,6 +26,12 @@ from django.views.generic import (
     DeleteView,
 )
 
+from mysite.cache import (
+    cache_page_for,
+    get_model_version,
+    get_or_compute,
+    public_cache_control,
+)
 from shopapp.models import Product, Order, ProductImage
 from .forms import ProductForm, OrderForm, GroupForm
 from .serializers import ProductSerializer, OrderSerializer
@@ -41,15 +45,29 @@ from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.settings import api_settings
 
 from PIL import ImageFile
-from typing import List, Tuple, Dict, Any, TypeVar, Optional
+from typing import List, Tuple, Dict, Any, TypeVar, Optional, Iterable
 from timeit import default_timer
-from .utils import save_csv_products
+from hashlib import md5
+from datetime import datetime
+from .exports import (
+    CursorExpired,
+    accepts_gzip,
+    cursor_start,
+    export_response,
+    make_cursor,
+    negotiate_format,
+    parse_cursor,
+    render_csv,
+    render_json,
+    render_ndjson,
+)
+from .utils import save_csv_products, iter_products_csv, deleted_since
 
 import logging
 
-
 logger = logging.getLogger(__name__)
 DjangoFilters = TypeVar("DjangoFilters")
 
@@ -60,7 +78,9 @@ class OrderViewSet(ModelViewSet):
     Full CRUD for order entities.
     """
 
-    queryset: QuerySet[Order] = Order.objects.all()
+    queryset: QuerySet[Order] = Order.objects.select_related("user").prefetch_related(
+        Prefetch("products", queryset=Product.objects.select_related("created_by"))
+    )
     serializer_class: ModelSerializer = OrderSerializer
     filter_backends: List[DjangoFilters] = [
         SearchFilter,
@@ -109,7 +129,7 @@ class ProductViewSet(ModelViewSet):
     Полный CRUD для сущностей товара
     """
 
-    queryset: QuerySet = Product.objects.all()
+    queryset: QuerySet = Product.objects.select_related("created_by")
     serializer_class: ModelSerializer = ProductSerializer
     filter_backends: List[filter] = [
         SearchFilter,
@@ -139,9 +159,40 @@ class ProductViewSet(ModelViewSet):
         "discount",
     ]
 
-    @method_decorator(cache_page(60 * 2))
-    def list(self, *args, **kwargs):
-        return super().list(*args, **kwargs)
+    @method_decorator(
+        public_cache_control(
+            60,
+            stale_while_revalidate=60 * 2,
+            vary=("Accept-Language", "Cookie", "Authorization"),
+        )
+    )
+    @method_decorator(
+        cache_page_for(60 * 2, models=(Product,), media_types=("application/json",))
+    )
+    def list(self, request: Request, *args, **kwargs) -> Response:
+        """
+        List the products, cached for two minutes per page, filter and
+        language, and recomputed by a single request when expired.
+
+        The JSON pages are cached per audience on top of the data, both
+        until a product changes; the browsable API shows the user and is not.
+        Shared caches may keep the anonymous responses for a minute.
+        """
+        key: str = "products_list:{digest}".format(
+            digest=md5(
+                "{uri}|{language}|{version}".format(
+                    uri=request.build_absolute_uri(),
+                    language=get_language(),
+                    version=get_model_version(Product),
+                ).encode()
+            ).hexdigest()
+        )
+        data: Dict[str, Any] = get_or_compute(
+            key,
+            lambda: super(ProductViewSet, self).list(request, *args, **kwargs).data,
+            timeout=60 * 2,
+        )
+        return Response(data)
 
     @extend_schema(
         summary="Get one prodcut by ID",
@@ -158,9 +209,6 @@ class ProductViewSet(ModelViewSet):
     def download_csv(self, request: Request) -> HttpResponse:
         """Method for download csv file"""
 
-        response = HttpResponse(content_type="text/csv")
-        filename: str = "products-export.csv"
-        response["Content-Description"]: str = f"attachment; filename={filename}"
         queryset: QuerySet = self.filter_queryset(self.get_queryset())
         fields: List[str] = [
             "name",
@@ -168,19 +216,24 @@ class ProductViewSet(ModelViewSet):
             "price",
             "discount",
         ]
-        queryset = queryset.only(*fields)
-        writer = DictWriter(response, fieldnames=fields)
-        writer.writeheader()
-
-        for product in queryset:
-            writer.writerow({field: getattr(product, field) for field in fields})
-
-        return response
+        return export_response(
+            request=request,
+            name="products_csv",
+            export_format="csv",
+            version=get_model_version(Product),
+            chunks=lambda: iter_products_csv(queryset=queryset, fields=fields),
+            filename="products-export.csv",
+            query_params=[
+                api_settings.SEARCH_PARAM,
+                api_settings.ORDERING_PARAM,
+                *self.filterset_fields,
+            ],
+        )
 
     @action(methods=["POST"], detail=False, parser_classes=[MultiPartParser])
     def upload_csv(self, request: Request) -> Response:
         products = save_csv_products(
-            file=request.FILES["file"].file, encoding=request.encoding
+            csv_file=request.FILES["file"].file, encoding=request.encoding
         )
         serializer = self.get_serializer(products, many=True)
         return Response(data=serializer.data)
@@ -239,6 +292,7 @@ class ProductDetailsView(DetailView):
     context_object_name: str = "product"
 
 
+@method_decorator(cache_page_for(60 * 10, models=(Product,)), name="get")
 class ProductsListView(PermissionRequiredMixin, ListView):
     """
     Список товаров.
@@ -395,24 +449,98 @@ class UserDetailsView(DetailView):
 class ProductDataExportView(View):
     """
     Экспорт данных о товарах.
+
+    The format is negotiated through the Accept header (JSON by default,
+    NDJSON or CSV) and the response is gzip-compressed when the client
+    accepts it.
     """
 
-    def get(self, request: HttpRequest) -> JsonResponse:
-        cache_key: str = "products_data_export"
-        products_data: List[Dict[str, Any]] = cache.get(cache_key)
-        if products_data is None:
-            products: QuerySet[Product] = Product.objects.order_by("pk").all()
-            products_data: List[Dict[str, Any]] = [
-                {
-                    "pk": product.pk,
-                    "name": product.name,
-                    "price": product.price,
-                    "archived": product.archived,
-                }
-                for product in products
-            ]
-            cache.set("products_data_export", products_data, 300)
-        return JsonResponse({"products": products_data})
+    fields: List[str] = ["pk", "name", "price", "archived"]
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        if "since" in request.GET:
+            return self.get_delta(request)
+
+        export_format: Optional[str] = negotiate_format(
+            request, formats=("json", "ndjson", "csv"), default="json"
+        )
+        if export_format is None:
+            return HttpResponse(status=406)
+
+        if export_format == "json" and not accepts_gzip(request):
+            products_data: List[Dict[str, Any]] = get_or_compute(
+                "products_data_export", self.products_data, timeout=300
+            )
+            response: HttpResponse = JsonResponse({"products": products_data})
+            patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+            return response
+
+        def chunks() -> Iterable[bytes]:
+            rows = (
+                Product.objects.order_by("pk")
+                .values(*self.fields)
+                .iterator(chunk_size=2000)
+            )
+            if export_format == "ndjson":
+                return render_ndjson(rows)
+            if export_format == "csv":
+                return render_csv(rows, fields=self.fields)
+            return render_json(rows, root="products")
+
+        return export_response(
+            request=request,
+            name="products",
+            export_format=export_format,
+            version=get_model_version(Product),
+            chunks=chunks,
+        )
+
+    @staticmethod
+    def products_data() -> List[Dict[str, Any]]:
+        """Build the cached JSON export of all the products."""
+        products: QuerySet[Product] = Product.objects.order_by("pk").all()
+        return [
+            {
+                "pk": product.pk,
+                "name": product.name,
+                "price": product.price,
+                "archived": product.archived,
+            }
+            for product in products
+        ]
+
+    def get_delta(self, request: HttpRequest) -> JsonResponse:
+        """
+        Export only the products changed after the ``since`` cursor.
+
+        Created, updated and archived products are listed under "products",
+        deleted ones under "deleted", and "next_cursor" is the ``since`` value
+        of the next sync. An empty ``since`` starts with a full sync, which
+        cursors older than the retention of the deletions get a 410 for.
+        """
+        try:
+            since: Optional[datetime] = parse_cursor(request.GET["since"])
+        except CursorExpired:
+            return JsonResponse(
+                {"error": "Expired cursor, start a full sync with an empty since"},
+                status=410,
+            )
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+        next_cursor: str = make_cursor(cursor_start())
+
+        products: QuerySet[Product] = Product.objects.order_by("pk")
+        deleted: List[int] = []
+        if since is not None:
+            products = products.filter(updated_at__gt=since)
+            deleted = deleted_since(Product, since)
+        return JsonResponse(
+            {
+                "products": list(products.values(*self.fields, "updated_at")),
+                "deleted": deleted,
+                "next_cursor": next_cursor,
+            }
+        )
 
 
 class OrderDataExportView(UserPassesTestMixin, View):
@@ -424,22 +552,56 @@ class OrderDataExportView(UserPassesTestMixin, View):
         return self.request.user.is_staff
 
     def get(self, request: HttpRequest) -> JsonResponse | HttpResponse:
-        orders: QuerySet[Order] = Order.objects.order_by("pk").all()
-        orders_data: List[Dict[str, Any]] = [
+        """
+        Export all orders, or with ``since`` only the orders changed after
+        the cursor, together with the deleted ones and the next cursor.
+        """
+        orders: QuerySet[Order] = Order.objects.order_by("pk").prefetch_related(
+            Prefetch(
+                "products",
+                queryset=Product.objects.filter(archived=False).only("pk"),
+            )
+        )
+        if "since" not in request.GET:
+            return JsonResponse({"orders": self.orders_data(orders)})
+
+        try:
+            since: Optional[datetime] = parse_cursor(request.GET["since"])
+        except CursorExpired:
+            return JsonResponse(
+                {"error": "Expired cursor, start a full sync with an empty since"},
+                status=410,
+            )
+        except ValueError:
+            return JsonResponse({"error": "Invalid cursor"}, status=400)
+        next_cursor: str = make_cursor(cursor_start())
+
+        deleted: List[int] = []
+        if since is not None:
+            orders = orders.filter(updated_at__gt=since)
+            deleted = deleted_since(Order, since)
+        return JsonResponse(
+            {
+                "orders": self.orders_data(orders),
+                "deleted": deleted,
+                "next_cursor": next_cursor,
+            }
+        )
+
+    @staticmethod
+    def orders_data(orders: QuerySet[Order]) -> List[Dict[str, Any]]:
+        """Serialize the orders for the export."""
+        return [
             {
                 "pk": order.pk,
                 "delivery_address": order.delivery_address,
                 "promocode": order.promocode,
-                "user": order.user.pk,
-                "products": [
-                    product.pk for product in order.products.filter(archived=False)
-                ],
+                "user": order.user_id,
+                "products": [product.pk for product in order.products.all()],
             }
             for order in orders
         ]
 
-        return JsonResponse({"orders": orders_data})
-
 
 class LatestProductsFeed(Feed):
     """RSS feed for latest products."""
@@ -495,13 +657,26 @@ class UserOrderDataExportView(View):
 
     def get(self, request: HttpRequest, *args, **kwargs) -> JsonResponse:
         user_pk: int = self.kwargs["pk"]
-        cache_key: str = f"user_{user_pk}_orders_data_export"
-        cached_data_orders: List[Dict[str, Any]] = cache.get(cache_key)
-        if cached_data_orders is None:
-            user: User = get_object_or_404(User, pk=user_pk)
-            orders: QuerySet[Order] = Order.objects.filter(user=user).order_by("pk")
-            serializer: OrderSerializer = OrderSerializer(instance=orders, many=True)
-            cached_data_orders = serializer.data
-            cache.set(cache_key, cached_data_orders, 180)
-
+        cached_data_orders: List[Dict[str, Any]] = get_or_compute(
+            f"user_{user_pk}_orders_data_export",
+            lambda: self.orders_data(user_pk),
+            timeout=180,
+        )
         return JsonResponse({"Orders": cached_data_orders})
+
+    @staticmethod
+    def orders_data(user_pk: int) -> List[Dict[str, Any]]:
+        """Build the cached JSON export of the orders of a user."""
+        user: User = get_object_or_404(User, pk=user_pk)
+        orders: QuerySet[Order] = (
+            Order.objects.filter(user=user)
+            .order_by("pk")
+            .select_related("user")
+            .prefetch_related(
+                Prefetch(
+                    "products", queryset=Product.objects.select_related("created_by")
+                )
+            )
+        )
+        serializer: OrderSerializer = OrderSerializer(instance=orders, many=True)
+        return serializer.data